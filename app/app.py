@@ -2,15 +2,27 @@ import streamlit as st
 
 from app.page import (ConfigureExam, ConfigureMultipleChoice, PageEnum,
                       UploadFile)
+from src.jobs import get_job_manager
+from src.workspace import Workspace, cleanup_workspaces
 
 
-@st.cache_resource(ttl=60 * 60 * 24)
 def get_app():
     """
-    Create a new app instance if it doesn't exist yet
+    Create a new app instance for the browser session if it doesn't exist yet
     :return: App instance
     """
-    return App()
+    if "app" not in st.session_state:
+        cleanup_workspaces()
+        app = App()
+        # Resume following the job of the page before it was reloaded
+        job_id = st.query_params.get("job")
+        if job_id is not None and get_job_manager().get(job_id) is not None:
+            app.job_id = job_id
+            app.change_page(PageEnum.CONFIGURE_EXAM)
+        st.session_state["app"] = app
+    app = st.session_state["app"]
+    app.workspace.touch()
+    return app
 
 
 class App:
@@ -26,6 +38,7 @@ class App:
         }
 
         self.current_page = self.pages[PageEnum.UPLOAD_FILE]
+        self.workspace = Workspace()
         self.reset()
 
     def render(self):
@@ -79,6 +92,7 @@ class App:
         """
         Reset the app
         """
+        self.job_id = None
         self._open_questions = []
         self._mc_questions = []
         self._question_args = {
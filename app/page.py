@@ -1,10 +1,12 @@
+import time
 from abc import abstractmethod
 
 import streamlit as st
 
-from config.cfg import CONTENT_FILEPATH, OUTPUT_FOLDER
-from src.exams_api import generate_exams, get_open_questions
-from src.generate_document import exams2json, exams2pdf
+from config.cfg import JOB_POLL_INTERVAL
+from model.question import QuestionType
+from src.jobs import JobStatus, get_job_manager
+from src.pipeline import JSON_FILENAME, PDF_FILENAME
 
 
 class PageEnum:
@@ -33,9 +35,7 @@ class UploadFile(Page):
         )
         uploaded_file = st.file_uploader("Upload pdf file", type="pdf")
         if uploaded_file is not None:
-            with open(CONTENT_FILEPATH, "wb") as f:
-                f.write(uploaded_file.read())
-                f.close()
+            app.workspace.save_content(uploaded_file.read())
 
         if st.button("Configure Exam"):
             app.reset()
@@ -92,66 +92,127 @@ class ConfigureExam(Page):
             if st.button(
                 "Generate", help="Generate the questions according to the parameters"
             ):
+                # Questions are reused across exams when there aren't enough
                 if (
-                    not app.question_args["number_of_open_questions_exam"]
-                    * app.question_args["number_of_exams"]
-                    <= app.question_args["number_of_open_questions"]
+                    app.question_args["number_of_open_questions_exam"]
+                    > app.question_args["number_of_open_questions"]
                 ):
                     st.error(
-                        "The number of total questions shoud be bigger than number of questions per exam * number of exams"
+                        "The number of total questions shoud be bigger than number of questions per exam"
                     )
                 else:
-                    with st.spinner("Generating questions. This may take a while..."):
-                        try:
-                            # app.mc_questions = get_mc_questions(content,
-                            #            app.question_args['number_of_mc_questions'],
-                            #            app.question_args['number_of_answers'])
-                            app.open_questions = get_open_questions(
-                                app.question_args["number_of_open_questions"],
-                                app.question_args["number_of_variations"],
-                            )
-                        except Exception as ex:
-                            print(ex)
-                            st.error(
-                                "An error occurred while generating the questions. Please try again"
-                            )
-
-                    if len(app.open_questions) > 0:
-                        st.success(
-                            "The exams have been generated. You can download the questions as a PDF"
-                        )
-
-                        # Build exams
-                        exams = generate_exams(
-                            open_questions=app.open_questions,
-                            number_of_open=app.question_args[
-                                "number_of_open_questions_exam"
-                            ],
-                            number_of_exams=app.question_args["number_of_exams"],
-                        )
-
-                        # Generate output files
-                        output_filename = "exams.pdf"
-                        exams2pdf(exams, output_filename)
-                        json_filename = "exams.json"
-                        exams2json(exams, json_filename)
-
-                        st.download_button(
-                            "Download",
-                            data=open(
-                                OUTPUT_FOLDER + "/" + output_filename, "rb"
-                            ).read(),
-                            file_name=output_filename,
-                            mime="application/pdf",
-                            help="Download the exams as a PDF file",
-                        )
+                    # The questions are generated in the background, so the work
+                    # isn't lost if the page is reloaded
+                    app.job_id = get_job_manager().submit(
+                        {
+                            "filepath": app.workspace.content_filepath,
+                            "output_folder": app.workspace.output_folder,
+                            "question_args": dict(app.question_args),
+                        }
+                    )
+                    st.query_params["job"] = app.job_id
+
+            job_in_progress = False
+            if app.job_id is not None:
+                job_in_progress = self._render_job(app)
 
         with col2:
             if st.button("Configure another exam"):
+                app.workspace.clear_outputs()
                 app.reset()
+                st.query_params.clear()
                 app.change_page(PageEnum.UPLOAD_FILE)
                 st.rerun()
 
+        if job_in_progress:
+            # Poll the job until it finishes
+            time.sleep(JOB_POLL_INTERVAL)
+            st.rerun()
+
+    def _render_job(self, app) -> bool:
+        """
+        Render the status of the generation job of the app
+        :return: Whether the job is still in progress
+        """
+        job_manager = get_job_manager()
+        job = job_manager.get(app.job_id)
+        if job is None:
+            st.error(
+                "The generation could not be found. Please generate the exams again"
+            )
+            return False
+
+        if job["status"] in (JobStatus.PENDING, JobStatus.RUNNING):
+            done, total = job["progress_done"], job["progress_total"]
+            if total > 0:
+                st.progress(
+                    done / total,
+                    text=f"Generating questions: {done} of {total} chunks done, "
+                    f"{job['tokens']} tokens used",
+                )
+            else:
+                st.info("Generating questions. This may take a while...")
+            # Questions are shown as soon as each chunk is done
+            self._render_questions(job_manager.get_questions(app.job_id))
+            return True
+
+        if job["status"] == JobStatus.FAILED:
+            st.error(
+                "An error occurred while generating the questions. Please try again"
+            )
+            if job["error"]:
+                st.caption(f"Error: {job['error']}")
+            if st.button("Retry"):
+                job_manager.resume(app.job_id)
+                st.rerun()
+            return False
+
+        if job["status"] == JobStatus.INTERRUPTED:
+            st.warning("The generation was interrupted before it finished")
+            if st.button("Resume"):
+                job_manager.resume(app.job_id)
+                st.rerun()
+            return False
+
+        st.success(
+            "The exams have been generated. You can download the questions as a PDF"
+        )
+        # Streamlit reads the files, they are closed as soon as it has them
+        with open(job["result"]["pdf"], "rb") as file:
+            st.download_button(
+                "Download",
+                data=file,
+                file_name=PDF_FILENAME,
+                mime="application/pdf",
+                help="Download the exams as a PDF file",
+            )
+        with open(job["result"]["json"], "rb") as file:
+            st.download_button(
+                "Download JSON",
+                data=file,
+                file_name=JSON_FILENAME,
+                mime="application/json",
+                help="Download the exams with their answers as a JSON file",
+            )
+        with st.expander("Generated questions"):
+            self._render_questions(job_manager.get_questions(app.job_id))
+        return False
+
+    def _render_questions(self, questions):
+        """
+        Render a list of questions, with the answers of multiple choice ones
+        """
+        for number, question in enumerate(questions, start=1):
+            st.markdown(f"**{number}.** {question.question}")
+            if question.question_type == QuestionType.MULTIPLE_CHOICE:
+                answers = []
+                for i, answer in enumerate(question.answers):
+                    # Correct answers in bold
+                    if i in question.correct_answers:
+                        answer = f"**{answer}**"
+                    answers.append(f"- {answer}")
+                st.markdown("\n".join(answers))
+
 
 class ConfigureMultipleChoice(Page):
     def render(self, app):
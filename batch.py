@@ -0,0 +1,254 @@
+"""
+Generate exams for a batch of documents without the UI
+
+Usage: python batch.py "courses/*.pdf" --output output/batch --exams 3
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+from config.cfg import (MAX_CONCURRENT_REQUESTS, OUTPUT_FOLDER,
+                        REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+from src.agent import get_token_usage, set_request_limiter, set_scheduler
+from src.generate_document import set_render_in_process
+from src.loader import file_hash
+from src.pipeline import EXPORT_FILENAMES, TRACE_FILENAME, generate_exam_files
+from src.scheduler import LLMScheduler
+from src.telemetry import trace
+
+SUMMARY_FILENAME = "summary.json"
+
+
+def _input_root(pattern: str) -> str:
+    """
+    Folder a directory, glob pattern or file path of the inputs starts from
+    """
+    if os.path.isdir(pattern):
+        return pattern
+    parts = []
+    for part in pattern.split(os.sep):
+        if glob.has_magic(part):
+            return os.sep.join(parts) or os.curdir
+        parts.append(part)
+    return os.path.dirname(pattern) or os.curdir
+
+
+def _find_documents(inputs: List[str]) -> Dict[str, str]:
+    """
+    Expand directories and glob patterns into the pdf files they contain
+    :return: Name of the output folder of every document, sorted by path. It
+        is the path of the document relative to the input it was found in, so
+        documents with the same name in different folders don't share it
+    """
+    documents = {}
+    for pattern in inputs:
+        root = _input_root(pattern)
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*.pdf")
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isfile(path) and path not in documents:
+                documents[path] = os.path.splitext(os.path.relpath(path, root))[0]
+
+    # Different inputs can still have documents with the same relative path
+    names = {}
+    for path, name in documents.items():
+        names.setdefault(name, []).append(path)
+    for name, paths in names.items():
+        if len(paths) > 1:
+            for path in paths:
+                path_hash = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+                documents[path] = f"{name}_{path_hash[:8]}"
+    return dict(sorted(documents.items()))
+
+
+def _init_worker(request_limiter, workers: int):
+    set_request_limiter(request_limiter)
+    # Every worker processes a single document at a time
+    set_render_in_process(True)
+    # The rate limits are for the whole account, every worker gets its share
+    set_scheduler(
+        LLMScheduler(REQUESTS_PER_MINUTE / workers, TOKENS_PER_MINUTE / workers)
+    )
+
+
+def _process_document(
+    filepath: str, output_folder: str, question_args: dict, export_formats: List[str]
+) -> dict:
+    """
+    Generate the exams of a single document in a worker process
+    :return: Summary of the document
+    """
+    start = time.perf_counter()
+    usage_before = get_token_usage()
+    with trace(filepath) as document_trace:
+        result = generate_exam_files(
+            filepath, output_folder, question_args, export_formats=export_formats
+        )
+    usage = get_token_usage()
+    if document_trace is not None:
+        document_trace.save(os.path.join(output_folder, TRACE_FILENAME))
+        result["estimated_cost"] = document_trace.to_dict()["llm"]["cost"]
+    summary = {
+        "document": filepath,
+        "hash": file_hash(filepath),
+        "question_args": question_args,
+        "formats": export_formats,
+        "status": "done",
+        "seconds": round(time.perf_counter() - start, 2),
+        "prompt_tokens": usage["prompt_tokens"] - usage_before["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"]
+        - usage_before["completion_tokens"],
+        **result,
+    }
+    with open(os.path.join(output_folder, SUMMARY_FILENAME), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def _previous_summary(
+    filepath: str, output_folder: str, question_args: dict, export_formats: List[str]
+) -> dict:
+    """
+    Get the summary of a document already processed with the same arguments,
+    None if it must be processed
+    """
+    summary_filepath = os.path.join(output_folder, SUMMARY_FILENAME)
+    if not os.path.exists(summary_filepath):
+        return None
+    with open(summary_filepath) as f:
+        summary = json.load(f)
+    if (
+        summary.get("hash") != file_hash(filepath)
+        or summary.get("question_args") != question_args
+        or summary.get("formats") != export_formats
+    ):
+        return None
+    return {**summary, "status": "skipped"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "inputs", nargs="+", help="Directories or glob patterns of pdf files"
+    )
+    parser.add_argument("--output", default=os.path.join(OUTPUT_FOLDER, "batch"))
+    parser.add_argument("--open-questions", type=int, default=30)
+    parser.add_argument("--variations", type=int, default=0)
+    parser.add_argument("--open-questions-exam", type=int, default=6)
+    parser.add_argument("--mc-questions", type=int, default=0)
+    parser.add_argument("--answers", type=int, default=4)
+    parser.add_argument("--mc-questions-exam", type=int, default=0)
+    parser.add_argument("--exams", type=int, default=3)
+    parser.add_argument(
+        "--max-overlap",
+        type=int,
+        help="Questions any two exams can share, unlimited by default",
+    )
+    parser.add_argument(
+        "--seed", type=int, help="Seed to assemble the same exams again"
+    )
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        default=["json"],
+        choices=list(EXPORT_FILENAMES),
+        help="Formats written besides the PDF",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=2, help="Documents processed at the same time"
+    )
+    parser.add_argument(
+        "--max-concurrent-requests",
+        type=int,
+        default=MAX_CONCURRENT_REQUESTS,
+        help="LLM requests sent at the same time by all the workers together",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Process documents already done again"
+    )
+    args = parser.parse_args()
+
+    question_args = {
+        "number_of_open_questions": args.open_questions,
+        "number_of_variations": args.variations,
+        "number_of_open_questions_exam": args.open_questions_exam,
+        "number_of_mc_questions": args.mc_questions,
+        "number_of_answers": args.answers,
+        "number_of_mc_questions_exam": args.mc_questions_exam,
+        "number_of_exams": args.exams,
+        "max_overlap": args.max_overlap,
+        "seed": args.seed,
+    }
+    documents = _find_documents(args.inputs)
+    print(f"Found {len(documents)} documents")
+
+    summaries = []
+    pending = []
+    for filepath, name in documents.items():
+        output_folder = os.path.join(args.output, name)
+        summary = (
+            None
+            if args.force
+            else _previous_summary(filepath, output_folder, question_args, args.formats)
+        )
+        if summary is not None:
+            print(f"skipped: {filepath} is already done")
+            summaries.append(summary)
+        else:
+            pending.append((filepath, output_folder))
+
+    start = time.perf_counter()
+    with multiprocessing.Manager() as manager:
+        request_limiter = manager.BoundedSemaphore(args.max_concurrent_requests)
+        with ProcessPoolExecutor(
+            max_workers=max(1, args.workers),
+            initializer=_init_worker,
+            initargs=(request_limiter, max(1, args.workers)),
+        ) as pool:
+            futures = {
+                pool.submit(
+                    _process_document,
+                    filepath,
+                    output_folder,
+                    question_args,
+                    args.formats,
+                ): filepath
+                for filepath, output_folder in pending
+            }
+            for future in as_completed(futures):
+                try:
+                    summary = future.result()
+                except Exception as ex:
+                    summary = {
+                        "document": futures[future],
+                        "status": "failed",
+                        "error": str(ex),
+                    }
+                summaries.append(summary)
+                print(
+                    f"{summary['status']}: {summary['document']} "
+                    f"{summary.get('seconds', '-')}s "
+                    f"{summary.get('prompt_tokens', 0) + summary.get('completion_tokens', 0)} tokens"
+                )
+
+    summaries.sort(key=lambda summary: summary["document"])
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, SUMMARY_FILENAME), "w") as f:
+        json.dump(
+            {"seconds": round(time.perf_counter() - start, 2), "documents": summaries},
+            f,
+            indent=2,
+        )
+    failed = sum(summary["status"] == "failed" for summary in summaries)
+    print(f"Done: {len(summaries) - failed} documents ready, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+    Parsing of multiple choice responses over synthetic fixtures, counting the
+    questions lost and the responses that would make the generation ask
+    another chunk, with the parser removed from src.exams_api as a baseline
+
+    Every line of the fixtures has the response, the kind of request, function
+    or text, its source and the questions expected from it. The synthetic
+    responses are written by hand, two for each format the parser handles, so
+    they catch regressions on known formats. The held out ones are formats the
+    parser was not written around, as trailing remarks, explanations or an
+    answers section at the end, and are reported apart. None are recorded
+    from a model, so neither measures the parse rate of real responses
+
+    Results are saved in benchmarks/results and compared with the previous run,
+    or with --baseline, to spot regressions
+
+    Usage: python -m benchmarks.mc_parsing
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import re
+import sys
+import time
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+CORPUS_FILEPATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "mc_responses.jsonl"
+)
+
+# Metrics where a higher value is a regression
+LOWER_IS_BETTER = ("discarded_questions", "regenerations")
+
+
+def _key(question: dict) -> tuple:
+    from src.utils import normalize_text
+
+    return (
+        normalize_text(question["question"]),
+        tuple(normalize_text(answer) for answer in question["answers"]),
+        tuple(question["correct_answers"]),
+    )
+
+
+def _legacy_parse(response: str, number_of_answers: int):
+    """
+    Parser of the text responses used before the function call, kept as it was
+    to compare with: a question per block of lines, its first line is the
+    question and the rest are choices, the correct ones marked with Correct:
+    """
+    from model.question import Question, QuestionType
+    from src.parsing import MCParseResult
+
+    result = MCParseResult(method="text")
+    for question_text in response.split("\n\n"):
+        question_text = question_text.strip()
+        if not question_text:
+            continue
+        question_lines = question_text.splitlines()
+        question = re.sub(r"[0-9]+.", " ", question_lines[0], count=1)
+        answers = [
+            re.sub(r"[a-eA-E][).]", " ", line, count=1) for line in question_lines[1:]
+        ]
+        correct_answers = [
+            index for index, answer in enumerate(answers) if "Correct:" in answer
+        ]
+        if len(correct_answers) == 0:
+            result.discarded += 1
+            continue
+        answers = [answer.replace("Correct:", "").strip() for answer in answers]
+        result.questions.append(
+            Question(
+                len(result.questions),
+                question,
+                QuestionType.MULTIPLE_CHOICE,
+                answers=answers,
+                correct_answers=correct_answers,
+            )
+        )
+    return result
+
+
+def _evaluate(records: list, repeat: int, parse=None) -> dict:
+    """
+    Parse every response of the fixtures
+    :param parse: Parser of a response, parse_mc_response by default
+    :return: Totals of the fixtures and of each format
+    """
+    if parse is None:
+        from src.parsing import parse_mc_response as parse
+
+    totals = {}
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [
+            parse(record["response"], record["number_of_answers"]) for record in records
+        ]
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    for record, result in zip(records, results):
+        expected = {_key(question) for question in record["expected"]}
+        correct = sum(
+            _key(question.to_dict()) in expected for question in result.questions
+        )
+        names = (
+            "all",
+            f"source:{record.get('source', 'synthetic')}",
+            f"{record['kind']}:{record['format']}",
+        )
+        for name in names:
+            values = totals.setdefault(
+                name,
+                {
+                    "responses": 0,
+                    "expected_questions": 0,
+                    "parsed_questions": 0,
+                    "correct_questions": 0,
+                    "discarded_questions": 0,
+                    "regenerations": 0,
+                },
+            )
+            values["responses"] += 1
+            values["expected_questions"] += len(expected)
+            values["parsed_questions"] += len(result.questions)
+            values["correct_questions"] += correct
+            values["discarded_questions"] += result.discarded
+            # The generation asks another chunk for the questions missing
+            values["regenerations"] += correct < record["number_of_questions"]
+
+    for values in totals.values():
+        values["parse_rate"] = values["correct_questions"] / max(
+            1, values["expected_questions"]
+        )
+    totals["all"]["microseconds_per_response"] = best / len(records) * 1_000_000
+    return totals
+
+
+def _compare(results: dict, baseline: dict) -> int:
+    """
+    Print the metrics of a run next to the ones of a baseline
+    :return: Number of metrics worse than the baseline
+    """
+    current, previous = results["totals"]["all"], baseline["totals"]["all"]
+    regressions = 0
+    print(f"\nCompared with {baseline['created']}:")
+    for name in ("parse_rate",) + LOWER_IS_BETTER:
+        if name not in previous:
+            continue
+        change = current[name] - previous[name]
+        regression = change > 0 if name in LOWER_IS_BETTER else change < 0
+        regressions += regression
+        print(
+            f"{name:<25} {previous[name]:9.3f} -> {current[name]:9.3f}"
+            f"{'  REGRESSION' if regression else ''}"
+        )
+    return regressions
+
+
+def _print_totals(totals: dict):
+    for name, values in sorted(totals.items()):
+        print(
+            f"{name:<35} {values['correct_questions']:4d}/"
+            f"{values['expected_questions']:<4d} questions, "
+            f"{values['discarded_questions']:3d} discarded, "
+            f"{values['regenerations']:3d} regenerations"
+        )
+
+
+def _latest_results() -> str:
+    filepaths = sorted(glob.glob(os.path.join(RESULTS_FOLDER, "mc_parsing-*.json")))
+    return filepaths[-1] if filepaths else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--corpus", default=CORPUS_FILEPATH, help="Fixtures of responses, in JSON lines"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=20,
+        help="Parses of the corpus, the fastest is kept",
+    )
+    parser.add_argument(
+        "--baseline", help="Results to compare with, the latest run by default"
+    )
+    args = parser.parse_args()
+    baseline_filepath = args.baseline or _latest_results()
+
+    with open(args.corpus) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    totals = _evaluate(records, args.repeat)
+    _print_totals(totals)
+    # The old parser only received text responses
+    text_records = [record for record in records if record["kind"] == "text"]
+    legacy_totals = _evaluate(text_records, args.repeat, _legacy_parse)
+    text_totals = _evaluate(text_records, args.repeat)
+    print("\nText responses, removed parser -> current parser:")
+    for name in ("correct_questions", "discarded_questions", "regenerations"):
+        print(
+            f"{name:<25} {legacy_totals['all'][name]:9d} -> "
+            f"{text_totals['all'][name]:9d}"
+        )
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "totals": totals,
+        "legacy_text_totals": legacy_totals,
+    }
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    filepath = os.path.join(
+        RESULTS_FOLDER, f"mc_parsing-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    with open(filepath, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {filepath}")
+
+    if baseline_filepath is not None:
+        with open(baseline_filepath) as file:
+            if _compare(results, json.load(file)) > 0:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
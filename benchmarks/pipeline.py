@@ -0,0 +1,281 @@
+"""
+    End to end throughput and latency of the question generation and the exam
+    outputs, using the fake chat model over synthetic documents of increasing size
+
+    Results are saved in benchmarks/results and compared with the previous run,
+    or with --baseline, to spot regressions
+
+    Usage: python -m benchmarks.pipeline --pages 2 8 32
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+WORDS_PER_PAGE = 450
+_VOCABULARY = (
+    "cell membrane protein enzyme energy light water carbon oxygen sugar leaf "
+    "root stem plant animal tissue organ system process reaction molecule atom "
+    "structure function growth division nucleus gene evidence theory model "
+    "experiment result cycle balance transport signal response environment"
+).split()
+
+
+def _synthetic_markdown(pages: int, seed: int = 0) -> str:
+    """
+    Text of a made up course, about WORDS_PER_PAGE words for each page
+    """
+    rng = random.Random(seed)
+    sections = []
+    for page in range(pages):
+        paragraphs = []
+        for _ in range(WORDS_PER_PAGE // 75):
+            sentences = [
+                " ".join(rng.choices(_VOCABULARY, k=15)).capitalize() + "."
+                for _ in range(5)
+            ]
+            paragraphs.append(" ".join(sentences))
+        sections.append(f"# Section {page + 1}\n\n" + "\n\n".join(paragraphs))
+    return "\n\n".join(sections)
+
+
+# Timings shorter than this are too noisy to be reported as regressions
+MIN_COMPARED_SECONDS = 0.01
+
+
+def _timed(func, *args, repeat: int = 1, **kwargs):
+    """
+    Run a function and measure it
+    :param repeat: Number of runs, the fastest one is reported
+    :return: Result of the function and seconds it took
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return result, best
+
+
+def _benchmark_document(filepath: str, args) -> dict:
+    """
+    Run every stage over a document
+    :return: Metrics of each stage
+    """
+    from src.agent import track_token_usage
+    from src.exams_api import (generate_exams, get_mc_questions, get_questions,
+                               iter_open_questions)
+    from src.generate_document import exams2json, exams2pdf
+    from src.loader import count_pages, load_chunks
+
+    chunks, load_seconds = _timed(load_chunks, filepath)
+    pages = count_pages(filepath)
+    results = {
+        "pages": pages,
+        "chunks": len(chunks),
+        "document_tokens": sum(chunk.tokens for chunk in chunks),
+        "load_and_split": {"seconds": load_seconds},
+    }
+
+    number_of_open = args.questions_per_page * pages
+    open_questions = []
+    first_seconds = None
+    start = time.perf_counter()
+    with track_token_usage() as usage:
+        for partial in iter_open_questions(number_of_open, filepath=filepath):
+            if first_seconds is None:
+                first_seconds = time.perf_counter() - start
+            open_questions += partial
+    seconds = time.perf_counter() - start
+    results["get_open_questions"] = {
+        "seconds": seconds,
+        "first_questions_seconds": first_seconds,
+        "questions": len(open_questions),
+        "questions_per_second": len(open_questions) / seconds,
+        "tokens": sum(usage.values()),
+    }
+
+    number_of_mc = args.mc_questions_per_page * pages
+    with track_token_usage() as usage:
+        mc_questions, seconds = _timed(
+            get_mc_questions,
+            number_of_mc,
+            args.answers,
+            filepath=filepath,
+            max_attempts=len(chunks) * 2,
+        )
+    results["get_mc_questions"] = {
+        "seconds": seconds,
+        "questions": len(mc_questions),
+        "questions_per_second": len(mc_questions) / seconds,
+        "tokens": sum(usage.values()),
+    }
+
+    # The same questions generated together, one request per chunk
+    with track_token_usage() as usage:
+        (mixed_open, mixed_mc), seconds = _timed(
+            get_questions, number_of_open, number_of_mc, args.answers, filepath=filepath
+        )
+    results["get_questions"] = {
+        "seconds": seconds,
+        "questions": len(mixed_open) + len(mixed_mc),
+        "questions_per_second": (len(mixed_open) + len(mixed_mc)) / seconds,
+        "tokens": sum(usage.values()),
+        "prompt_tokens": usage["prompt_tokens"],
+    }
+
+    number_of_exams = max(1, min(args.exams, len(open_questions), len(mc_questions)))
+    exams, seconds = _timed(
+        generate_exams,
+        repeat=args.repeat,
+        open_questions=open_questions,
+        number_of_open=len(open_questions) // number_of_exams,
+        number_of_exams=number_of_exams,
+        mc_questions=mc_questions,
+        number_of_mc=len(mc_questions) // number_of_exams,
+    )
+    results["generate_exams"] = {
+        "seconds": seconds,
+        "exams": number_of_exams,
+        "exams_per_second": number_of_exams / seconds,
+    }
+
+    with tempfile.TemporaryDirectory() as output_folder:
+        for stage, func, output_file in (
+            ("exams2pdf", exams2pdf, "exams.pdf"),
+            ("exams2json", exams2json, "exams.json"),
+        ):
+            _, seconds = _timed(
+                func, exams, output_file, output_folder, repeat=args.repeat
+            )
+            results[stage] = {
+                "seconds": seconds,
+                "exams_per_second": number_of_exams / seconds,
+            }
+    return results
+
+
+def _flatten(results: dict) -> dict:
+    """
+    Metrics of a run keyed by document size, stage and metric
+    """
+    metrics = {}
+    for document in results["documents"]:
+        for stage, values in document.items():
+            if isinstance(values, dict):
+                for name, value in values.items():
+                    if value is not None:
+                        metrics[f"{document['pages']}p {stage} {name}"] = value
+    return metrics
+
+
+def _compare(results: dict, baseline: dict, tolerance: float) -> int:
+    """
+    Print the timings of a run next to the ones of a baseline
+    :return: Number of timings slower than the baseline by more than tolerance
+    """
+    current, previous = _flatten(results), _flatten(baseline)
+    regressions = 0
+    print(f"\nCompared with {baseline['created']}:")
+    for name, value in current.items():
+        if not name.endswith("seconds") or name not in previous:
+            continue
+        change = (value - previous[name]) / previous[name] if previous[name] else 0
+        regression = (
+            change > tolerance and value - previous[name] > MIN_COMPARED_SECONDS
+        )
+        regressions += regression
+        print(
+            f"{name:<45} {previous[name]:9.3f}s -> {value:9.3f}s "
+            f"{change:+7.1%}{'  REGRESSION' if regression else ''}"
+        )
+    return regressions
+
+
+def _latest_results() -> str:
+    filepaths = sorted(glob.glob(os.path.join(RESULTS_FOLDER, "pipeline-*.json")))
+    return filepaths[-1] if filepaths else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, nargs="+", default=[2, 8, 32])
+    parser.add_argument("--questions-per-page", type=int, default=3)
+    parser.add_argument("--mc-questions-per-page", type=int, default=1)
+    parser.add_argument("--answers", type=int, default=4)
+    parser.add_argument("--exams", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs of the stages that don't call the LLM, the fastest is kept",
+    )
+    parser.add_argument(
+        "--baseline", help="Results to compare with, the latest run by default"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Slowdown reported as a regression, 0.2 is 20%%",
+    )
+    args = parser.parse_args()
+    baseline_filepath = args.baseline or _latest_results()
+
+    # Configure the fake model before the modules that create it are imported
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = str(args.latency)
+    os.environ["FAKE_LLM_JITTER"] = str(args.jitter)
+    os.environ["FAKE_LLM_ERROR_RATE"] = str(args.error_rate)
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    os.environ["QUESTION_STORE_ENABLED"] = "false"
+
+    with tempfile.TemporaryDirectory() as folder:
+        # Work in an empty folder, so no document cache from a previous run is used
+        os.chdir(folder)
+        from src.generate_document import _markdown_to_pdf
+
+        documents = []
+        for pages in args.pages:
+            filepath = os.path.join(folder, f"document_{pages}.pdf")
+            _markdown_to_pdf(_synthetic_markdown(pages), filepath)
+            try:
+                documents.append(_benchmark_document(filepath, args))
+            except Exception as ex:
+                # With a high error rate every request for a document can fail
+                documents.append({"pages": pages, "error": str(ex)})
+            print(json.dumps(documents[-1], indent=2))
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "documents": documents,
+    }
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    filepath = os.path.join(
+        RESULTS_FOLDER, f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    with open(filepath, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {filepath}")
+
+    if baseline_filepath is not None:
+        with open(baseline_filepath) as file:
+            if _compare(results, json.load(file), args.tolerance) > 0:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
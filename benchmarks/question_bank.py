@@ -0,0 +1,107 @@
+"""
+    Memory, save and load time of a QuestionBank against a list of questions
+    saved as JSON
+
+    Usage: python -m benchmarks.question_bank --questions 50000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from model.question import Question, QuestionType
+from model.question_bank import QuestionBank
+
+
+def _synthetic_questions(number_of_questions: int, variations: int, answers: int):
+    questions = []
+    for i in range(number_of_questions):
+        if i % 2:
+            questions.append(
+                Question(
+                    i,
+                    f"Question {i} about the course?",
+                    QuestionType.OPEN,
+                    variations=[
+                        f"Variation {j} of question {i}?" for j in range(variations)
+                    ],
+                    chunk=i % 50,
+                )
+            )
+        else:
+            questions.append(
+                Question(
+                    i,
+                    f"Multiple choice question {i} about the course?",
+                    QuestionType.MULTIPLE_CHOICE,
+                    answers=[f"Answer {j} of question {i}" for j in range(answers)],
+                    correct_answers=[i % answers],
+                    chunk=i % 50,
+                )
+            )
+    return questions
+
+
+def _measure(func):
+    """
+    :return: Result of the function, seconds it took and bytes it allocated
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, seconds, allocated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--questions", type=int, default=50000)
+    parser.add_argument("--variations", type=int, default=3)
+    parser.add_argument("--answers", type=int, default=4)
+    args = parser.parse_args()
+
+    build = lambda: _synthetic_questions(args.questions, args.variations, args.answers)
+    questions, _, list_bytes = _measure(build)
+    bank, _, bank_bytes = _measure(lambda: QuestionBank.from_questions(build()))
+    print(
+        f"memory  list: {list_bytes / 2**20:7.1f}MB  bank: {bank_bytes / 2**20:7.1f}MB"
+    )
+
+    with tempfile.TemporaryDirectory() as folder:
+        json_filepath = os.path.join(folder, "questions.json")
+        bank_filepath = os.path.join(folder, "questions.npz")
+
+        def save_json():
+            with open(json_filepath, "w") as f:
+                json.dump([question.to_dict() for question in questions], f)
+
+        def load_json():
+            with open(json_filepath) as f:
+                return [Question.from_dict(data) for data in json.load(f)]
+
+        _, json_save, _ = _measure(save_json)
+        _, json_load, _ = _measure(load_json)
+        _, bank_save, _ = _measure(lambda: bank.save(bank_filepath))
+        _, bank_load, _ = _measure(lambda: QuestionBank.load(bank_filepath))
+        print(
+            f"save    json: {json_save:7.3f}s   bank: {bank_save:7.3f}s\n"
+            f"load    json: {json_load:7.3f}s   bank: {bank_load:7.3f}s\n"
+            f"size    json: {os.path.getsize(json_filepath) / 2**20:7.1f}MB  "
+            f"bank: {os.path.getsize(bank_filepath) / 2**20:7.1f}MB"
+        )
+
+    ids = [question.id for question in questions[:: max(1, len(questions) // 1000)]]
+    _, lookup, _ = _measure(lambda: [bank.get(id) for id in ids])
+    _, sliced, _ = _measure(lambda: [bank[i : i + 10] for i in range(1000)])
+    print(
+        f"lookup  {lookup / len(ids) * 1e6:7.1f}us per question\n"
+        f"slice   {sliced / 1000 * 1e6:7.1f}us per 10 questions"
+    )
+
+
+if __name__ == "__main__":
+    main()
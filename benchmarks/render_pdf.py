@@ -0,0 +1,54 @@
+"""
+    Throughput of the PDF rendering pool against one mdpdf process per file
+
+    Usage: python -m benchmarks.render_pdf --exams 200
+"""
+import argparse
+import tempfile
+import time
+
+from model.question import Question, QuestionType
+from src.generate_document import (_generate_exam_markdown, _get_render_pool,
+                                   _markdown_to_pdf_cli, exams2pdf)
+
+
+def _synthetic_exams(number_of_exams: int, number_of_questions: int):
+    return {
+        f"exam_{i+1}": [
+            Question(
+                j, f"Question {j} of exam {i+1} about the course?", QuestionType.OPEN
+            )
+            for j in range(number_of_questions)
+        ]
+        for i in range(number_of_exams)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--exams", type=int, default=100)
+    parser.add_argument("--questions", type=int, default=6)
+    args = parser.parse_args()
+
+    exams = _synthetic_exams(args.exams, args.questions)
+    with tempfile.TemporaryDirectory() as output_folder:
+        start = time.perf_counter()
+        for i, exam in enumerate(exams):
+            _markdown_to_pdf_cli(
+                _generate_exam_markdown(f"Exam {i+1}", exams[exam]),
+                f"{output_folder}/cli_{exam}.pdf",
+            )
+        cli_seconds = time.perf_counter() - start
+
+        # Start the workers before measuring, as the app keeps them alive
+        _get_render_pool().submit(int).result()
+        start = time.perf_counter()
+        exams2pdf(exams, "pool.pdf", output_folder, merge=False)
+        pool_seconds = time.perf_counter() - start
+
+    print(f"subprocess: {cli_seconds:.2f}s ({args.exams / cli_seconds:.1f} exams/s)")
+    print(f"pool:       {pool_seconds:.2f}s ({args.exams / pool_seconds:.1f} exams/s)")
+
+
+if __name__ == "__main__":
+    main()
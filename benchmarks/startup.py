@@ -0,0 +1,164 @@
+"""
+    Import time of the entry points, which every cold start pays before doing
+    anything, measured in new interpreters
+
+    Results are saved in benchmarks/results and compared with the previous run,
+    or with --baseline, to spot regressions
+
+    Usage: python -m benchmarks.startup --repeat 5
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry points: the app, the HTTP API and the batch command
+MODULES = ("main", "src.api", "batch")
+
+# Libraries that should only be imported once a document is processed
+DEFERRED_MODULES = ("langchain", "openai", "tiktoken", "pypdf", "numpy")
+
+# Timings shorter than this are too noisy to be reported as regressions
+MIN_COMPARED_SECONDS = 0.05
+
+
+def _import_times(module: str) -> dict:
+    """
+    Import a module in a new interpreter
+    :return: Seconds of the import and seconds of the largest import of each
+        top level package
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_FOLDER,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    seconds = 0.0
+    packages = {}
+    for line in output.splitlines():
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        cumulative = int(fields[1]) / 1_000_000
+        name = fields[2].strip()
+        if name == module:
+            seconds = cumulative
+        # The largest import of a package includes the nested ones
+        package = name.split(".")[0]
+        packages[package] = max(packages.get(package, 0.0), cumulative)
+    return {"seconds": seconds, "packages": packages}
+
+
+def _measure(module: str, repeat: int) -> dict:
+    """
+    Import a module repeat times and keep the fastest, the slowest ones are
+    slowed down by a cold file system cache
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        times = _import_times(module)
+        times["process_seconds"] = time.perf_counter() - start
+        if best is None or times["process_seconds"] < best["process_seconds"]:
+            best = times
+    slowest = sorted(best.pop("packages").items(), key=lambda item: -item[1])
+    best["slowest_packages"] = dict(slowest[:10])
+    best["deferred_loaded"] = sorted(
+        package for package, _ in slowest if package in DEFERRED_MODULES
+    )
+    return best
+
+
+def _compare(results: dict, baseline: dict, tolerance: float) -> int:
+    """
+    Print the timings of a run next to the ones of a baseline
+    :return: Number of timings slower than the baseline by more than tolerance
+    """
+    regressions = 0
+    print(f"\nCompared with {baseline['created']}:")
+    for module, values in results["modules"].items():
+        previous = baseline["modules"].get(module)
+        if previous is None:
+            continue
+        for name in ("seconds", "process_seconds"):
+            change = (values[name] - previous[name]) / previous[name]
+            regression = (
+                change > tolerance
+                and values[name] - previous[name] > MIN_COMPARED_SECONDS
+            )
+            regressions += regression
+            print(
+                f"{module + ' ' + name:<30} {previous[name]:7.3f}s -> "
+                f"{values[name]:7.3f}s {change:+7.1%}"
+                f"{'  REGRESSION' if regression else ''}"
+            )
+    return regressions
+
+
+def _latest_results() -> str:
+    filepaths = sorted(glob.glob(os.path.join(RESULTS_FOLDER, "startup-*.json")))
+    return filepaths[-1] if filepaths else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modules", nargs="+", default=list(MODULES))
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Imports of each module, the fastest is kept",
+    )
+    parser.add_argument(
+        "--baseline", help="Results to compare with, the latest run by default"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Slowdown reported as a regression, 0.2 is 20%%",
+    )
+    args = parser.parse_args()
+    baseline_filepath = args.baseline or _latest_results()
+
+    modules = {}
+    for module in args.modules:
+        modules[module] = _measure(module, args.repeat)
+        print(f"{module}: {json.dumps(modules[module], indent=2)}")
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "modules": modules,
+    }
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    filepath = os.path.join(
+        RESULTS_FOLDER, f"startup-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    with open(filepath, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {filepath}")
+
+    failed = False
+    if modules.get("main", {}).get("deferred_loaded"):
+        print(f"The app imports {modules['main']['deferred_loaded']} on startup")
+        failed = True
+    if baseline_filepath is not None:
+        with open(baseline_filepath) as file:
+            failed |= _compare(results, json.load(file), args.tolerance) > 0
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import json
 import os
 
 from dotenv import load_dotenv
@@ -8,8 +9,134 @@ MODEL = os.getenv("MODEL", "gpt-3.5-turbo")
 
 OPENAI_ORG = os.getenv("ORGANIZATION_ID")
 OPENAI_TOKEN = os.getenv("OPENAI_API_KEY")
+# Base URL of an OpenAI compatible server, like a local fake LLM server for tests
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
+
+# Chat model used: "openai", "local" for an OpenAI compatible server running
+# offline at LOCAL_LLM_API_BASE, like llama.cpp or src.local_llm_server, or
+# "fake" for the deterministic stand-in of src.fake_llm with its simulated
+# latency in seconds, jitter and error rate
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+LOCAL_LLM_API_BASE = os.getenv("LOCAL_LLM_API_BASE", "http://localhost:8080/v1")
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "local")
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))
+FAKE_LLM_JITTER = float(os.getenv("FAKE_LLM_JITTER", "0.2"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "0"))
+# Seconds to wait for the response of a request
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
 
 DATA_FOLDER = "data"
 CONTENT_FILENAME = "content.pdf"
 CONTENT_FILEPATH = os.path.join(DATA_FOLDER, CONTENT_FILENAME)
 OUTPUT_FOLDER = "output"
+
+# Maximum number of LLM requests sent in parallel while generating questions
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "4"))
+
+# Tasks the LLM is used for: generating open and multiple choice questions,
+# rephrasing them, parsing responses and clarifying answers. Each task can use
+# its own provider and model, with its own limit of requests in flight and
+# timeout, for example LLM_PARSE_PROVIDER=local or LLM_CLARIFY_MODEL=gpt-4
+LLM_TASKS = ("generate", "mc", "variations", "parse", "clarify")
+LLM_TASK_SETTINGS = {
+    task: {
+        "provider": os.getenv(f"LLM_{task.upper()}_PROVIDER", LLM_PROVIDER),
+        "model": os.getenv(f"LLM_{task.upper()}_MODEL"),
+        "max_concurrent": int(
+            os.getenv(
+                f"LLM_{task.upper()}_MAX_CONCURRENT", str(MAX_CONCURRENT_REQUESTS)
+            )
+        ),
+        "timeout": float(os.getenv(f"LLM_{task.upper()}_TIMEOUT", str(LLM_TIMEOUT))),
+    }
+    for task in LLM_TASKS
+}
+
+# Rate limits of the OpenAI account, 0 disables them, and retries of the
+# requests that fail, waiting up to LLM_RETRY_MAX_DELAY seconds between them.
+# The completion of a request is assumed to use ESTIMATED_COMPLETION_TOKENS
+# until its usage is known
+REQUESTS_PER_MINUTE = float(os.getenv("REQUESTS_PER_MINUTE", "3500"))
+TOKENS_PER_MINUTE = float(os.getenv("TOKENS_PER_MINUTE", "90000"))
+ESTIMATED_COMPLETION_TOKENS = int(os.getenv("ESTIMATED_COMPLETION_TOKENS", "500"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "6"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "60"))
+
+# Number of open questions rephrased together in a single variations request
+VARIATIONS_BATCH_SIZE = int(os.getenv("VARIATIONS_BATCH_SIZE", "10"))
+
+# On-disk cache of LLM responses, safe to reuse because the model runs with temperature=0
+CACHE_FOLDER = os.path.join(DATA_FOLDER, "cache")
+LLM_CACHE_FILEPATH = os.path.join(CACHE_FOLDER, "llm_cache.sqlite3")
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(60 * 60 * 24 * 7)))
+
+# Questions generated for every document, reused when the same document is
+# uploaded again so only the missing questions are generated
+QUESTION_STORE_FILEPATH = os.path.join(DATA_FOLDER, "questions.sqlite3")
+QUESTION_STORE_ENABLED = os.getenv("QUESTION_STORE_ENABLED", "true").lower() == "true"
+
+# Document ingestion: chunk size in tokens and cache of parsed documents
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "3500"))
+INGESTION_CACHE_FOLDER = os.path.join(CACHE_FOLDER, "documents")
+# Size of the cache of parsed documents, the least recently used ones are
+# removed when it grows over it
+INGESTION_CACHE_MAX_BYTES = int(
+    os.getenv("INGESTION_CACHE_MAX_BYTES", str(500 * 1024 * 1024))
+)
+
+# Question planning: how many questions are asked for in a single request and
+# chunks too small to ask questions about
+MAX_QUESTIONS_PER_CALL = int(os.getenv("MAX_QUESTIONS_PER_CALL", "10"))
+MIN_CHUNK_TOKENS = int(os.getenv("MIN_CHUNK_TOKENS", "50"))
+# Rounds of generation used to make up for questions the LLM didn't return
+MAX_PLAN_ROUNDS = int(os.getenv("MAX_PLAN_ROUNDS", "3"))
+
+# Budget of a multiple choice generation run, partial results are returned when exhausted
+MC_MAX_ATTEMPTS = int(os.getenv("MC_MAX_ATTEMPTS", "10"))
+MC_MAX_TOKENS = int(os.getenv("MC_MAX_TOKENS", "100000"))
+# Send the multiple choice responses that can't be fully parsed to the "parse"
+# task to extract their questions, instead of asking the chunk again
+MC_REPAIR_RESPONSES = os.getenv("MC_REPAIR_RESPONSES", "true").lower() == "true"
+# Ask for the open and multiple choice questions of a mixed exam in a single
+# request per chunk, instead of sending every chunk once for each type
+COMBINED_GENERATION = os.getenv("COMBINED_GENERATION", "true").lower() == "true"
+
+# Questions whose estimated similarity is at least this value are considered duplicates
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+
+# Number of processes used to render PDF files
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))
+
+# Every browser session gets its own folder for the uploaded document and the outputs
+WORKSPACES_FOLDER = os.path.join(DATA_FOLDER, "workspaces")
+WORKSPACE_TTL = int(os.getenv("WORKSPACE_TTL", str(60 * 60 * 24)))
+
+# Background generation jobs: maximum number running at the same time and
+# seconds between refreshes of the page while a job runs
+JOBS_FILEPATH = os.path.join(DATA_FOLDER, "jobs.sqlite3")
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+# Metrics of the LLM requests and generation stages, written in the Prometheus
+# text format, and the price of the model in dollars per 1000 tokens to
+# estimate the cost of the requests
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "true").lower() == "true"
+METRICS_FILEPATH = os.path.join(DATA_FOLDER, "metrics.prom")
+PROMPT_TOKEN_PRICE = float(os.getenv("PROMPT_TOKEN_PRICE", "0.0015"))
+COMPLETION_TOKEN_PRICE = float(os.getenv("COMPLETION_TOKEN_PRICE", "0.002"))
+# Prompt and completion prices of the models the tasks can use instead, as a
+# JSON object like {"gpt-4": [0.03, 0.06]}. Models without a price are priced
+# with PROMPT_TOKEN_PRICE and COMPLETION_TOKEN_PRICE
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    **{
+        model: tuple(prices)
+        for model, prices in json.loads(os.getenv("MODEL_PRICES", "{}")).items()
+    },
+}
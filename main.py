@@ -1,18 +1,14 @@
-import openai
 import streamlit as st
 
 from app.app import get_app
-from config.cfg import OPENAI_ORG, OPENAI_TOKEN
 
 
 def initial_config():
     """
-    Initial configuration of OpenAI API and streamlit
+    Initial configuration of streamlit
+    The OpenAI API key and organization ID are given to the model when it is
+    created, see src.llm
     """
-    # Applying our API key and organization ID to OpenAI
-    openai.organization = OPENAI_ORG
-    openai.api_key = OPENAI_TOKEN
-
     st.set_page_config(
         page_title="Exam generator",
         page_icon=":pencil2:",
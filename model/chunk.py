@@ -0,0 +1,19 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class Chunk:
+    """
+    Class representing a chunk of a document
+
+    Attributes:
+    - index: Position of the chunk in the document
+    - page: Page of the document the chunk was taken from
+    - text: Chunk text
+    - tokens: Number of tokens of the text
+    """
+
+    index: int
+    page: int
+    text: str
+    tokens: int
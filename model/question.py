@@ -1,6 +1,5 @@
-from dataclasses import dataclass
 from enum import Enum
-from typing import List
+from typing import List, Optional
 
 
 # class syntax
@@ -9,7 +8,6 @@ class QuestionType(Enum):
     MULTIPLE_CHOICE = "Multiple choice"
 
 
-@dataclass
 class Question:
     """
     Class representing a question
@@ -17,27 +15,57 @@ class Question:
     Attributes:
     - id: Question ID
     - question: Question text
+    - variations: List of variations of the question text
     - answers: List of answers
     - correct_answers: List of correct answers
+    - chunk: Index of the chunk of the document the question is about, if known
     """
 
+    # No __dict__ per question, banks can hold many of them
+    __slots__ = (
+        "id",
+        "question",
+        "question_type",
+        "variations",
+        "answers",
+        "correct_answers",
+        "chunk",
+        "response",
+    )
+
     def __init__(
         self,
         id: int,
         question: str,
         question_type: QuestionType,
-        variations: List[str] = [],
-        answers: List[str] = [],
-        correct_answers: List[int] = [],
+        variations: Optional[List[str]] = None,
+        answers: Optional[List[str]] = None,
+        correct_answers: Optional[List[int]] = None,
+        chunk: Optional[int] = None,
     ):
         self.id = id
         self.question = question
         self.question_type = question_type
-        self.variations = variations
-        self.answers = answers
-        self.correct_answers = correct_answers
+        # New lists for every question, so questions never share them
+        self.variations = variations if variations is not None else []
+        self.answers = answers if answers is not None else []
+        self.correct_answers = correct_answers if correct_answers is not None else []
+        self.chunk = chunk
         self.response = []
 
+    def __repr__(self) -> str:
+        return (
+            f"Question(id={self.id!r}, question={self.question!r}, "
+            f"question_type={self.question_type})"
+        )
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Question):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
     def set_response(self, response):
         self.response = response
 
@@ -59,6 +87,35 @@ class Question:
             question = self.question
         return question
 
+    def to_dict(self) -> dict:
+        """
+        Get every attribute of the question as JSON serializable types
+        """
+        return {
+            "id": self.id,
+            "question": self.question,
+            "question_type": self.question_type.value,
+            "variations": self.variations,
+            "answers": self.answers,
+            "correct_answers": self.correct_answers,
+            "chunk": self.chunk,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Question":
+        """
+        Create a question from the attributes returned by to_dict
+        """
+        return cls(
+            data["id"],
+            data["question"],
+            QuestionType(data["question_type"]),
+            variations=data.get("variations", []),
+            answers=data.get("answers", []),
+            correct_answers=data.get("correct_answers", []),
+            chunk=data.get("chunk"),
+        )
+
     def check_response(self):
         if self.question_type == QuestionType.MULTIPLE_CHOICE:
             if len(self.response) == len(self.correct_answers):
@@ -0,0 +1,346 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+
+from model.question import Question, QuestionType
+
+# Order of the question types in the type column
+_QUESTION_TYPES = list(QuestionType)
+
+# Format of the saved banks, increased when the columns change
+_FORMAT_VERSION = 1
+
+
+class _StringTable:
+    """
+    Strings stored one after the other in a single UTF-8 buffer, with the
+    start and end of each one
+    """
+
+    __slots__ = ("data", "starts", "ends")
+
+    def __init__(self, data: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+        self.data = data
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_strings(cls, strings: List[str]) -> "_StringTable":
+        encoded = [string.encode("utf-8") for string in strings]
+        lengths = np.array([len(string) for string in encoded], dtype=np.int64)
+        ends = np.cumsum(lengths)
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(data, ends - lengths, ends)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def get(self, index: int) -> str:
+        return self.data[self.starts[index] : self.ends[index]].tobytes().decode()
+
+    def take(self, indexes: np.ndarray) -> "_StringTable":
+        """
+        Copy the strings at indexes to a new buffer
+        """
+        starts, ends = self.starts[indexes], self.ends[indexes]
+        lengths = ends - starts
+        new_ends = np.cumsum(lengths)
+        new_starts = new_ends - lengths
+        # Position in the old buffer of every byte of the new one
+        positions = np.repeat(starts - new_starts, lengths) + np.arange(
+            new_ends[-1] if len(new_ends) else 0
+        )
+        return _StringTable(self.data[positions], new_starts, new_ends)
+
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Concatenation of the ranges start, ..., start + count - 1
+    """
+    new_starts = np.cumsum(counts) - counts
+    return np.repeat(starts - new_starts, counts) + np.arange(counts.sum())
+
+
+class QuestionBank:
+    """
+    Questions stored by column, for banks of many thousands of questions
+
+    Texts are kept in string tables, the variations and answers of each
+    question are a range of their table given by offset and count columns,
+    and the correct answers are a bitmask. Slices share the tables with the
+    bank they come from, so taking the questions of an exam only copies a few
+    numbers per question
+
+    Attributes:
+    - ids: Question IDs
+    - question_types: Index of the type of each question in QuestionType
+    - chunks: Index of the chunk of each question, -1 if unknown
+    - correct_masks: Bit i is set when answer i of the question is correct
+    """
+
+    __slots__ = (
+        "ids",
+        "question_types",
+        "chunks",
+        "correct_masks",
+        "_rows",
+        "_texts",
+        "_variation_offsets",
+        "_variation_counts",
+        "_variations",
+        "_answer_offsets",
+        "_answer_counts",
+        "_answers",
+        "_rows_by_id",
+    )
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        question_types: np.ndarray,
+        chunks: np.ndarray,
+        correct_masks: np.ndarray,
+        rows: np.ndarray,
+        texts: _StringTable,
+        variation_offsets: np.ndarray,
+        variation_counts: np.ndarray,
+        variations: _StringTable,
+        answer_offsets: np.ndarray,
+        answer_counts: np.ndarray,
+        answers: _StringTable,
+    ):
+        self.ids = ids
+        self.question_types = question_types
+        self.chunks = chunks
+        self.correct_masks = correct_masks
+        # Row of each question in the text table
+        self._rows = rows
+        self._texts = texts
+        self._variation_offsets = variation_offsets
+        self._variation_counts = variation_counts
+        self._variations = variations
+        self._answer_offsets = answer_offsets
+        self._answer_counts = answer_counts
+        self._answers = answers
+        self._rows_by_id: Optional[Dict[int, int]] = None
+
+    @classmethod
+    def from_questions(cls, questions: Iterable[Question]) -> "QuestionBank":
+        """
+        Create a bank with a copy of the questions
+        """
+        questions = list(questions)
+        for question in questions:
+            if any(not 0 <= answer < 64 for answer in question.correct_answers):
+                raise ValueError(
+                    f"Question {question.id} has a correct answer out of the 64 supported"
+                )
+        variation_counts = np.array(
+            [len(question.variations) for question in questions], dtype=np.int64
+        )
+        answer_counts = np.array(
+            [len(question.answers) for question in questions], dtype=np.int64
+        )
+        return cls(
+            ids=np.array([question.id for question in questions], dtype=np.int64),
+            question_types=np.array(
+                [
+                    _QUESTION_TYPES.index(question.question_type)
+                    for question in questions
+                ],
+                dtype=np.uint8,
+            ),
+            chunks=np.array(
+                [
+                    question.chunk if question.chunk is not None else -1
+                    for question in questions
+                ],
+                dtype=np.int64,
+            ),
+            correct_masks=np.array(
+                [
+                    sum(1 << answer for answer in set(question.correct_answers))
+                    for question in questions
+                ],
+                dtype=np.uint64,
+            ),
+            rows=np.arange(len(questions)),
+            texts=_StringTable.from_strings(
+                [question.question for question in questions]
+            ),
+            variation_offsets=np.cumsum(variation_counts) - variation_counts,
+            variation_counts=variation_counts,
+            variations=_StringTable.from_strings(
+                [
+                    variation
+                    for question in questions
+                    for variation in question.variations
+                ]
+            ),
+            answer_offsets=np.cumsum(answer_counts) - answer_counts,
+            answer_counts=answer_counts,
+            answers=_StringTable.from_strings(
+                [answer for question in questions for answer in question.answers]
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[Question]:
+        for index in range(len(self)):
+            yield self._question(index)
+
+    def __getitem__(
+        self, key: Union[int, slice, List[int], np.ndarray]
+    ) -> Union[Question, "QuestionBank"]:
+        """
+        Get a question by position, or a bank with the questions of a slice or
+        of a list of positions
+        """
+        if isinstance(key, (int, np.integer)):
+            if not -len(self) <= key < len(self):
+                raise IndexError("Question index out of range")
+            return self._question(int(key) % len(self))
+        indexes = np.arange(len(self))[key]
+        return QuestionBank(
+            self.ids[indexes],
+            self.question_types[indexes],
+            self.chunks[indexes],
+            self.correct_masks[indexes],
+            self._rows[indexes],
+            self._texts,
+            self._variation_offsets[indexes],
+            self._variation_counts[indexes],
+            self._variations,
+            self._answer_offsets[indexes],
+            self._answer_counts[indexes],
+            self._answers,
+        )
+
+    def _question(self, index: int) -> Question:
+        variations_start = self._variation_offsets[index]
+        answers_start = self._answer_offsets[index]
+        mask = int(self.correct_masks[index])
+        chunk = int(self.chunks[index])
+        return Question(
+            int(self.ids[index]),
+            self._texts.get(self._rows[index]),
+            _QUESTION_TYPES[self.question_types[index]],
+            variations=[
+                self._variations.get(i)
+                for i in range(
+                    variations_start, variations_start + self._variation_counts[index]
+                )
+            ],
+            answers=[
+                self._answers.get(i)
+                for i in range(
+                    answers_start, answers_start + self._answer_counts[index]
+                )
+            ],
+            correct_answers=[i for i in range(mask.bit_length()) if mask >> i & 1],
+            chunk=chunk if chunk >= 0 else None,
+        )
+
+    def index(self, id: int) -> int:
+        """
+        Position of the question with an ID, the first one if the ID is repeated
+        """
+        if self._rows_by_id is None:
+            rows_by_id = {}
+            for index, question_id in enumerate(self.ids.tolist()):
+                rows_by_id.setdefault(question_id, index)
+            self._rows_by_id = rows_by_id
+        try:
+            return self._rows_by_id[id]
+        except KeyError:
+            raise KeyError(f"Question {id} not found") from None
+
+    def get(self, id: int) -> Question:
+        """
+        Get the question with an ID
+        """
+        return self._question(self.index(id))
+
+    def to_questions(self) -> List[Question]:
+        return list(self)
+
+    def compact(self) -> "QuestionBank":
+        """
+        Copy the bank keeping only the strings of its questions, for example
+        before saving a slice of a bigger bank
+        """
+        variation_rows = _ranges(self._variation_offsets, self._variation_counts)
+        answer_rows = _ranges(self._answer_offsets, self._answer_counts)
+        return QuestionBank(
+            self.ids.copy(),
+            self.question_types.copy(),
+            self.chunks.copy(),
+            self.correct_masks.copy(),
+            np.arange(len(self)),
+            self._texts.take(self._rows),
+            np.cumsum(self._variation_counts) - self._variation_counts,
+            self._variation_counts.copy(),
+            self._variations.take(variation_rows),
+            np.cumsum(self._answer_counts) - self._answer_counts,
+            self._answer_counts.copy(),
+            self._answers.take(answer_rows),
+        )
+
+    def save(self, filepath: str):
+        """
+        Save the bank in the uncompressed numpy format, written and read
+        without parsing every question
+        """
+        bank = self.compact()
+        columns = {
+            "version": np.array(_FORMAT_VERSION),
+            "ids": bank.ids,
+            "question_types": bank.question_types,
+            "chunks": bank.chunks,
+            "correct_masks": bank.correct_masks,
+            "variation_counts": bank._variation_counts,
+            "answer_counts": bank._answer_counts,
+        }
+        for name, table in (
+            ("texts", bank._texts),
+            ("variations", bank._variations),
+            ("answers", bank._answers),
+        ):
+            columns[f"{name}_data"] = table.data
+            columns[f"{name}_ends"] = table.ends
+        with open(filepath, "wb") as f:
+            np.savez(f, **columns)
+
+    @classmethod
+    def load(cls, filepath: str) -> "QuestionBank":
+        """
+        Load a bank saved with save
+        """
+        with np.load(filepath, allow_pickle=False) as columns:
+            if int(columns["version"]) != _FORMAT_VERSION:
+                raise ValueError(
+                    f"Unsupported question bank version {int(columns['version'])}"
+                )
+            tables = {}
+            for name in ("texts", "variations", "answers"):
+                ends = columns[f"{name}_ends"]
+                starts = np.concatenate([[0], ends[:-1]])[: len(ends)]
+                tables[name] = _StringTable(columns[f"{name}_data"], starts, ends)
+            variation_counts = columns["variation_counts"]
+            answer_counts = columns["answer_counts"]
+            return cls(
+                ids=columns["ids"],
+                question_types=columns["question_types"],
+                chunks=columns["chunks"],
+                correct_masks=columns["correct_masks"],
+                rows=np.arange(len(columns["ids"])),
+                texts=tables["texts"],
+                variation_offsets=np.cumsum(variation_counts) - variation_counts,
+                variation_counts=variation_counts,
+                variations=tables["variations"],
+                answer_offsets=np.cumsum(answer_counts) - answer_counts,
+                answer_counts=answer_counts,
+                answers=tables["answers"],
+            )
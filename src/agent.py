@@ -1,19 +1,169 @@
-from langchain.schema import HumanMessage
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Iterator, Optional
 
-from src.llm import llm
+from config.cfg import ESTIMATED_COMPLETION_TOKENS
+from src.cache import llm_cache
+from src.llm import get_backend
+from src.loader import count_tokens
+from src.scheduler import LLMScheduler
+from src.telemetry import (record_cache_hit, record_deduplicated_request,
+                           record_llm_request)
 
+# Tokens used by the requests sent from this process
+_usage_lock = threading.Lock()
+_token_usage = {"prompt_tokens": 0, "completion_tokens": 0}
+# Tokens used by the requests of the current task, see track_token_usage
+_task_usage: ContextVar[Optional[dict]] = ContextVar("task_usage", default=None)
 
-def complete_text(prompt: str, function_calling=False, custom_function={}) -> str:
+# Limit of concurrent requests, shared with other processes when set
+_request_limiter = None
+
+# Rate limits, retries and deduplication of the requests of this process
+_scheduler = LLMScheduler()
+# Retries and deduplication of the requests to backends without rate limits,
+# such as a local model
+_unlimited_scheduler = LLMScheduler(0, 0)
+
+
+def set_request_limiter(limiter):
+    """
+    Limit the number of requests sent at the same time
+    :param limiter: Semaphore acquired around every request, for example a
+        multiprocessing.Manager().BoundedSemaphore shared by several processes.
+        None removes the limit
+    """
+    global _request_limiter
+    _request_limiter = limiter
+
+
+def set_scheduler(scheduler: LLMScheduler):
+    """
+    Replace the scheduler of the requests, for example to share the rate
+    limits of the account among several processes
+    :param scheduler: Scheduler used by every request of this process
+    """
+    global _scheduler
+    _scheduler = scheduler
+
+
+def get_token_usage() -> dict:
+    """
+    Get the prompt and completion tokens used by this process so far
+    """
+    with _usage_lock:
+        return dict(_token_usage)
+
+
+@contextmanager
+def track_token_usage() -> Iterator[dict]:
     """
-    Complete text using GPT-3.5 Turbo
+    Count the tokens used by the requests sent inside the block, including the
+    ones sent from worker threads that run in a copy of its context
+    :return: Prompt and completion tokens, updated as the requests finish
     """
+    usage = {name: 0 for name in _token_usage}
+    token = _task_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _task_usage.reset(token)
+
+
+def complete_text(
+    prompt: str,
+    function_calling=False,
+    custom_function={},
+    use_cache=True,
+    task: str = "generate",
+) -> str:
+    """
+    Complete text with the backend of a task, GPT-3.5 Turbo by default
+    Responses are reused from the on-disk cache unless use_cache is False, and
+    requests go through the shared scheduler, which keeps them within the rate
+    limits, retries them and merges identical ones sent at the same time
+    :param task: One of LLM_TASKS, selects the model, the limit of requests in
+        flight and the timeout, see src.llm
+    """
+    function = custom_function["name"] if function_calling else "text"
+    backend = get_backend(task)
+    scheduler = _scheduler if backend.rate_limited else _unlimited_scheduler
+    key = llm_cache.make_key(
+        backend.model, prompt, custom_function if function_calling else None
+    )
+    use_cache = use_cache and llm_cache.enabled
+    if use_cache:
+        response = llm_cache.get(key)
+        if response is not None:
+            record_cache_hit(function)
+            return response
+
+    from langchain.schema import HumanMessage
+
     messages = [HumanMessage(content=prompt)]
+    kwargs = {}
+    if function_calling:
+        kwargs = {
+            "functions": [custom_function],
+            "function_call": {"name": custom_function["name"]},
+        }
+
+    def send_request():
+        with backend.semaphore, _request_limiter or nullcontext():
+            return backend.get_llm().generate([messages], **kwargs)
+
+    estimated_tokens = count_tokens(prompt) + ESTIMATED_COMPLETION_TOKENS
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        call = scheduler.run(key, send_request, estimated_tokens)
+    except Exception as ex:
+        record_llm_request(
+            function,
+            start,
+            time.perf_counter() - started,
+            error=ex,
+            model=backend.model,
+        )
+        raise
+    message = call.value.generations[0][0].message
     if function_calling:
-        response = llm(
-            messages,
-            functions=[custom_function],
-            function_call={"name": custom_function["name"]},
-        ).additional_kwargs["function_call"]
+        # Models that don't support the function answer in text, the caller
+        # gets the text as arguments and can parse it
+        response = message.additional_kwargs.get("function_call") or {
+            "name": custom_function["name"],
+            "arguments": message.content,
+        }
     else:
-        response = llm(messages).content
+        response = message.content
+    if call.shared:
+        # The caller that sent the request accounts for it
+        record_deduplicated_request(function)
+        return response
+
+    usage = (call.value.llm_output or {}).get("token_usage") or {}
+    scheduler.record_tokens(
+        estimated_tokens,
+        usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0),
+    )
+    task_usage = _task_usage.get()
+    with _usage_lock:
+        for name in _token_usage:
+            _token_usage[name] += usage.get(name, 0)
+            if task_usage is not None:
+                task_usage[name] += usage.get(name, 0)
+    record_llm_request(
+        function,
+        start,
+        time.perf_counter() - started - call.waited,
+        usage.get("prompt_tokens", 0),
+        usage.get("completion_tokens", 0),
+        retries=call.retries,
+        model=backend.model,
+    )
+
+    if use_cache:
+        llm_cache.set(key, response)
     return response
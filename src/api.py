@@ -0,0 +1,192 @@
+"""
+    HTTP API of the exam generator
+
+    Run it with: uvicorn src.api:app
+"""
+import json
+from contextlib import closing
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import anyio
+from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from config.cfg import COMBINED_GENERATION
+from model.question import Question
+from src.exams_api import (generate_exams, iter_mc_questions,
+                           iter_open_questions, iter_questions)
+from src.telemetry import metrics
+from src.workspace import Workspace
+
+app = FastAPI(title="Exam generator")
+
+
+class QuestionsRequest(BaseModel):
+    number_of_open_questions: int = 30
+    number_of_variations: int = 0
+    number_of_mc_questions: int = 0
+    number_of_answers: int = 4
+
+
+class ExamsRequest(BaseModel):
+    open_questions: List[dict]
+    number_of_open_questions_exam: int = 6
+    number_of_exams: int = 3
+    mc_questions: List[dict] = []
+    number_of_mc_questions_exam: int = 0
+    # Questions any two exams can share, unlimited if not set
+    max_overlap: Optional[int] = None
+    # Seed to assemble the same exams again
+    seed: Optional[int] = None
+
+
+def _get_workspace(document_id: str) -> Workspace:
+    workspace = Workspace.load(document_id)
+    if workspace is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return workspace
+
+
+def _iter_questions(
+    request: QuestionsRequest, filepath: str
+) -> Iterator[Tuple[List[Question], List[Question]]]:
+    """
+    Generate the questions of a request, both types together when both are
+    asked for, see COMBINED_GENERATION
+    :return: Iterator of pairs of lists of open and multiple choice questions
+    """
+    if (
+        COMBINED_GENERATION
+        and request.number_of_open_questions > 0
+        and request.number_of_mc_questions > 0
+    ):
+        yield from iter_questions(
+            request.number_of_open_questions,
+            request.number_of_mc_questions,
+            request.number_of_answers,
+            request.number_of_variations,
+            filepath=filepath,
+        )
+        return
+    with closing(
+        iter_open_questions(
+            request.number_of_open_questions,
+            request.number_of_variations,
+            filepath=filepath,
+        )
+    ) as open_questions:
+        for partial in open_questions:
+            yield partial, []
+    with closing(
+        iter_mc_questions(
+            request.number_of_mc_questions,
+            request.number_of_answers,
+            filepath=filepath,
+        )
+    ) as mc_questions:
+        for partial in mc_questions:
+            yield [], partial
+
+
+def _server_sent_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/documents")
+async def upload_document(file: UploadFile) -> Dict[str, str]:
+    """
+    Upload the pdf the questions will be generated from
+    """
+    workspace = Workspace()
+    await run_in_threadpool(workspace.save_content, await file.read())
+    return {"document_id": workspace.id}
+
+
+@app.post("/documents/{document_id}/questions")
+async def generate_questions(document_id: str, request: QuestionsRequest):
+    """
+    Generate open and multiple choice questions about a document, streamed as
+    Server-Sent Events
+    A questions event with the open questions and a mc_questions event with
+    the multiple choice ones are sent as soon as the questions of each chunk
+    are ready, and a done event is sent at the end
+    """
+    workspace = _get_workspace(document_id)
+    questions = _iter_questions(request, workspace.content_filepath)
+
+    async def events() -> AsyncIterator[str]:
+        totals = {"questions": 0, "mc_questions": 0}
+        try:
+            # The generation blocks, so it runs in a thread while the event
+            # loop keeps serving other requests
+            async for partials in iterate_in_threadpool(questions):
+                for event, partial in zip(totals, partials):
+                    if len(partial) == 0:
+                        continue
+                    totals[event] += len(partial)
+                    yield _server_sent_event(
+                        event, [question.to_dict() for question in partial]
+                    )
+        except Exception as ex:
+            print(ex)
+            yield _server_sent_event("error", {"detail": str(ex)})
+            return
+        finally:
+            # Stop the generation if the client disconnected. Closing it waits
+            # for the requests in flight, so it's done in a thread, shielded
+            # from the cancellation of the response
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(questions.close)
+        yield _server_sent_event(
+            "done",
+            {
+                "number_of_questions": totals["questions"],
+                "number_of_mc_questions": totals["mc_questions"],
+            },
+        )
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/exams")
+async def assemble_exams(request: ExamsRequest) -> Dict[str, List[dict]]:
+    """
+    Build exams from questions previously generated
+    """
+    open_questions = [
+        Question.from_dict(question) for question in request.open_questions
+    ]
+    mc_questions = [Question.from_dict(question) for question in request.mc_questions]
+    if request.number_of_open_questions_exam > len(
+        open_questions
+    ) or request.number_of_mc_questions_exam > len(mc_questions):
+        raise HTTPException(
+            status_code=422,
+            detail="The number of questions should be bigger than number of questions per exam",
+        )
+    try:
+        exams = generate_exams(
+            open_questions=open_questions,
+            number_of_open=request.number_of_open_questions_exam,
+            number_of_exams=request.number_of_exams,
+            mc_questions=mc_questions,
+            number_of_mc=request.number_of_mc_questions_exam,
+            max_overlap=request.max_overlap,
+            seed=request.seed,
+        )
+    except ValueError as ex:
+        raise HTTPException(status_code=422, detail=str(ex))
+    return {
+        exam: [question.to_dict() for question in questions]
+        for exam, questions in exams.items()
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics() -> str:
+    """
+    Metrics of the LLM requests and generation stages in the Prometheus text format
+    """
+    return metrics.to_prometheus()
@@ -0,0 +1,411 @@
+"""
+    Assembly of many exams from a limited bank of questions
+"""
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Exams whose shared questions are counted or assembled again at once
+_BLOCK_SIZE = 32
+
+
+def _chunk_ids(chunks: Sequence[Optional[int]]) -> np.ndarray:
+    """
+    Chunk of every question, questions of unknown chunk get a chunk of their own
+    """
+    return np.array(
+        [chunk if chunk is not None else -1 - i for i, chunk in enumerate(chunks)],
+        dtype=np.int64,
+    )
+
+
+def _group_rank(*keys: np.ndarray) -> np.ndarray:
+    """
+    Position of every element among the ones with the same keys, in the order
+    of the first key
+    """
+    order = np.lexsort(keys)
+    changed = np.zeros(len(order), dtype=bool)
+    for key in keys[1:]:
+        sorted_key = key[order]
+        changed[1:] |= sorted_key[1:] != sorted_key[:-1]
+    positions = np.arange(len(order))
+    group_start = np.maximum.accumulate(np.where(changed, positions, 0))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = positions - group_start
+    return rank
+
+
+def _balanced_stream(
+    chunks: np.ndarray, length: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Questions of a pool in passes that use every question once, where the
+    questions of each chunk are spread evenly over the pass
+    Consecutive questions of the stream come from different chunks as much as
+    possible, and a question is only repeated once every other was used
+    :param chunks: Chunk of every question
+    :param length: Minimum length of the stream, a whole pass is added after it
+    :return: Indexes of the questions
+    """
+    size = len(chunks)
+    passes = -(-length // size) + 1
+    _, chunk_index, chunk_sizes = np.unique(
+        chunks, return_inverse=True, return_counts=True
+    )
+    pass_ids = np.repeat(np.arange(passes), size)
+    chunk_ids = np.tile(chunk_index, passes)
+    chunk_rank = _group_rank(rng.random(passes * size), chunk_ids, pass_ids)
+    # Each chunk starts at a random point, then its questions are a fixed
+    # fraction of the pass apart
+    phase = rng.random((passes, len(chunk_sizes)))[pass_ids, chunk_ids]
+    position = (chunk_rank + phase) / chunk_sizes[chunk_ids]
+    order = np.lexsort((position, pass_ids))
+    return np.tile(np.arange(size), passes)[order]
+
+
+def _remove_duplicates(stream: np.ndarray, size: int, count: int):
+    """
+    Swap questions of the stream so none is twice in the same exam, which only
+    happens for exams that span the end of a pass
+    :param stream: Questions of the exams one after the other, changed in place
+    :param size: Number of questions of each exam
+    :param count: Number of exams
+    """
+    rows = np.sort(stream[: size * count].reshape(count, size), axis=1)
+    for exam in np.flatnonzero((rows[:, 1:] == rows[:, :-1]).any(axis=1)):
+        start = exam * size
+        seen = set()
+        for position in range(start, start + size):
+            if stream[position] not in seen:
+                seen.add(stream[position])
+                continue
+            # Swap with a later question that isn't in this exam, into an exam
+            # that doesn't have the repeated question
+            for other in range(start + size, len(stream)):
+                other_start = other - other % size
+                window = stream[other_start : other_start + size]
+                if stream[other] not in seen and stream[position] not in window:
+                    stream[position], stream[other] = stream[other], stream[position]
+                    break
+            seen.add(stream[position])
+
+
+def _exams_by_question(exams: np.ndarray, number_of_questions: int):
+    """
+    Sparse incidence of the questions in the exams, in compressed rows
+    :param exams: Questions of every exam, one row per exam
+    :return: Start of the exams of every question, the exams one question after
+        the other, in order, and the position of every question of exams in them
+    """
+    questions = exams.ravel()
+    order = np.argsort(questions, kind="stable")
+    counts = np.bincount(questions, minlength=number_of_questions)
+    positions = np.empty(len(order), dtype=np.int64)
+    positions[order] = np.arange(len(order))
+    return (
+        np.r_[0, np.cumsum(counts)],
+        order // exams.shape[1],
+        positions.reshape(exams.shape),
+    )
+
+
+def _shared_questions(
+    rows: np.ndarray,
+    starts: np.ndarray,
+    exam_ids: np.ndarray,
+    count: int,
+    ends: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Questions some exams share with every exam of a sparse incidence, the
+    product of the incidence of those exams with the transpose of the other
+    :param rows: Questions of the exams, one row per exam
+    :param starts: Start of the exams of every question, see _exams_by_question
+    :param exam_ids: Exams of every question, see _exams_by_question
+    :param count: Number of exams of the incidence
+    :param ends: End of the exams of every question of rows, to only count the
+        first ones, all by default
+    :return: Shared questions, one row per exam of rows and a column per exam
+    """
+    questions = rows.ravel()
+    first = starts[questions]
+    last = starts[questions + 1] if ends is None else ends.ravel()
+    lengths = last - first
+    row_ids = np.repeat(np.arange(len(questions)) // rows.shape[1], lengths)
+    # Position in exam_ids of the exams of every question, one after the other
+    offsets = np.repeat(first - np.cumsum(lengths) + lengths, lengths)
+    others = exam_ids[offsets + np.arange(len(offsets))]
+    return np.bincount(row_ids * count + others, minlength=len(rows) * count).reshape(
+        len(rows), count
+    )
+
+
+def _overlapping_exams(
+    exams: np.ndarray, number_of_questions: int, max_overlap: int
+) -> np.ndarray:
+    """
+    Find the exams that share more than max_overlap questions with a previous one
+    :param exams: Questions of every exam, one row per exam
+    :param number_of_questions: Number of questions of the bank
+    :return: Indexes of the exams
+    """
+    starts, exam_ids, positions = _exams_by_question(exams, number_of_questions)
+    overlapping = []
+    for start in range(0, len(exams), _BLOCK_SIZE):
+        end = min(start + _BLOCK_SIZE, len(exams))
+        # The exams of a question are in order, the ones before an exam come
+        # before its position
+        shared = _shared_questions(
+            exams[start:end], starts, exam_ids, end, positions[start:end]
+        )
+        overlapping.append(start + np.flatnonzero((shared > max_overlap).any(axis=1)))
+    return np.concatenate(overlapping)
+
+
+def _preferred_questions(
+    chunks: np.ndarray, usage: np.ndarray, count: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Questions of a pool in order of preference for several exams: least used
+    first, and from different chunks, in a different random order for each exam
+    :param chunks: Chunk of every question
+    :param usage: Number of exams of every question
+    :param count: Number of exams
+    :return: Indexes of the questions, one row per exam
+    """
+    _, chunk_index, chunk_sizes = np.unique(
+        chunks, return_inverse=True, return_counts=True
+    )
+    noise = rng.random((count, len(chunks)))
+    # Position of every question among the ones of its chunk
+    by_chunk = np.argsort(chunk_index + noise, axis=1)
+    chunk_starts = np.r_[0, np.cumsum(chunk_sizes)[:-1]]
+    chunk_rank = np.empty_like(by_chunk)
+    np.put_along_axis(
+        chunk_rank,
+        by_chunk,
+        np.arange(len(chunks)) - chunk_starts[chunk_index[by_chunk]],
+        axis=1,
+    )
+    return np.argsort(usage * (len(chunks) + 1) + chunk_rank + noise, axis=1)
+
+
+def _questions_in(
+    rows: np.ndarray,
+    exams: np.ndarray,
+    block_rows: np.ndarray,
+    block_exams: np.ndarray,
+    count: int,
+    number_of_questions: int,
+) -> np.ndarray:
+    """
+    Count the exams that include each question, for several exams being chosen
+    :param rows: Exam being chosen of every exam counted
+    :param exams: Questions of the exams counted, one row per exam
+    :param block_rows: Exam being chosen of every exam of the block counted
+    :param block_exams: Questions of those exams of the block, one row per exam
+    :param count: Number of exams being chosen
+    :return: Exams of every question, one row per exam being chosen
+    """
+    return np.bincount(
+        np.r_[
+            (rows[:, None] * number_of_questions + exams).ravel(),
+            (block_rows[:, None] * number_of_questions + block_exams).ravel(),
+        ],
+        minlength=count * number_of_questions,
+    ).reshape(count, number_of_questions)
+
+
+def _choose_questions(
+    selected: np.ndarray,
+    candidates: np.ndarray,
+    chosen: np.ndarray,
+    incidence: np.ndarray,
+    exams: np.ndarray,
+    max_overlap: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Choose the questions of several exams, each sharing at most max_overlap
+    questions with the exams already assembled and with the ones before it
+    The questions of every exam that break the limit are replaced one per
+    step, all the exams at once, by the question preferred next that isn't
+    in any exam it conflicts with, nor if possible in one at the limit
+    :param selected: Questions the exams start from, one row per exam
+    :param candidates: Questions in order of preference, one row per exam
+    :param chosen: Questions already chosen for the exams, from other pools
+    :param incidence: 1 for every question and exam already assembled with it
+    :param exams: Questions of every exam, one row per exam
+    :return: Questions of the exams, one row per exam, and the exams that
+        couldn't be chosen with the ones before them
+    """
+    count, pool_size = candidates.shape
+    number_of_questions = incidence.shape[0]
+    selected = selected.copy()
+    next_candidate = np.zeros(count, dtype=np.int64)
+    # Questions shared with every exam, updated as questions are replaced
+    shared = np.zeros((count, incidence.shape[1]), dtype=np.int16)
+    for column in np.hstack([chosen, selected]).T:
+        shared += incidence[column]
+    conflicted = (shared > max_overlap).any(axis=1)
+    failed = np.zeros(count, dtype=bool)
+    earlier = np.tri(count, k=-1, dtype=bool)
+    while True:
+        # Questions shared with the exams chosen before each one
+        questions = np.hstack([chosen, selected])
+        block_incidence = np.zeros((count, number_of_questions), dtype=np.float32)
+        np.put_along_axis(block_incidence, questions, 1, axis=1)
+        block_incidence[failed] = 0
+        block_shared = earlier * (block_incidence @ block_incidence.T)
+        block_conflicting = block_shared > max_overlap
+        active = np.flatnonzero((conflicted | block_conflicting.any(axis=1)) & ~failed)
+        if len(active) == 0:
+            return selected, failed
+        active_shared = shared[active]
+        rows, conflicts = np.nonzero(active_shared > max_overlap)
+        block_rows, block_conflicts = np.nonzero(block_conflicting[active])
+        # Conflicting exams of every exam that include each question
+        in_conflicts = _questions_in(
+            rows,
+            exams[conflicts],
+            block_rows,
+            questions[block_conflicts],
+            len(active),
+            number_of_questions,
+        )
+        # Replace the question included in most of the conflicting exams
+        position = np.take_along_axis(in_conflicts, selected[active], axis=1).argmax(
+            axis=1
+        )
+        replaced = selected[active, position]
+        # Exams that would be at the limit without it, a replacement in any of
+        # them would make a new conflict
+        active_shared -= incidence[replaced]
+        rows, full = np.nonzero(active_shared >= max_overlap)
+        block_rows, block_full = np.nonzero(
+            block_shared[active] - block_incidence[:, replaced].T >= max_overlap
+        )
+        in_full = _questions_in(
+            rows,
+            exams[full],
+            block_rows,
+            questions[block_full],
+            len(active),
+            number_of_questions,
+        )
+        in_selected = np.zeros_like(in_conflicts, dtype=bool)
+        np.put_along_axis(in_selected, selected[active], True, axis=1)
+        later = np.arange(pool_size) >= next_candidate[active, None]
+        eligible = later & np.take_along_axis(
+            (in_conflicts == 0) & ~in_selected, candidates[active], axis=1
+        )
+        exhausted = ~eligible.any(axis=1)
+        if exhausted.any():
+            # Only the first exam depends on nothing but the exams assembled,
+            # the others may fit once the ones before them are
+            if active[0] == 0 and exhausted[0]:
+                raise ValueError(
+                    f"Can't assemble the exams with at most {max_overlap} shared "
+                    "questions between any two of them, a bigger bank of "
+                    "questions or a higher overlap is needed"
+                )
+            failed[active[exhausted]] = True
+            continue
+        # Questions that make no new conflict first, if there is any
+        safe = eligible & np.take_along_axis(in_full == 0, candidates[active], axis=1)
+        replacement = np.where(
+            safe.any(axis=1), safe.argmax(axis=1), eligible.argmax(axis=1)
+        )
+        next_candidate[active] = replacement + 1
+        replacement = candidates[active, replacement]
+        active_shared += incidence[replacement]
+        shared[active] = active_shared
+        selected[active, position] = replacement
+        conflicted[active] = (active_shared > max_overlap).any(axis=1)
+
+
+def assemble_exams(
+    pool_chunks: List[Sequence[Optional[int]]],
+    questions_per_exam: List[int],
+    number_of_exams: int,
+    max_overlap: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> List[np.ndarray]:
+    """
+    Choose the questions of every exam from several pools of questions, like
+    the open and the multiple choice ones
+    Questions are reused only once every question of their pool was used as
+    many times, so exams don't share questions while the bank is big enough.
+    Within an exam questions come from as many chunks as possible
+    :param pool_chunks: For each pool, the chunk of each of its questions
+    :param questions_per_exam: For each pool, the number of its questions in an exam
+    :param number_of_exams: Number of exams to assemble
+    :param max_overlap: Maximum number of questions any two exams can share,
+        None for no limit. The exams that break it are assembled again in
+        blocks
+    :param seed: Seed of the random choices, the same seed gives the same exams
+    :return: For each pool, the indexes of its questions with one row per exam
+    """
+    for chunks, size in zip(pool_chunks, questions_per_exam):
+        if size > len(chunks):
+            raise ValueError(
+                f"An exam can't have {size} questions from a bank of {len(chunks)}"
+            )
+    rng = np.random.default_rng(seed)
+    chunks = [_chunk_ids(chunks) for chunks in pool_chunks]
+    pools = []
+    for pool_chunk_ids, size in zip(chunks, questions_per_exam):
+        if size == 0:
+            pools.append(np.zeros((number_of_exams, 0), dtype=np.int64))
+            continue
+        stream = _balanced_stream(pool_chunk_ids, size * number_of_exams, rng)
+        _remove_duplicates(stream, size, number_of_exams)
+        pools.append(stream[: size * number_of_exams].reshape(number_of_exams, size))
+    if max_overlap is None or number_of_exams < 2:
+        return pools
+
+    # Questions of every pool in a single row per exam
+    sizes = [pool.shape[1] for pool in pools]
+    offsets = np.cumsum([0] + [len(pool_chunk_ids) for pool_chunk_ids in chunks])
+    columns = np.cumsum([0] + sizes)
+    exams = np.hstack([pool + offset for pool, offset in zip(pools, offsets)])
+    overlapping = _overlapping_exams(exams, offsets[-1], max_overlap)
+    if len(overlapping) > 0:
+        # Take those exams out and assemble them again a block at a time,
+        # checking each block against every exam already in and itself
+        incidence = np.zeros((offsets[-1], number_of_exams), dtype=np.uint8)
+        incidence[exams, np.arange(number_of_exams)[:, None]] = 1
+        incidence[:, overlapping] = 0
+        usage = incidence.sum(axis=1, dtype=np.int64)
+        pending = overlapping
+        while len(pending) > 0:
+            block = pending[:_BLOCK_SIZE]
+            pending = pending[_BLOCK_SIZE:]
+            chosen = np.zeros((len(block), 0), dtype=np.int64)
+            for pool, pool_chunk_ids in enumerate(chunks):
+                if sizes[pool] == 0:
+                    continue
+                start = offsets[pool]
+                candidates = _preferred_questions(
+                    pool_chunk_ids, usage[start : offsets[pool + 1]], len(block), rng
+                )
+                selected, failed = _choose_questions(
+                    exams[block, columns[pool] : columns[pool + 1]],
+                    candidates + start,
+                    chosen,
+                    incidence,
+                    exams,
+                    max_overlap,
+                )
+                # Exams that didn't fit with the ones before them go to the
+                # next block
+                pending = np.r_[block[failed], pending]
+                block = block[~failed]
+                chosen = np.hstack([chosen[~failed], selected[~failed]])
+            exams[block] = chosen
+            incidence[chosen, block[:, None]] = 1
+            usage += np.bincount(chosen.ravel(), minlength=len(usage))
+    return [
+        exams[:, columns[pool] : columns[pool + 1]] - offsets[pool]
+        for pool in range(len(pools))
+    ]
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from config.cfg import (LLM_CACHE_ENABLED, LLM_CACHE_FILEPATH,
+                        LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL)
+
+
+class LLMCache:
+    """
+    Persistent cache of LLM responses stored in SQLite
+
+    Entries are addressed by the hash of the model, prompt and function schema,
+    expire after ttl seconds and the least recently used ones are evicted when
+    the cache grows over max_entries.
+    """
+
+    def __init__(
+        self,
+        filepath: str = LLM_CACHE_FILEPATH,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        ttl: int = LLM_CACHE_TTL,
+        enabled: bool = LLM_CACHE_ENABLED,
+    ):
+        self.filepath = filepath
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, custom_function: Optional[dict]) -> str:
+        """
+        Build the content address of a request
+        :param model: Name of the model
+        :param prompt: Prompt sent to the model
+        :param custom_function: Function schema used for function calling, if any
+        :return: Hex digest identifying the request
+        """
+        content = json.dumps(
+            {"model": model, "prompt": prompt, "function": custom_function or None},
+            sort_keys=True,
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(self.filepath, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Get a cached response
+        :param key: Key built with make_key
+        :return: The cached response, None if missing or expired
+        """
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    connection.commit()
+                self.misses += 1
+                return None
+            connection.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            connection.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        """
+        Store a response, evicting the least recently used entries if needed
+        :param key: Key built with make_key
+        :param value: JSON serializable response
+        """
+        with self._lock:
+            connection = self._connect()
+            now = time.time()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            (size,) = connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if size > self.max_entries:
+                connection.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                    (size - self.max_entries,),
+                )
+            connection.commit()
+
+    def clear(self):
+        """
+        Remove every entry and reset the counters
+        """
+        with self._lock:
+            self._connect().execute("DELETE FROM responses")
+            self._connection.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Get the hit and miss counters of the cache
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,164 @@
+"""
+    Local near-duplicate detection of questions with MinHash and LSH
+"""
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config.cfg import DEDUP_THRESHOLD
+from src.utils import normalize_text
+
+SHINGLE_SIZE = 5
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+NUM_PERMUTATIONS = NUM_BANDS * ROWS_PER_BAND
+# Multiply-shift hash functions, the products wrap around 2**64 on purpose
+_rng = np.random.default_rng(0)
+_A = _rng.integers(0, 1 << 64, NUM_PERMUTATIONS, dtype=np.uint64, endpoint=False) | 1
+_B = _rng.integers(0, 1 << 64, NUM_PERMUTATIONS, dtype=np.uint64, endpoint=False)
+_SHIFT = np.uint64(32)
+
+
+def _shingles(text: str) -> List[int]:
+    """
+    Hash the character shingles of a text
+    """
+    text = normalize_text(text)
+    if len(text) <= SHINGLE_SIZE:
+        return [zlib.crc32(text.encode("utf-8"))]
+    return list(
+        {
+            zlib.crc32(text[i : i + SHINGLE_SIZE].encode("utf-8"))
+            for i in range(len(text) - SHINGLE_SIZE + 1)
+        }
+    )
+
+
+def minhash_signatures(texts: List[str]) -> np.ndarray:
+    """
+    Compute the MinHash signature of every text
+    :param texts: Texts to sign
+    :return: Matrix with one row of NUM_PERMUTATIONS hashes per text
+    """
+    shingles = [_shingles(text) for text in texts]
+    lengths = np.fromiter((len(s) for s in shingles), dtype=np.int64, count=len(texts))
+    hashes = np.fromiter(
+        (h for s in shingles for h in s), dtype=np.uint64, count=int(lengths.sum())
+    )
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    signatures = np.empty((len(texts), NUM_PERMUTATIONS), dtype=np.uint64)
+    for i in range(NUM_PERMUTATIONS):
+        permuted = (_A[i] * hashes + _B[i]) >> _SHIFT
+        signatures[:, i] = np.minimum.reduceat(permuted, starts)
+    return signatures
+
+
+def _find(parents: List[int], i: int) -> int:
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+
+def _band_keys(signatures: np.ndarray) -> np.ndarray:
+    """
+    LSH bucket of every signature in every band
+    :return: Matrix with one row of NUM_BANDS buckets per signature
+    """
+    bands = signatures.reshape(len(signatures), NUM_BANDS, ROWS_PER_BAND)
+    return (bands * _A[:ROWS_PER_BAND]).sum(axis=2)
+
+
+def cluster_duplicates(
+    texts: List[str],
+    threshold: float = DEDUP_THRESHOLD,
+    signatures: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Group texts that are near-duplicates of each other
+    Only texts sharing an LSH bucket are compared, so the cost grows with the
+    number of texts instead of the number of pairs
+    :param texts: Texts to cluster
+    :param threshold: Minimum estimated Jaccard similarity of duplicates
+    :param signatures: MinHash signatures of the texts, computed if not given
+    :return: Cluster label of each text, the index of the first text of its cluster
+    """
+    if len(texts) == 0:
+        return np.empty(0, dtype=np.int64)
+    if signatures is None:
+        signatures = minhash_signatures(texts)
+    parents = list(range(len(texts)))
+    for buckets in _band_keys(signatures).T:
+        order = np.argsort(buckets, kind="stable")
+        sorted_buckets = buckets[order]
+        # Compare every text with the first text of its bucket
+        first = np.searchsorted(sorted_buckets, sorted_buckets)
+        leaders = order[first]
+        candidates = leaders != order
+        leaders, members = leaders[candidates], order[candidates]
+        if len(members) == 0:
+            continue
+        similarity = (signatures[leaders] == signatures[members]).mean(axis=1)
+        for leader, member in zip(
+            leaders[similarity >= threshold], members[similarity >= threshold]
+        ):
+            root_leader, root_member = _find(parents, leader), _find(parents, member)
+            if root_leader != root_member:
+                parents[max(root_leader, root_member)] = min(root_leader, root_member)
+    return np.array([_find(parents, i) for i in range(len(texts))], dtype=np.int64)
+
+
+class DuplicateIndex:
+    """
+    Texts kept so far, with their signatures and LSH buckets, so new texts are
+    signed once and only compared with the kept texts that share a bucket
+    with them
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self.texts: List[str] = []
+        self._signatures: List[np.ndarray] = []
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(NUM_BANDS)]
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def add(self, texts: List[str], limit: Optional[int] = None) -> List[int]:
+        """
+        Keep the texts that aren't near-duplicates of the kept ones, one per
+        cluster of near-duplicates among them
+        :param texts: Texts to add
+        :param limit: Maximum number of texts to keep, None for no limit
+        :return: Sorted indexes of the texts kept
+        """
+        if len(texts) == 0:
+            return []
+        signatures = minhash_signatures(texts)
+        keys = _band_keys(signatures)
+        labels = cluster_duplicates(texts, self.threshold, signatures)
+        kept = []
+        for i in np.flatnonzero(labels == np.arange(len(texts))):
+            if limit is not None and len(kept) >= limit:
+                break
+            if self._is_duplicate(signatures[i], keys[i]):
+                continue
+            for band, key in enumerate(keys[i].tolist()):
+                self._buckets[band].setdefault(key, []).append(len(self.texts))
+            self._signatures.append(signatures[i])
+            self.texts.append(texts[i])
+            kept.append(int(i))
+        return kept
+
+    def _is_duplicate(self, signature: np.ndarray, keys: np.ndarray) -> bool:
+        candidates = {
+            index
+            for band, key in enumerate(keys.tolist())
+            for index in self._buckets[band].get(key, ())
+        }
+        if len(candidates) == 0:
+            return False
+        kept = np.array([self._signatures[index] for index in candidates])
+        similarity = (kept == signature).mean(axis=1)
+        return bool((similarity >= self.threshold).any())
@@ -1,160 +1,858 @@
+import contextvars
 import json
 import math
-import random
-from typing import Dict, List
-
-import numpy as np
-
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple, Union
+
+from config.cfg import (CONTENT_FILEPATH, MAX_CONCURRENT_REQUESTS,
+                        MAX_PLAN_ROUNDS, MAX_QUESTIONS_PER_CALL,
+                        MC_MAX_ATTEMPTS, MC_MAX_TOKENS, MC_REPAIR_RESPONSES,
+                        VARIATIONS_BATCH_SIZE)
+from model.chunk import Chunk
 from model.question import Question, QuestionType
+from model.question_bank import QuestionBank
 from src.agent import complete_text
-from src.loader import load_and_split_doc
-from src.prompts import (open_questions_func_definition,
+from src.assembly import assemble_exams
+from src.dedup import DuplicateIndex
+from src.loader import count_tokens, file_hash, iter_chunks
+from src.parsing import MCParseResult, parse_mc_response, validate_mc_question
+from src.planner import PROMPT_OVERHEAD_TOKENS, QuestionPlan, plan_questions
+from src.prompts import (mc_questions_func_definition,
+                         mixed_questions_func_definition,
+                         open_questions_func_definition,
+                         prepare_prompt_batch_variation_question,
+                         prepare_prompt_extract_multiple_choice,
+                         prepare_prompt_mixed_questions,
                          prepare_prompt_multiple_choice,
                          prepare_prompt_open_question,
-                         prepare_prompt_variation_question)
-from src.utils import sanitize_line
+                         variations_func_definition)
+from src.question_store import question_store
+from src.telemetry import (record_event, record_mc_parse,
+                           record_reused_questions, stage)
+from src.utils import question_hash
 
 
-def _get_correct_answers(answers: List[str]) -> int:
+def _iter_concurrently(
+    func: Callable, items: Iterable, max_workers: int = MAX_CONCURRENT_REQUESTS
+) -> Iterator:
     """
-    Return the index of the correct answer
-    :param answers: List of answers
-    :return: Index of the correct answer if found, -1 otherwise
+    Apply func to every item using a bounded pool of threads, yielding each
+    result as soon as it and the ones before it are done
+    Items are consumed lazily, so at most 2 * max_workers of them are held in
+    memory while they wait for or go through func
+    :param func: Function to apply, it receives one item
+    :param items: Items to process, can be a generator
+    :param max_workers: Maximum number of items processed at the same time
+    :return: Iterator of results in the same order as items, None for the items
+        that failed
     """
-    correct_answers = []
-    for index, answer in enumerate(answers):
-        if answer.count("Correct:") > 0:
-            correct_answers.append(index)
 
-    return correct_answers
+    def safe_call(item):
+        try:
+            return func(item)
+        except Exception as ex:
+            print(ex)
+            return None
+
+    max_workers = max(1, max_workers)
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    pending = deque()
+    try:
+        for item in items:
+            # Run in a copy of the caller's context, so context variables like
+            # the token usage of the task reach the worker threads
+            context = contextvars.copy_context()
+            pending.append(pool.submit(context.run, safe_call, item))
+            while pending and (len(pending) >= 2 * max_workers or pending[0].done()):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Don't start the remaining items if the consumer stopped iterating
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _map_concurrently(
+    func: Callable, items: Iterable, max_workers: int = MAX_CONCURRENT_REQUESTS
+) -> List:
+    """
+    Apply func to every item using a bounded pool of threads
+    :param func: Function to apply, it receives one item
+    :param items: Items to process, can be a generator
+    :param max_workers: Maximum number of items processed at the same time
+    :return: Results in the same order as items, None for the items that failed
+    """
+    return list(_iter_concurrently(func, items, max_workers))
 
 
-def _response_to_mc_questions(response: str, count) -> List[Question]:
+def _get_variations_batch(
+    questions: List[str], number_of_variations: int
+) -> Dict[int, List[str]]:
     """
-    Convert the response from the API to a list of questions
-    :param response: Response to convert
-    :return: List of questions
+    Rephrase several questions with a single function call
+    :param questions: Questions to create variations for
+    :param number_of_variations: Number of variations for each question
+    :return: Variations by position of the question in the batch
     """
-    questions = []
+    prompt = prepare_prompt_batch_variation_question(questions, number_of_variations)
+    custom_function = variations_func_definition()
+    with stage("variations", questions=len(questions)):
+        response = complete_text(prompt, True, custom_function, task="variations")
+    variations = {}
+    for item in json.loads(response["arguments"])["variations"]:
+        index = item.get("question_number", 0) - 1
+        if 0 <= index < len(questions):
+            variations[index] = item.get("variations", [])[:number_of_variations]
+    return variations
 
-    for question_text in response.split("\n\n"):
-        question_text = question_text.strip()
 
-        if not question_text:
-            continue
+def _build_questions(
+    questions,
+    number_of_variations: int,
+    batch_size: int = VARIATIONS_BATCH_SIZE,
+    max_workers: int = MAX_CONCURRENT_REQUESTS,
+) -> List[Question]:
+    variations = {}
+    if number_of_variations:
+        # Rephrase the questions in batches, sending the batches in parallel
+        batches = [
+            questions[start : start + batch_size]
+            for start in range(0, len(questions), batch_size)
+        ]
+        batch_variations = _map_concurrently(
+            lambda batch: _get_variations_batch(batch, number_of_variations),
+            batches,
+            max_workers,
+        )
+        for batch_index, result in enumerate(batch_variations):
+            for index, question_variations in (result or {}).items():
+                variations[batch_index * batch_size + index] = question_variations
+
+    result_questions = []
+    for i, question in enumerate(questions):
+        q = Question(i, question, QuestionType.OPEN, variations=variations.get(i, []))
+        result_questions.append(q)
+    return result_questions
 
-        question_lines = question_text.splitlines()
 
-        question = sanitize_line(question_lines[0], is_question=True)
-        answers = list(
-            map(lambda line: sanitize_line(line, is_question=False), question_lines[1:])
+def _record_plan(generation: str, plan: QuestionPlan, **attributes):
+    """
+    Report how the requests of a generation are planned in its trace
+    :param generation: open, mc or mixed
+    :param plan: Plan of the requests
+    """
+    record_event(
+        "plan",
+        generation=generation,
+        number_of_questions=plan.number_of_questions,
+        estimated_calls=plan.estimated_calls,
+        estimated_prompt_tokens=plan.estimated_prompt_tokens,
+        estimated_completion_tokens=plan.estimated_completion_tokens,
+        **attributes,
+    )
+
+
+def _generate_open_questions(content: str, number_of_questions: int) -> List[str]:
+    """
+    Generate open questions for a single chunk of the document
+    :param content: Chunk of text the questions should be about
+    :param number_of_questions: Number of questions to ask for
+    :return: List of question texts
+    """
+    prompt = prepare_prompt_open_question(content, number_of_questions)
+    custom_function = open_questions_func_definition()
+    with stage("generate", question_type="open", questions=number_of_questions):
+        response = complete_text(prompt, True, custom_function, task="generate")
+    questions = json.loads(response["arguments"])["questions"].split("#")
+    return [question.strip() for question in questions if question.strip()]
+
+
+def _new_open_questions(
+    accepted: DuplicateIndex, questions: List[Question], number_of_questions: int
+) -> List[Question]:
+    """
+    Keep the questions of a chunk that aren't rewordings of the accepted ones
+    :param accepted: Questions accepted so far, the new ones are added to it
+    :param questions: Questions of the chunk
+    :param number_of_questions: Total number of questions wanted
+    :return: New questions, numbered after the accepted ones
+    """
+    # Chunks overlap in topic, keep one question of each group of rewordings
+    first_id = len(accepted)
+    new_questions = [
+        questions[i]
+        for i in accepted.add(
+            [question.question for question in questions],
+            number_of_questions - len(accepted),
+        )
+    ]
+    for offset, question in enumerate(new_questions):
+        question.id = first_id + offset
+    return new_questions
+
+
+def iter_open_questions(
+    number_of_open_questions,
+    number_of_variations=0,
+    max_workers=MAX_CONCURRENT_REQUESTS,
+    filepath=CONTENT_FILEPATH,
+    plan_callback: Callable[[QuestionPlan], None] = None,
+    progress_callback: Callable[[int, int], None] = None,
+    use_store: bool = True,
+) -> Iterator[List[Question]]:
+    """
+    Generate open questions about a document, yielding the questions of each
+    chunk as soon as they are ready
+    Questions stored for the document by previous runs are yielded first and
+    only the missing ones are generated
+    :param number_of_open_questions: Number of questions to generate
+    :param number_of_variations: Number of variations for each question
+    :param max_workers: Maximum number of LLM requests sent at the same time
+    :param filepath: Path of the pdf
+    :param plan_callback: Called with the generation plan before any request is sent
+    :param progress_callback: Called with the number of chunks done and the
+        total number of chunks every time a chunk is done
+    :param use_store: Whether to reuse and store questions in the question store
+    :return: Iterator of lists of questions, in document order, adding up to
+        number_of_open_questions unless the LLM couldn't generate enough of them
+    """
+    if number_of_open_questions == 0:
+        return
+    document = file_hash(filepath)
+    stored = []
+    if use_store:
+        stored = question_store.get(
+            document,
+            QuestionType.OPEN,
+            number_of_open_questions,
+            number_of_variations=number_of_variations,
         )
-        correct_answers = _get_correct_answers(answers)
-
-        if len(correct_answers) > 0:
-            for c in correct_answers:
-                answers[c] = answers[c].replace("Correct:", "")
-
-            answers = list(map(lambda answer: answer.strip(), answers))
-            # if len(set(answers)) != len(answers):
-            #    print(f'duplicated options for question {question}')
-            #    print(answers)
-            #    continue
-            questions.append(
-                Question(
-                    count,
-                    question,
-                    QuestionType.MULTIPLE_CHOICE,
-                    answers=answers,
-                    correct_answers=correct_answers,
-                )
+        record_reused_questions("open", len(stored))
+        if len(stored) > 0:
+            yield stored
+        if len(stored) == number_of_open_questions:
+            return
+
+    # The plan spreads the questions over the whole document, so every chunk
+    # is counted before the first request is sent. A document seen for the
+    # first time is therefore parsed completely before generation starts, and
+    # parsing no longer overlaps with the LLM requests as it did when each
+    # chunk was sent as soon as it was split. The parsed document is cached,
+    # so the chunks streamed again below are read from the cache. Only the
+    # token counts are kept in memory
+    chunk_tokens = [chunk.tokens for chunk in iter_chunks(filepath)]
+    # Ask the chunks without stored questions first
+    used_chunks = {question.chunk for question in stored}
+    shortfall = number_of_open_questions - len(stored)
+    plan = plan_questions(chunk_tokens, shortfall, exclude=used_chunks)
+    if len(plan.allocations) == 0:
+        plan = plan_questions(chunk_tokens, shortfall)
+    _record_plan("open", plan)
+    if plan_callback is not None:
+        plan_callback(plan)
+
+    progress = {"done": 0, "total": 0}
+    progress_lock = threading.Lock()
+
+    def generate(chunk):
+        try:
+            questions = _generate_open_questions(
+                chunk.text, plan.allocations[chunk.index]
+            )
+            # Variations are requested right away, so the chunk is complete
+            # when it is yielded
+            questions = _build_questions(questions, number_of_variations, max_workers=1)
+            for question in questions:
+                question.chunk = chunk.index
+            return questions
+        finally:
+            with progress_lock:
+                progress["done"] += 1
+                done, total = progress["done"], progress["total"]
+            if progress_callback is not None:
+                progress_callback(done, total)
+
+    accepted = DuplicateIndex()
+    accepted.add([question.question for question in stored])
+    for _ in range(MAX_PLAN_ROUNDS):
+        with progress_lock:
+            progress["total"] += len(plan.allocations)
+            done, total = progress["done"], progress["total"]
+        if progress_callback is not None:
+            progress_callback(done, total)
+        # Create questions from text with llm, one request per planned chunk in
+        # parallel. Chunks that fail are skipped so a single error doesn't lose
+        # the whole run
+        failed = 0
+        for partial in _iter_concurrently(
+            generate,
+            (
+                chunk
+                for chunk in iter_chunks(filepath)
+                if chunk.index in plan.allocations
+            ),
+            max_workers,
+        ):
+            if partial is None:
+                failed += 1
+                continue
+            new_questions = _new_open_questions(
+                accepted, partial, number_of_open_questions
             )
+            if len(new_questions) > 0:
+                if use_store:
+                    question_store.add(document, new_questions)
+                yield new_questions
+        if len(accepted) == 0 and failed == len(plan.allocations):
+            raise RuntimeError("Question generation failed for every chunk")
+
+        # Ask other chunks for the questions the LLM didn't return
+        used_chunks.update(plan.allocations)
+        shortfall = number_of_open_questions - len(accepted)
+        if shortfall <= 0:
+            break
+        plan = plan_questions(chunk_tokens, shortfall, exclude=used_chunks)
+        if len(plan.allocations) == 0:
+            plan = plan_questions(chunk_tokens, shortfall)
+        _record_plan("open", plan, missing=shortfall)
 
-            count += 1
 
+def get_open_questions(
+    number_of_open_questions,
+    number_of_variations=0,
+    max_workers=MAX_CONCURRENT_REQUESTS,
+    filepath=CONTENT_FILEPATH,
+    plan_callback: Callable[[QuestionPlan], None] = None,
+    progress_callback: Callable[[int, int], None] = None,
+    use_store: bool = True,
+) -> List[Question]:
+    """
+    Generate open questions about a document
+    Takes the same arguments as iter_open_questions
+    :return: List of questions, exactly number_of_open_questions unless the LLM
+        couldn't generate enough of them
+    """
+    questions = []
+    for partial in iter_open_questions(
+        number_of_open_questions,
+        number_of_variations,
+        max_workers=max_workers,
+        filepath=filepath,
+        plan_callback=plan_callback,
+        progress_callback=progress_callback,
+        use_store=use_store,
+    ):
+        questions += partial
     return questions
 
 
-def _get_variations(question, number_of_variations) -> Question:
-    prompt = prepare_prompt_variation_question(question, number_of_variations)
-    response = complete_text(prompt, False)
-    custom_functions = open_questions_func_definition()
-    response = complete_text(response, True, custom_functions)
-    variations = json.loads(response["arguments"])["questions"].split("#")
-    return variations
+def _repair_mc_response(
+    response: str, number_of_answers: int
+) -> Tuple[MCParseResult, int]:
+    """
+    Ask the LLM to extract the questions of a response that couldn't be fully
+    parsed, which is cheaper than generating them again from the chunk
+    :param response: Response with the questions
+    :param number_of_answers: Number of answers of each question
+    :return: Questions extracted and number of tokens used by the request
+    """
+    prompt = prepare_prompt_extract_multiple_choice(response)
+    response = complete_text(prompt, True, mc_questions_func_definition(), task="parse")
+    result = parse_mc_response(response["arguments"], number_of_answers)
+    result.method = "repair"
+    return result, count_tokens(prompt) + count_tokens(response["arguments"])
 
 
-def _build_questions(questions, number_of_variations: int) -> List[Question]:
-    result_questions = []
-    i = 0
-    for question in questions:
-        if number_of_variations:
-            variations = _get_variations(question, number_of_variations)
+def _generate_mc_questions(
+    chunk: Chunk, number_of_questions: int, number_of_answers: int
+) -> Tuple[List[Question], int]:
+    """
+    Generate multiple choice questions for a single chunk of the document
+    The response is a function call validated against the schema of the
+    questions, and responses that can't be fully parsed are repaired with the
+    parse task instead of asking the chunk again
+    :param chunk: Chunk the questions should be about
+    :param number_of_questions: Number of questions to ask for
+    :param number_of_answers: Number of answers of each question
+    :return: List of questions and number of tokens used by the requests
+    """
+    prompt = prepare_prompt_multiple_choice(
+        chunk.text, number_of_questions, number_of_answers
+    )
+    custom_function = mc_questions_func_definition()
+    with stage("generate", question_type="mc", questions=number_of_questions):
+        response = complete_text(prompt, True, custom_function, task="mc")
+    tokens = count_tokens(prompt) + count_tokens(response["arguments"])
+    result = parse_mc_response(response["arguments"], number_of_answers)
+    record_mc_parse(result.method, len(result.questions), result.discarded)
+    incomplete = result.discarded > 0 or len(result.questions) == 0
+    if MC_REPAIR_RESPONSES and incomplete and response["arguments"].strip():
+        try:
+            repaired, repair_tokens = _repair_mc_response(
+                response["arguments"], number_of_answers
+            )
+        except Exception as ex:
+            record_mc_parse("repair", 0, 0)
+            record_event("mc_repair_failed", error=str(ex))
         else:
-            variations = []
-        q = Question(i, question, QuestionType.OPEN, variations=variations)
-        result_questions.append(q)
-        i += 1
-    return result_questions
+            tokens += repair_tokens
+            record_mc_parse(
+                repaired.method, len(repaired.questions), repaired.discarded
+            )
+            if len(repaired.questions) > len(result.questions):
+                result = repaired
+    for question in result.questions:
+        question.chunk = chunk.index
+    return result.questions, tokens
 
 
-def get_open_questions(
-    number_of_open_questions, number_of_variations=0
+def _move_catch_all_answers(question: Question):
+    """
+    Put the answers that refer to the other ones at the end
+    :param question: Multiple choice question, changed in place
+    """
+    for answer in ("None of the above", "All of the above"):
+        if answer in question.answers:
+            question.answers.remove(answer)
+            question.answers.append(answer)
+
+
+def _new_mc_questions(
+    seen: Set[str], questions: List[Question], count: int, number_of_questions: int
 ) -> List[Question]:
-    if number_of_open_questions == 0:
-        return []
-    texts = load_and_split_doc()
-    questions_per_page = math.ceil(number_of_open_questions / len(texts))
-    questions = []
-    # Create questions from text with llm
-    for content in texts:
-        prompt = prepare_prompt_open_question(content, questions_per_page)
-        custom_function = open_questions_func_definition()
-        response = complete_text(prompt, True, custom_function)
-        partial_questions = json.loads(response["arguments"])["questions"].split("#")
-        questions += partial_questions
-
-    # Build question objects
-    result_questions = _build_questions(questions, number_of_variations)
-    return result_questions
+    """
+    Keep the questions of a chunk that weren't generated before
+    :param seen: Hashes of the questions accepted so far, extended in place
+    :param questions: Questions of the chunk
+    :param count: Number of questions accepted so far, the new ones are
+        numbered after them
+    :param number_of_questions: Total number of questions wanted
+    :return: New questions
+    """
+    new_questions = []
+    for question in questions:
+        key = question_hash(question.question)
+        if key not in seen and count + len(new_questions) < number_of_questions:
+            seen.add(key)
+            question.id = count + len(new_questions)
+            _move_catch_all_answers(question)
+            new_questions.append(question)
+    return new_questions
+
+
+def iter_mc_questions(
+    number_of_mc_questions,
+    number_of_answers,
+    max_workers=MAX_CONCURRENT_REQUESTS,
+    filepath=CONTENT_FILEPATH,
+    max_attempts=MC_MAX_ATTEMPTS,
+    max_tokens=MC_MAX_TOKENS,
+    progress_callback: Callable[[int, int], None] = None,
+    use_store: bool = True,
+) -> Iterator[List[Question]]:
+    """
+    Generate multiple choice questions about a document, yielding the questions
+    of each chunk as soon as they are ready
+    Questions stored for the document by previous runs are yielded first.
+    Requests for different chunks are sent in parallel and repeated questions
+    are discarded locally. Generation stops when the questions are complete or
+    when max_attempts requests or max_tokens tokens were spent
+    :param number_of_mc_questions: Number of questions to generate
+    :param number_of_answers: Number of answers of each question
+    :param max_workers: Maximum number of LLM requests sent at the same time
+    :param filepath: Path of the pdf
+    :param max_attempts: Maximum number of LLM requests
+    :param max_tokens: Maximum number of tokens sent to and generated by the LLM
+    :param progress_callback: Called with the number of chunks done and the
+        total number of chunks every time a chunk is done
+    :param use_store: Whether to reuse and store questions in the question store
+    :return: Iterator of lists of questions, fewer than requested in total if
+        the budget ran out
+    """
+    if number_of_mc_questions == 0:
+        return
+    document = file_hash(filepath)
+    stored = []
+    if use_store:
+        stored = question_store.get(
+            document,
+            QuestionType.MULTIPLE_CHOICE,
+            number_of_mc_questions,
+            number_of_answers=number_of_answers,
+        )
+        record_reused_questions("mc", len(stored))
+        if len(stored) > 0:
+            yield stored
+        if len(stored) == number_of_mc_questions:
+            return
+
+    chunk_tokens = [chunk.tokens for chunk in iter_chunks(filepath)]
+    count = len(stored)
+    seen = {question_hash(question.question) for question in stored}
+    # Ask the chunks without stored questions first
+    used_chunks = {question.chunk for question in stored}
+    attempts = 0
+    tokens = 0
+    done = 0
+    while count < number_of_mc_questions:
+        missing = number_of_mc_questions - count
+        plan = plan_questions(chunk_tokens, missing, exclude=used_chunks)
+        if len(plan.allocations) == 0:
+            used_chunks = set()
+            plan = plan_questions(chunk_tokens, missing)
+
+        # Keep the requests of this round within the remaining budget
+        allocations = {}
+        estimated_tokens = tokens
+        for index, allocation in plan.allocations.items():
+            estimated_tokens += chunk_tokens[index] + PROMPT_OVERHEAD_TOKENS
+            if attempts + len(allocations) >= max_attempts or (
+                estimated_tokens > max_tokens
+            ):
+                break
+            allocations[index] = allocation
+        if len(allocations) == 0:
+            record_event(
+                "budget_exhausted",
+                attempts=attempts,
+                tokens=tokens,
+                number_of_questions=count,
+                requested_questions=number_of_mc_questions,
+            )
+            break
+
+        total = done + len(allocations)
+        attempts += len(allocations)
+        used_chunks.update(allocations)
+        if progress_callback is not None:
+            progress_callback(done, total)
+        for result in _iter_concurrently(
+            lambda chunk: _generate_mc_questions(
+                chunk, allocations[chunk.index], number_of_answers
+            ),
+            (chunk for chunk in iter_chunks(filepath) if chunk.index in allocations),
+            max_workers,
+        ):
+            done += 1
+            if progress_callback is not None:
+                progress_callback(done, total)
+            if result is None:
+                continue
+            partial_questions, request_tokens = result
+            tokens += request_tokens
+            new_questions = _new_mc_questions(
+                seen, partial_questions, count, number_of_mc_questions
+            )
+            count += len(new_questions)
+            if len(new_questions) > 0:
+                if use_store:
+                    question_store.add(document, new_questions)
+                yield new_questions
 
 
 def get_mc_questions(
-    content, number_of_mc_questions, number_of_answers
+    number_of_mc_questions,
+    number_of_answers,
+    max_workers=MAX_CONCURRENT_REQUESTS,
+    filepath=CONTENT_FILEPATH,
+    max_attempts=MC_MAX_ATTEMPTS,
+    max_tokens=MC_MAX_TOKENS,
+    progress_callback: Callable[[int, int], None] = None,
+    use_store: bool = True,
 ) -> List[Question]:
+    """
+    Generate multiple choice questions about a document
+    Takes the same arguments as iter_mc_questions
+    :return: List of questions, fewer than requested if the budget ran out
+    """
     questions = []
-    count = 0
-    current_questions = []
-    if number_of_mc_questions == 0:
-        return []
-    while count < number_of_mc_questions:
-        number_of_questions = number_of_mc_questions - count
-        prompt = prepare_prompt_multiple_choice(
-            content, current_questions, number_of_questions, number_of_answers
-        )
-        response = complete_text(prompt)
-        result = _response_to_mc_questions(response, count)
-        if len(result) == 0:
-            continue
-        questions.extend(result)
-        current_questions = list(map(lambda x: x.question, result))
-        count = len(questions)
+    for partial in iter_mc_questions(
+        number_of_mc_questions,
+        number_of_answers,
+        max_workers=max_workers,
+        filepath=filepath,
+        max_attempts=max_attempts,
+        max_tokens=max_tokens,
+        progress_callback=progress_callback,
+        use_store=use_store,
+    ):
+        questions += partial
+    return questions
 
-    questions = questions[:number_of_mc_questions]
 
-    # put at the end
-    for question in questions:
-        if "None of the above" in question.answers:
-            print("None of the above")
-            question.answers.remove("None of the above")
-            question.answers.append("None of the above")
+def _response_to_mixed_questions(
+    arguments: dict,
+) -> Tuple[List[str], List[Question]]:
+    """
+    Convert the arguments of a process_exam function call to questions
+    Multiple choice questions are validated like the ones of
+    _generate_mc_questions, and the invalid ones are skipped
+    :param arguments: Arguments of the function call
+    :return: Texts of the open questions and multiple choice questions
+    """
+    open_questions = [
+        question.strip()
+        for question in arguments.get("open_questions") or []
+        if isinstance(question, str) and question.strip()
+    ]
+    mc_questions = []
+    items = arguments.get("mc_questions") or []
+    for item in items:
+        question = validate_mc_question(item)
+        if question is not None:
+            question.id = len(mc_questions)
+            mc_questions.append(question)
+    record_mc_parse("function", len(mc_questions), len(items) - len(mc_questions))
+    return open_questions, mc_questions
+
+
+def _generate_mixed_questions(
+    chunk: Chunk,
+    number_of_open_questions: int,
+    number_of_mc_questions: int,
+    number_of_answers: int,
+    number_of_variations: int,
+) -> Tuple[List[Question], List[Question]]:
+    """
+    Generate open and multiple choice questions for a single chunk of the
+    document with one function call
+    :param chunk: Chunk the questions should be about
+    :param number_of_open_questions: Number of open questions to ask for
+    :param number_of_mc_questions: Number of multiple choice questions to ask for
+    :param number_of_answers: Number of answers of each multiple choice question
+    :param number_of_variations: Number of variations of each open question
+    :return: Open questions and multiple choice questions
+    """
+    prompt = prepare_prompt_mixed_questions(
+        chunk.text, number_of_open_questions, number_of_mc_questions, number_of_answers
+    )
+    custom_function = mixed_questions_func_definition()
+    with stage(
+        "generate",
+        question_type="mixed",
+        questions=number_of_open_questions + number_of_mc_questions,
+    ):
+        response = complete_text(prompt, True, custom_function, task="generate")
+    open_texts, mc_questions = _response_to_mixed_questions(
+        json.loads(response["arguments"])
+    )
+    open_questions = _build_questions(open_texts, number_of_variations, max_workers=1)
+    for question in open_questions + mc_questions:
+        question.chunk = chunk.index
+    return open_questions, mc_questions
 
-        if "All of the above" in question.answers:
-            print("All of the above")
-            question.answers.remove("All of the above")
-            question.answers.append("All of the above")
 
-    return questions
+def _split_allocations(
+    allocations: Dict[int, int],
+    number_of_open_questions: int,
+    max_questions_per_type: int = MAX_QUESTIONS_PER_CALL,
+) -> Dict[int, Tuple[int, int]]:
+    """
+    Split the questions planned for each chunk between open and multiple choice
+    questions, in about the same proportion in every chunk
+    A chunk gets at most max_questions_per_type questions of each type, what
+    doesn't fit goes to other chunks, and what doesn't fit in any is left for
+    the next round
+    :param allocations: Number of questions by chunk index
+    :param number_of_open_questions: How many of them are open questions
+    :param max_questions_per_type: Maximum number of questions of each type
+        asked for in a single call
+    :return: Number of open and multiple choice questions by chunk index
+    """
+    total = sum(allocations.values())
+    split = {}
+    planned = planned_open = planned_mc = 0
+    for index, allocation in allocations.items():
+        planned += allocation
+        open_target = planned * number_of_open_questions // total
+        number_of_open = min(open_target - planned_open, max_questions_per_type)
+        number_of_mc = min(planned - open_target - planned_mc, max_questions_per_type)
+        planned_open += number_of_open
+        planned_mc += number_of_mc
+        split[index] = [number_of_open, number_of_mc]
+    # The last chunks can't take what the previous ones couldn't, give it to
+    # any chunk with room left
+    missing = [
+        number_of_open_questions - planned_open,
+        total - number_of_open_questions - planned_mc,
+    ]
+    for numbers in split.values():
+        for question_type in (0, 1):
+            added = min(
+                missing[question_type], max_questions_per_type - numbers[question_type]
+            )
+            numbers[question_type] += added
+            missing[question_type] -= added
+    return {index: tuple(numbers) for index, numbers in split.items()}
+
+
+def iter_questions(
+    number_of_open_questions,
+    number_of_mc_questions,
+    number_of_answers,
+    number_of_variations=0,
+    max_workers=MAX_CONCURRENT_REQUESTS,
+    filepath=CONTENT_FILEPATH,
+    plan_callback: Callable[[QuestionPlan], None] = None,
+    progress_callback: Callable[[int, int], None] = None,
+    use_store: bool = True,
+) -> Iterator[Tuple[List[Question], List[Question]]]:
+    """
+    Generate the open and multiple choice questions of a mixed exam together,
+    yielding the questions of each chunk as soon as they are ready
+    Both types of questions are asked for in a single function call per chunk,
+    so every chunk is sent once instead of once for each type. Questions stored
+    for the document by previous runs are yielded first
+    :param number_of_open_questions: Number of open questions to generate
+    :param number_of_mc_questions: Number of multiple choice questions to generate
+    :param number_of_answers: Number of answers of each multiple choice question
+    :param number_of_variations: Number of variations for each open question
+    :param max_workers: Maximum number of LLM requests sent at the same time
+    :param filepath: Path of the pdf
+    :param plan_callback: Called with the generation plan before any request is sent
+    :param progress_callback: Called with the number of chunks done and the
+        total number of chunks every time a chunk is done
+    :param use_store: Whether to reuse and store questions in the question store
+    :return: Iterator of pairs of lists of open and multiple choice questions,
+        fewer than requested in total if the LLM couldn't generate enough of them
+    """
+    document = file_hash(filepath)
+    stored_open, stored_mc = [], []
+    if use_store:
+        stored_open = question_store.get(
+            document,
+            QuestionType.OPEN,
+            number_of_open_questions,
+            number_of_variations=number_of_variations,
+        )
+        stored_mc = question_store.get(
+            document,
+            QuestionType.MULTIPLE_CHOICE,
+            number_of_mc_questions,
+            number_of_answers=number_of_answers,
+        )
+        record_reused_questions("open", len(stored_open))
+        record_reused_questions("mc", len(stored_mc))
+        if len(stored_open) > 0 or len(stored_mc) > 0:
+            yield stored_open, stored_mc
+
+    accepted = DuplicateIndex()
+    accepted.add([question.question for question in stored_open])
+    seen = {question_hash(question.question) for question in stored_mc}
+    count = len(stored_mc)
+    chunk_tokens = [chunk.tokens for chunk in iter_chunks(filepath)]
+    # Ask the chunks without stored questions first
+    used_chunks = {question.chunk for question in stored_open + stored_mc}
+    progress = {"done": 0, "total": 0}
+    progress_lock = threading.Lock()
+
+    def generate(chunk):
+        try:
+            return _generate_mixed_questions(
+                chunk,
+                *allocations[chunk.index],
+                number_of_answers,
+                number_of_variations,
+            )
+        finally:
+            with progress_lock:
+                progress["done"] += 1
+                done, total = progress["done"], progress["total"]
+            if progress_callback is not None:
+                progress_callback(done, total)
+
+    for round_number in range(MAX_PLAN_ROUNDS):
+        missing_open = max(0, number_of_open_questions - len(accepted))
+        missing_mc = max(0, number_of_mc_questions - count)
+        if missing_open + missing_mc == 0:
+            break
+        # A call asks for up to MAX_QUESTIONS_PER_CALL questions of each type,
+        # so the type with more questions sets the number of calls
+        calls = math.ceil(max(missing_open, missing_mc) / MAX_QUESTIONS_PER_CALL)
+        max_questions_per_call = math.ceil((missing_open + missing_mc) / calls)
+        plan = plan_questions(
+            chunk_tokens,
+            missing_open + missing_mc,
+            max_questions_per_call=max_questions_per_call,
+            exclude=used_chunks,
+        )
+        if len(plan.allocations) == 0:
+            plan = plan_questions(
+                chunk_tokens,
+                missing_open + missing_mc,
+                max_questions_per_call=max_questions_per_call,
+            )
+        _record_plan("mixed", plan, missing=missing_open + missing_mc)
+        if round_number == 0 and plan_callback is not None:
+            plan_callback(plan)
+        allocations = _split_allocations(plan.allocations, missing_open)
+
+        with progress_lock:
+            progress["total"] += len(allocations)
+            done, total = progress["done"], progress["total"]
+        if progress_callback is not None:
+            progress_callback(done, total)
+        # One request per planned chunk in parallel, chunks that fail are skipped
+        failed = 0
+        for partial in _iter_concurrently(
+            generate,
+            (chunk for chunk in iter_chunks(filepath) if chunk.index in allocations),
+            max_workers,
+        ):
+            if partial is None:
+                failed += 1
+                continue
+            open_questions, mc_questions = partial
+            new_open = _new_open_questions(
+                accepted, open_questions, number_of_open_questions
+            )
+            new_mc = _new_mc_questions(
+                seen, mc_questions, count, number_of_mc_questions
+            )
+            count += len(new_mc)
+            if len(new_open) > 0 or len(new_mc) > 0:
+                if use_store:
+                    question_store.add(document, new_open + new_mc)
+                yield new_open, new_mc
+        if len(accepted) == 0 and count == 0 and failed == len(allocations):
+            raise RuntimeError("Question generation failed for every chunk")
+        # Ask other chunks for the questions the LLM didn't return
+        used_chunks.update(allocations)
+
+
+def get_questions(
+    number_of_open_questions,
+    number_of_mc_questions,
+    number_of_answers,
+    number_of_variations=0,
+    max_workers=MAX_CONCURRENT_REQUESTS,
+    filepath=CONTENT_FILEPATH,
+    plan_callback: Callable[[QuestionPlan], None] = None,
+    progress_callback: Callable[[int, int], None] = None,
+    use_store: bool = True,
+) -> Tuple[List[Question], List[Question]]:
+    """
+    Generate the open and multiple choice questions of a mixed exam together
+    Takes the same arguments as iter_questions
+    :return: Lists of open and multiple choice questions
+    """
+    open_questions, mc_questions = [], []
+    for open_partial, mc_partial in iter_questions(
+        number_of_open_questions,
+        number_of_mc_questions,
+        number_of_answers,
+        number_of_variations,
+        max_workers=max_workers,
+        filepath=filepath,
+        plan_callback=plan_callback,
+        progress_callback=progress_callback,
+        use_store=use_store,
+    ):
+        open_questions += open_partial
+        mc_questions += mc_partial
+    return open_questions, mc_questions
 
 
 def clarify_question(question: Question) -> str:
@@ -173,24 +871,56 @@ def clarify_question(question: Question) -> str:
         f"Why the correct answer is {chr(ord('a') + question.correct_answers)}?\n\n"
     )
 
-    return complete_text(prompt)
+    return complete_text(prompt, task="clarify")
+
+
+def _question_chunks(questions: Union[List[Question], QuestionBank]) -> List[int]:
+    if isinstance(questions, QuestionBank):
+        return [chunk if chunk >= 0 else None for chunk in questions.chunks.tolist()]
+    return [question.chunk for question in questions]
 
 
 def generate_exams(
-    open_questions: List[Question],
+    open_questions: Union[List[Question], QuestionBank],
     number_of_open: int,
     number_of_exams: int,
+    mc_questions: Union[List[Question], QuestionBank] = None,
+    number_of_mc: int = 0,
+    max_overlap: int = None,
+    seed: int = None,
 ) -> Dict[str, List[Question]]:
-    open_q_split = []
-    if len(open_questions) > 0:
-        # assumption: number of questions small and exams small enough
-        open_q = random.sample(open_questions, number_of_open * number_of_exams)
-        open_q_split = np.array_split(open_q, number_of_exams)
-    exams = {}
-    for i in range(0, number_of_exams):
-        title = f"exam_{i+1}"
-        if len(open_q_split) > 0:
-            exams[title] = open_q_split[i].tolist()
-        else:
-            exams[title] = []
-    return exams
+    """
+    Assemble exams from the generated questions, reusing questions across exams
+    when there aren't enough for all of them
+    :param open_questions: Bank of open questions, a list or a QuestionBank
+    :param number_of_open: Number of open questions of each exam
+    :param number_of_exams: Number of exams
+    :param mc_questions: Bank of multiple choice questions
+    :param number_of_mc: Number of multiple choice questions of each exam
+    :param max_overlap: Maximum number of questions any two exams can share
+    :param seed: Seed to assemble the same exams again
+    :return: Questions of each exam, the open ones first
+    """
+    pools = [
+        (questions, size if questions else 0)
+        for questions, size in (
+            (open_questions, number_of_open),
+            (mc_questions, number_of_mc),
+        )
+    ]
+    with stage("assemble", exams=number_of_exams):
+        indexes = assemble_exams(
+            [_question_chunks(questions or []) for questions, _ in pools],
+            [size for _, size in pools],
+            number_of_exams,
+            max_overlap=max_overlap,
+            seed=seed,
+        )
+        exams = {}
+        for i in range(number_of_exams):
+            exams[f"exam_{i+1}"] = [
+                questions[index]
+                for (questions, _), pool_indexes in zip(pools, indexes)
+                for index in pool_indexes[i]
+            ]
+        return exams
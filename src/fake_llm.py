@@ -0,0 +1,210 @@
+"""
+    Deterministic stand-in for the chat model, used by benchmarks and local runs
+    without the OpenAI API
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from langchain.chat_models.base import BaseChatModel
+from langchain.pydantic_v1 import PrivateAttr
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
+from openai.error import RateLimitError
+
+_NUMBER_OF_QUESTIONS = re.compile(r"Create (\d+) different questions")
+_MULTIPLE_CHOICE = re.compile(r"with (\d+) questions and (\d+) different choices")
+_MIXED_QUESTIONS = re.compile(
+    r"with (\d+) different open questions and (\d+) different multiple choice "
+    r"questions with (\d+) different choices"
+)
+_NUMBER_OF_VARIATIONS = re.compile(r"Create (\d+) variations")
+_NUMBERED_QUESTION = re.compile(r"^(\d+)\. (.+)$", re.MULTILINE)
+_TEXT = re.compile(r"following text:?(.*)", re.DOTALL)
+_WORD = re.compile(r"[A-Za-z]{4,}")
+
+_FALLBACK_WORDS = ["course", "topic", "concept", "example", "process", "result"]
+# Prompts whose attempts are counted, the least recently sent are forgotten
+_MAX_TRACKED_PROMPTS = 10000
+
+
+def _approximate_tokens(text: str) -> int:
+    # About 4 characters per token in English, good enough for accounting
+    return max(1, len(text) // 4)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering the prompts of src.prompts with well-formed, made up
+    questions built from the words of the prompt
+    The same prompt always gets the same response. Latency, jitter and errors
+    are simulated, and the token usage is reported like the OpenAI API does
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    seed: int = 0
+
+    # Attempts of each prompt, by the hash of the prompt
+    _calls: Dict[str, int] = PrivateAttr(default_factory=OrderedDict)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = "\n".join(message.content for message in messages)
+        prompt_hash = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            attempt = self._calls.pop(prompt_hash, 0)
+            self._calls[prompt_hash] = attempt + 1
+            if len(self._calls) > _MAX_TRACKED_PROMPTS:
+                self._calls.popitem(last=False)
+        # Errors depend on the attempt too, so retrying a prompt can succeed
+        error_random = random.Random(f"{self.seed}:{attempt}:{prompt}")
+        time.sleep(
+            max(0.0, self.latency + error_random.uniform(-self.jitter, self.jitter))
+        )
+        if error_random.random() < self.error_rate:
+            raise RateLimitError("Fake rate limit error")
+
+        rng = random.Random(f"{self.seed}:{prompt}")
+        functions = kwargs.get("functions") or []
+        if functions:
+            arguments = self._function_arguments(functions[0]["name"], prompt, rng)
+            message = AIMessage(
+                content="",
+                additional_kwargs={
+                    "function_call": {
+                        "name": functions[0]["name"],
+                        "arguments": json.dumps(arguments),
+                    }
+                },
+            )
+            completion = json.dumps(arguments)
+        else:
+            completion = self._text(prompt, rng)
+            message = AIMessage(content=completion)
+
+        token_usage = {
+            "prompt_tokens": _approximate_tokens(prompt),
+            "completion_tokens": _approximate_tokens(completion),
+        }
+        token_usage["total_tokens"] = sum(token_usage.values())
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": token_usage, "model_name": self._llm_type},
+        )
+
+    def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
+        token_usage = {}
+        for output in llm_outputs:
+            for name, value in (output or {}).get("token_usage", {}).items():
+                token_usage[name] = token_usage.get(name, 0) + value
+        return {"token_usage": token_usage, "model_name": self._llm_type}
+
+    @staticmethod
+    def _words(prompt: str) -> List[str]:
+        match = _TEXT.search(prompt)
+        words = _WORD.findall(match.group(1) if match else prompt)
+        return [word.lower() for word in words] or _FALLBACK_WORDS
+
+    def _question(self, words: List[str], rng: random.Random) -> str:
+        subject, *others = rng.sample(words * 3, 4)
+        return f"How does {subject} relate to {' and '.join(others)}?"
+
+    def _function_arguments(
+        self, name: str, prompt: str, rng: random.Random
+    ) -> Dict[str, Any]:
+        if name == "process_questions":
+            match = _NUMBER_OF_QUESTIONS.search(prompt)
+            number_of_questions = int(match.group(1)) if match else 1
+            words = self._words(prompt)
+            questions = [self._question(words, rng) for _ in range(number_of_questions)]
+            return {"questions": "#".join(questions)}
+        if name == "process_exam":
+            match = _MIXED_QUESTIONS.search(prompt)
+            number_of_open, number_of_mc, number_of_answers = (
+                map(int, match.groups()) if match else (1, 1, 4)
+            )
+            words = self._words(prompt)
+            return {
+                "open_questions": [
+                    self._question(words, rng) for _ in range(number_of_open)
+                ],
+                "mc_questions": [
+                    {
+                        "question": self._question(words, rng),
+                        "answers": [
+                            " ".join(rng.sample(words * 2, 3))
+                            for _ in range(number_of_answers)
+                        ],
+                        "correct_answers": [rng.randrange(max(1, number_of_answers))],
+                    }
+                    for _ in range(number_of_mc)
+                ],
+            }
+        if name == "process_mc_questions":
+            match = _MULTIPLE_CHOICE.search(prompt)
+            number_of_questions, number_of_answers = (
+                map(int, match.groups()) if match else (0, 0)
+            )
+            words = self._words(prompt)
+            return {
+                "questions": [
+                    {
+                        "question": self._question(words, rng),
+                        "answers": [
+                            " ".join(rng.sample(words * 2, 3))
+                            for _ in range(number_of_answers)
+                        ],
+                        "correct_answers": [rng.randrange(max(1, number_of_answers))],
+                    }
+                    for _ in range(number_of_questions)
+                ]
+            }
+        if name == "process_variations":
+            match = _NUMBER_OF_VARIATIONS.search(prompt)
+            number_of_variations = int(match.group(1)) if match else 1
+            return {
+                "variations": [
+                    {
+                        "question_number": int(number),
+                        "variations": [
+                            f"Rephrased ({i + 1}): {question}"
+                            for i in range(number_of_variations)
+                        ],
+                    }
+                    for number, question in _NUMBERED_QUESTION.findall(prompt)
+                ]
+            }
+        return {}
+
+    def _text(self, prompt: str, rng: random.Random) -> str:
+        match = _MULTIPLE_CHOICE.search(prompt)
+        if match is None:
+            return "The answer follows from the text of the course."
+        number_of_questions, number_of_answers = map(int, match.groups())
+        words = self._words(prompt)
+        questions = []
+        for i in range(number_of_questions):
+            correct = rng.randrange(max(1, number_of_answers))
+            lines = [f"{i + 1}. {self._question(words, rng)}"]
+            for j in range(number_of_answers):
+                marker = "Correct: " if j == correct else ""
+                answer = " ".join(rng.sample(words * 2, 3))
+                lines.append(f"{chr(ord('a') + j)}) {marker}{answer}")
+            questions.append("\n".join(lines))
+        return "\n\n".join(questions)
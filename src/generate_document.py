@@ -1,30 +1,105 @@
-import copy
+import csv
+import io
 import json
 import os
 import subprocess
-from typing import Dict, List
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import get_context
+from typing import BinaryIO, Dict, List, Union
 
-from config.cfg import OUTPUT_FOLDER
+from config.cfg import OUTPUT_FOLDER, RENDER_WORKERS
 from model.question import Question
+from src.telemetry import stage
 
-TEMP_MD_FILE = "__temp.md"
-TEMP_PDF_FILE = "__temp.pdf"
+# Render in the calling process instead of the pool of render processes
+_render_in_process = False
 
 
-def _markdown_to_pdf(markdown: str, output_file: str):
+def _reset_mdpdf():
     """
-    Convert Markdown to PDF
+    Reset the module globals mdpdf keeps between renders: the page number,
+    section and dates of the header, footer and metadata, and the stack of
+    styles with the font sizes, left unbalanced by a render that failed
+    """
+    import datetime
+
+    import fitz
+    from mdpdf import properties, style
+
+    properties.page = 1
+    properties.heading = ""
+    properties.date = datetime.datetime.now().date()
+    properties.document["creationDate"] = fitz.get_pdf_now()
+    properties.document["modDate"] = fitz.get_pdf_now()
+    properties.setPaperSize("A4")
+    style._styleList.clear()
+    style._styleNumber = 0
+
+
+def _markdown_to_pdf(markdown: str, output_filepath: str):
+    """
+    Convert Markdown to PDF in the current process
+    mdpdf keeps the page state in module globals, so it must not be called
+    from several threads of the same process at once
     :param markdown: Markdown string
-    :param output_file: Output file
+    :param output_filepath: Output file path
     """
-    with open(TEMP_MD_FILE, "w") as f:
-        f.write(markdown)
-    output_filepath = OUTPUT_FOLDER + "/" + output_file
-    subprocess.run(
-        ["mdpdf", TEMP_MD_FILE, "--output", output_filepath, "--paper", "A4"]
-    )
+    import commonmark
+    from mdpdf import properties
+    from mdpdf.pdf_renderer import PdfRenderer
+
+    _reset_mdpdf()
+    renderer = PdfRenderer(output_filepath)
+    # mdpdf saves the document when the renderer is released, so it's taken
+    # from the renderer to save it here, or to drop it if the render fails
+    document = renderer.doc
+    try:
+        renderer.render(commonmark.Parser().parse(markdown), output_filepath)
+        document.set_toc(renderer.toc)
+        document.set_metadata(properties.document)
+        document.save(output_filepath, garbage=4, deflate=True)
+    finally:
+        del renderer.doc
+        document.close()
+
 
-    os.remove(TEMP_MD_FILE)
+def _markdown_to_pdf_cli(markdown: str, output_filepath: str):
+    """
+    Convert Markdown to PDF running the mdpdf command in a new process
+    :param markdown: Markdown string
+    :param output_filepath: Output file path
+    """
+    with tempfile.TemporaryDirectory() as temp_folder:
+        temp_md_file = os.path.join(temp_folder, "exams.md")
+        with open(temp_md_file, "w") as f:
+            f.write(markdown)
+        subprocess.run(
+            ["mdpdf", temp_md_file, "--output", output_filepath, "--paper", "A4"]
+        )
+
+
+def set_render_in_process(enabled: bool):
+    """
+    Render the PDF files in the calling process, for worker processes like the
+    ones of the batch command, which can't wait for a pool of their own when
+    they exit. Only for processes that render one document at a time, because
+    mdpdf can't be called from several threads at once
+    :param enabled: Whether exams2pdf renders in this process
+    """
+    global _render_in_process
+    _render_in_process = enabled
+
+
+@lru_cache(maxsize=None)
+def _get_render_pool() -> ProcessPoolExecutor:
+    # The workers are kept alive so that every render doesn't pay a process spawn
+    # Spawned, so the workers don't inherit the threads and locks of the
+    # caller, like the ones of the app or the LLM clients
+    return ProcessPoolExecutor(
+        max_workers=max(1, RENDER_WORKERS), mp_context=get_context("spawn")
+    )
 
 
 def _generate_markdown(questions: List[Question]) -> str:
@@ -38,23 +113,223 @@ def _generate_markdown(questions: List[Question]) -> str:
     return markdown
 
 
-def exams2pdf(exams: Dict[str, List[Question]], output_file: str):
-    content = ""
-    for i, exam in enumerate(exams):
-        content += f"# Exam {i+1}\n\n"
-        questions = exams[exam]
-        if len(questions) > 0:
-            content += _generate_markdown(questions)
-            content += "\n"
-    _markdown_to_pdf(content, output_file)
-
-
-def exams2json(exams: Dict[str, List[Question]], output_file: str):
-    # Open the file in write mode and use json.dump() to write the dictionary to the file
-    exams_copy = copy.deepcopy(exams)
-    for exam in exams_copy:
-        exams_copy[exam] = list(map(lambda q: q.to_serializable(), exams_copy[exam]))
-    output_filepath = OUTPUT_FOLDER + "/" + output_file
-    with open(output_filepath, "w") as json_file:
-        json.dump(exams_copy, json_file)
+def _generate_exam_markdown(title: str, questions: List[Question]) -> str:
+    content = f"# {title}\n\n"
+    if len(questions) > 0:
+        content += _generate_markdown(questions)
+        content += "\n"
+    return content
+
+
+def exams2pdf(
+    exams: Dict[str, List[Question]],
+    output_file: str,
+    output_folder: str = OUTPUT_FOLDER,
+    merge: bool = True,
+) -> List[str]:
+    """
+    Render exams as PDF files in the pool of render processes
+    :param exams: Questions of each exam
+    :param output_file: Name of the output file
+    :param output_folder: Folder where the files are written
+    :param merge: Whether to write all the exams to output_file or one file per
+        exam, named after output_file and the exam
+    :return: Paths of the generated files
+    """
+    with stage("render", format="pdf", exams=len(exams)):
+        markdowns = [
+            _generate_exam_markdown(f"Exam {i+1}", exams[exam])
+            for i, exam in enumerate(exams)
+        ]
+        if merge:
+            filepaths = [os.path.join(output_folder, output_file)]
+            markdowns = ["".join(markdowns)]
+        else:
+            name, extension = os.path.splitext(output_file)
+            filepaths = [
+                os.path.join(output_folder, f"{name}_{exam}{extension}")
+                for exam in exams
+            ]
+
+        if _render_in_process:
+            for markdown, filepath in zip(markdowns, filepaths):
+                _markdown_to_pdf(markdown, filepath)
+            return filepaths
+
+        pool = _get_render_pool()
+        futures = [
+            pool.submit(_markdown_to_pdf, markdown, filepath)
+            for markdown, filepath in zip(markdowns, filepaths)
+        ]
+        for future in futures:
+            future.result()
+        return filepaths
+
+
+class _ExamWriter:
+    """
+    Base class of the writers of the export formats, questions are received
+    one at a time in exam order
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def begin_exam(self, exam: str):
+        pass
+
+    def write(self, exam: str, number: int, question: dict):
+        pass
+
+    def end_exam(self, exam: str):
+        pass
+
+    def close(self):
+        pass
+
+
+class _JsonWriter(_ExamWriter):
+    """
+    JSON object with the list of questions of each exam
+    """
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.stream.write("{")
+        self.first_exam = True
+
+    def begin_exam(self, exam):
+        self.stream.write(f"{'' if self.first_exam else ', '}{json.dumps(exam)}: [")
+        self.first_exam = False
+
+    def write(self, exam, number, question):
+        self.stream.write(f"{'' if number == 1 else ', '}{json.dumps(question)}")
+
+    def end_exam(self, exam):
+        self.stream.write("]")
+
+    def close(self):
+        self.stream.write("}")
+
+
+class _JsonLinesWriter(_ExamWriter):
+    """
+    One JSON object per line for each question, including its exam and number
+    """
+
+    def write(self, exam, number, question):
+        self.stream.write(json.dumps({"exam": exam, "number": number, **question}))
+        self.stream.write("\n")
+
+
+class _CsvWriter(_ExamWriter):
+    """
+    One row per question, lists are joined with |
+    """
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.writer = csv.writer(stream)
+        self.writer.writerow(
+            [
+                "exam",
+                "number",
+                "id",
+                "question_type",
+                "question",
+                "answers",
+                "correct_answers",
+                "variations",
+            ]
+        )
+
+    def write(self, exam, number, question):
+        self.writer.writerow(
+            [
+                exam,
+                number,
+                question["id"],
+                question["question_type"],
+                question["question"],
+                " | ".join(question["answers"]),
+                " | ".join(map(str, question["correct_answers"])),
+                " | ".join(question["variations"]),
+            ]
+        )
+
+
+class _AnswerKeyWriter(_ExamWriter):
+    """
+    Letters of the correct answers of each question
+    """
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.writer = csv.writer(stream)
+        self.writer.writerow(["exam", "number", "correct_answers"])
+
+    def write(self, exam, number, question):
+        letters = [chr(ord("A") + index) for index in question["correct_answers"]]
+        self.writer.writerow([exam, number, " ".join(letters)])
+
+
+EXPORT_FORMATS = {
+    "json": _JsonWriter,
+    "jsonl": _JsonLinesWriter,
+    "csv": _CsvWriter,
+    "answer_key": _AnswerKeyWriter,
+}
+
+
+def export_exams(
+    exams: Dict[str, List[Question]], outputs: Dict[str, Union[str, BinaryIO]]
+):
+    """
+    Write the exams to several formats in a single pass over the questions
+    Every question is serialized once and written as soon as it is read, so
+    the exams are never copied
+    :param exams: Questions of each exam
+    :param outputs: Target of each format of EXPORT_FORMATS, either a file path
+        or a binary stream like the io.BytesIO served by a download button
+    """
+    with stage("render", format=",".join(outputs), exams=len(exams)):
+        streams = []
+        writers = []
+        for export_format, target in outputs.items():
+            if isinstance(target, str):
+                stream = open(target, "w", newline="", encoding="utf-8")
+            else:
+                stream = io.TextIOWrapper(target, encoding="utf-8", newline="")
+            streams.append((stream, isinstance(target, str)))
+            writers.append(EXPORT_FORMATS[export_format](stream))
+
+        try:
+            for exam, questions in exams.items():
+                for writer in writers:
+                    writer.begin_exam(exam)
+                for number, question in enumerate(questions, start=1):
+                    record = question.to_dict()
+                    for writer in writers:
+                        writer.write(exam, number, record)
+                for writer in writers:
+                    writer.end_exam(exam)
+            for writer in writers:
+                writer.close()
+        finally:
+            for stream, owned in streams:
+                if owned:
+                    stream.close()
+                else:
+                    # Leave the caller's stream open and ready to be read
+                    stream.flush()
+                    stream.detach().seek(0)
+
+
+def exams2json(
+    exams: Dict[str, List[Question]],
+    output_file: str,
+    output_folder: str = OUTPUT_FOLDER,
+):
+    output_filepath = os.path.join(output_folder, output_file)
+    export_exams(exams, {"json": output_filepath})
     print(f"Exams saved to {output_filepath}")
@@ -0,0 +1,251 @@
+"""
+    Background generation jobs run on a bounded pool of workers
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional
+
+from config.cfg import JOBS_FILEPATH, MAX_CONCURRENT_JOBS
+from model.question import Question
+from src.agent import track_token_usage
+from src.pipeline import TRACE_FILENAME, generate_exam_files
+from src.telemetry import metrics, trace
+
+
+class JobStatus:
+    """
+    Enum for job statuses
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    INTERRUPTED = "interrupted"
+
+
+class JobStore:
+    """
+    Status, progress and results of the jobs stored in SQLite, so they outlive
+    the page that started them
+    """
+
+    def __init__(self, filepath: str = JOBS_FILEPATH):
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(filepath, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, "
+                "progress_done INTEGER NOT NULL DEFAULT 0, "
+                "progress_total INTEGER NOT NULL DEFAULT 0, "
+                "tokens INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, "
+                "created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            # Questions are stored as they are generated, so they can be shown
+            # before the job is done
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS job_questions ("
+                "job_id TEXT NOT NULL, position INTEGER NOT NULL, "
+                "question TEXT NOT NULL, PRIMARY KEY (job_id, position))"
+            )
+            self._connection.commit()
+
+    def create(self, params: dict) -> str:
+        """
+        Store a new pending job
+        :param params: Arguments of the job
+        :return: ID of the job
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO jobs (id, status, params, created, updated) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, JobStatus.PENDING, json.dumps(params), now, now),
+            )
+            self._connection.commit()
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        """
+        Update some fields of a job, result is stored as JSON
+        """
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._connection.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+            self._connection.commit()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        Get a job
+        :param job_id: ID of the job
+        :return: Fields of the job, None if it doesn't exist
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def add_questions(self, job_id: str, questions: List[Question]):
+        """
+        Store questions generated by a job after the ones stored before
+        :param job_id: ID of the job
+        :param questions: Questions to add
+        """
+        with self._lock:
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM job_questions WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            self._connection.executemany(
+                "INSERT INTO job_questions (job_id, position, question) "
+                "VALUES (?, ?, ?)",
+                [
+                    (job_id, count + i, json.dumps(question.to_dict()))
+                    for i, question in enumerate(questions)
+                ],
+            )
+            self._connection.commit()
+
+    def get_questions(self, job_id: str) -> List[Question]:
+        """
+        Get the questions generated by a job so far
+        :param job_id: ID of the job
+        :return: Questions in the order they were added
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT question FROM job_questions WHERE job_id = ? "
+                "ORDER BY position",
+                (job_id,),
+            ).fetchall()
+        return [Question.from_dict(json.loads(row["question"])) for row in rows]
+
+    def clear_questions(self, job_id: str):
+        """
+        Remove the questions stored for a job
+        :param job_id: ID of the job
+        """
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM job_questions WHERE job_id = ?", (job_id,)
+            )
+            self._connection.commit()
+
+    def interrupt_unfinished(self):
+        """
+        Mark the jobs left pending or running by a previous process as interrupted
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET status = ? WHERE status IN (?, ?)",
+                (JobStatus.INTERRUPTED, JobStatus.PENDING, JobStatus.RUNNING),
+            )
+            self._connection.commit()
+
+
+class JobManager:
+    """
+    Run generation jobs in the background, at most max_workers at the same time
+    """
+
+    def __init__(self, store: JobStore, max_workers: int = MAX_CONCURRENT_JOBS):
+        self.store = store
+        self.store.interrupt_unfinished()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+
+    def submit(self, params: dict) -> str:
+        """
+        Queue a generation job
+        :param params: filepath, output_folder and question_args of the job
+        :return: ID of the job
+        """
+        job_id = self.store.create(params)
+        self._executor.submit(self._run, job_id, params)
+        return job_id
+
+    def resume(self, job_id: str):
+        """
+        Queue again a job that failed or was interrupted, cached LLM responses
+        make the work already done cheap to repeat
+        :param job_id: ID of the job
+        """
+        job = self.store.get(job_id)
+        if job is None or job["status"] not in (
+            JobStatus.FAILED,
+            JobStatus.INTERRUPTED,
+        ):
+            return
+        self.store.update(
+            job_id,
+            status=JobStatus.PENDING,
+            progress_done=0,
+            progress_total=0,
+            tokens=0,
+            error=None,
+        )
+        self.store.clear_questions(job_id)
+        self._executor.submit(self._run, job_id, job["params"])
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.store.get(job_id)
+
+    def get_questions(self, job_id: str) -> List[Question]:
+        return self.store.get_questions(job_id)
+
+    def _run(self, job_id: str, params: dict):
+        self.store.update(job_id, status=JobStatus.RUNNING)
+        with trace(job_id) as job_trace:
+            try:
+                with track_token_usage() as usage:
+                    result = generate_exam_files(
+                        params["filepath"],
+                        params["output_folder"],
+                        params["question_args"],
+                        progress_callback=lambda done, total: self.store.update(
+                            job_id,
+                            progress_done=done,
+                            progress_total=total,
+                            tokens=sum(usage.values()),
+                        ),
+                        questions_callback=lambda questions: self.store.add_questions(
+                            job_id, questions
+                        ),
+                    )
+                self.store.update(job_id, status=JobStatus.DONE, result=result)
+            except Exception as ex:
+                print(ex)
+                self.store.update(job_id, status=JobStatus.FAILED, error=str(ex))
+        if job_trace is not None:
+            os.makedirs(params["output_folder"], exist_ok=True)
+            job_trace.save(os.path.join(params["output_folder"], TRACE_FILENAME))
+            metrics.write()
+
+
+@lru_cache(maxsize=None)
+def get_job_manager() -> JobManager:
+    """
+    Get the job manager shared by every session of the server
+    """
+    return JobManager(JobStore())
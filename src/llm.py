@@ -1,5 +1,171 @@
-from langchain.chat_models import ChatOpenAI
+"""
+    Chat models of the LLM tasks, created on first use
+"""
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
 
-from config.cfg import MODEL
+from config.cfg import (FAKE_LLM_ERROR_RATE, FAKE_LLM_JITTER, FAKE_LLM_LATENCY,
+                        FAKE_LLM_SEED, LLM_TASK_SETTINGS, LOCAL_LLM_API_BASE,
+                        LOCAL_LLM_MODEL, MODEL, OPENAI_API_BASE, OPENAI_ORG,
+                        OPENAI_TOKEN)
 
-llm = ChatOpenAI(temperature=0, model=MODEL)
+# The model libraries are slow to import, so they are only imported when the
+# first request is sent
+
+
+def _create_openai(model: str, timeout: float):
+    from langchain.chat_models import ChatOpenAI
+
+    # Retries are done by the scheduler of src.agent, within the rate limits
+    return ChatOpenAI(
+        temperature=0,
+        model=model,
+        openai_api_key=OPENAI_TOKEN,
+        openai_organization=OPENAI_ORG,
+        openai_api_base=OPENAI_API_BASE,
+        request_timeout=timeout,
+        max_retries=1,
+    )
+
+
+def _create_local(model: str, timeout: float):
+    from langchain.chat_models import ChatOpenAI
+
+    # llama.cpp and src.local_llm_server serve the OpenAI chat API, and ignore
+    # the key
+    return ChatOpenAI(
+        temperature=0,
+        model=model,
+        openai_api_key="local",
+        openai_api_base=LOCAL_LLM_API_BASE,
+        request_timeout=timeout,
+        max_retries=1,
+    )
+
+
+def _create_fake(model: str, timeout: float):
+    from src.fake_llm import FakeChatModel
+
+    return FakeChatModel(
+        latency=FAKE_LLM_LATENCY,
+        jitter=FAKE_LLM_JITTER,
+        error_rate=FAKE_LLM_ERROR_RATE,
+        seed=FAKE_LLM_SEED,
+    )
+
+
+@dataclass
+class Provider:
+    # Creates a chat model from the name of the model and the timeout
+    factory: Callable[[str, float], Any]
+    # Model used by the tasks that don't set one
+    default_model: str
+    # Whether the requests count towards the rate limits of the OpenAI account
+    rate_limited: bool = True
+
+
+_providers: Dict[str, Provider] = {
+    "openai": Provider(_create_openai, MODEL),
+    "local": Provider(_create_local, LOCAL_LLM_MODEL, rate_limited=False),
+    "fake": Provider(_create_fake, "fake-chat"),
+}
+
+
+def register_provider(name: str, provider: Provider):
+    """
+    Add a provider of chat models, which tasks can then use by name
+    """
+    _providers[name] = provider
+
+
+@dataclass
+class LLMBackend:
+    """
+    Provider and model of a task, with its own limit of requests in flight
+    and timeout in seconds
+    """
+
+    provider: str
+    model: Optional[str] = None
+    max_concurrent: int = 4
+    timeout: float = 120
+    # Held while a request of the task is in flight
+    semaphore: threading.BoundedSemaphore = field(init=False, repr=False)
+
+    def __post_init__(self):
+        if self.provider not in _providers:
+            raise ValueError(f"Unknown LLM provider {self.provider}")
+        if self.model is None:
+            self.model = _providers[self.provider].default_model
+        self.semaphore = threading.BoundedSemaphore(max(1, self.max_concurrent))
+
+    @property
+    def rate_limited(self) -> bool:
+        return _providers[self.provider].rate_limited
+
+    def get_llm(self):
+        if _override is not None:
+            return _override
+        return _get_client(self.provider, self.model, self.timeout)
+
+
+_lock = threading.Lock()
+# Tasks with the same provider, model and timeout share a client, and so its
+# connection pool
+_clients: Dict[Tuple[str, str, float], Any] = {}
+_backends: Dict[str, LLMBackend] = {}
+# Chat model used by every task instead of the one of its backend
+_override = None
+
+
+def _get_client(provider: str, model: str, timeout: float):
+    key = (provider, model, timeout)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _providers[provider].factory(model, timeout)
+    return client
+
+
+def get_backend(task: str) -> LLMBackend:
+    """
+    Get the backend of a task, configured with LLM_TASK_SETTINGS unless
+    set_backend replaced it
+    :param task: One of LLM_TASKS
+    """
+    backend = _backends.get(task)
+    if backend is None:
+        if task not in LLM_TASK_SETTINGS:
+            raise ValueError(f"Unknown LLM task {task}")
+        with _lock:
+            backend = _backends.get(task)
+            if backend is None:
+                backend = _backends[task] = LLMBackend(**LLM_TASK_SETTINGS[task])
+    return backend
+
+
+def set_backend(task: str, backend: LLMBackend):
+    """
+    Route the requests of a task to another backend
+    """
+    with _lock:
+        _backends[task] = backend
+
+
+def get_llm(task: str = "generate"):
+    """
+    Get the chat model of a task
+    """
+    return get_backend(task).get_llm()
+
+
+def set_llm(llm):
+    """
+    Use a chat model for every task, for example a FakeChatModel
+    :param llm: Chat model, None to use the ones of the backends again
+    """
+    global _override
+    _override = llm
@@ -1,15 +1,209 @@
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import TokenTextSplitter
+import hashlib
+import json
+import os
+import tempfile
+import time
+from functools import lru_cache
+from typing import Iterator, List
 
-from config.cfg import CONTENT_FILEPATH, MODEL
+from config.cfg import (CHUNK_SIZE, CONTENT_FILEPATH, INGESTION_CACHE_FOLDER,
+                        INGESTION_CACHE_MAX_BYTES, MODEL)
+from model.chunk import Chunk
+from src.telemetry import record_stage
 
 
-def load_and_split_doc() -> None:
-    # Load document
-    loader = PyPDFLoader(CONTENT_FILEPATH)
-    documents = loader.load()
-    # Split document by max tokens allowed
-    doc_splitter = TokenTextSplitter(model_name=MODEL, chunk_size=3500, chunk_overlap=0)
-    docs = doc_splitter.split_documents(documents)
-    texts = list(map(lambda doc: doc.page_content, docs))
-    return texts
+@lru_cache(maxsize=None)
+def _get_encoding():
+    # The tokenizer and the pdf libraries are imported on first use, so
+    # importing this module stays fast
+    import tiktoken
+
+    return tiktoken.encoding_for_model(MODEL)
+
+
+@lru_cache(maxsize=None)
+def _get_splitter():
+    from langchain.text_splitter import TokenTextSplitter
+
+    return TokenTextSplitter(model_name=MODEL, chunk_size=CHUNK_SIZE, chunk_overlap=0)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a text with the tokenizer of the model
+    :param text: Text to count
+    :return: Number of tokens
+    """
+    return len(_get_encoding().encode(text))
+
+
+def file_hash(filepath: str) -> str:
+    """
+    Hash the content of a file
+    :param filepath: Path of the file
+    :return: Hex digest of the content
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_filepath(content_hash: str) -> str:
+    # Chunks depend on the tokenizer and chunk size, not only on the document
+    filename = f"{content_hash}_{MODEL}_{CHUNK_SIZE}.jsonl"
+    return os.path.join(INGESTION_CACHE_FOLDER, filename)
+
+
+def count_pages(filepath: str = CONTENT_FILEPATH) -> int:
+    """
+    Count the pages of a pdf without extracting their text
+    :param filepath: Path of the pdf
+    :return: Number of pages
+    """
+    from pypdf import PdfReader
+
+    return len(PdfReader(filepath).pages)
+
+
+def _iter_parsed_pages(filepath: str) -> Iterator[dict]:
+    """
+    Parse a pdf page by page and split each page by max tokens allowed
+    :param filepath: Path of the pdf
+    :return: Iterator of records with the text and token count of the page chunks
+    """
+    from langchain.document_loaders import PyPDFLoader
+
+    splitter = _get_splitter()
+    pages = PyPDFLoader(filepath).lazy_load()
+    # Parsing and splitting are interleaved, their times are added up and
+    # recorded when the document is done
+    start = time.time()
+    load_seconds = split_seconds = 0.0
+    page_number = 0
+    try:
+        while True:
+            started = time.perf_counter()
+            page = next(pages, None)
+            load_seconds += time.perf_counter() - started
+            if page is None:
+                break
+            started = time.perf_counter()
+            chunks = [
+                {"text": text, "tokens": count_tokens(text)}
+                for text in splitter.split_text(page.page_content)
+            ]
+            split_seconds += time.perf_counter() - started
+            yield {"page": page_number, "chunks": chunks}
+            page_number += 1
+    finally:
+        record_stage("load", start, load_seconds, pages=page_number)
+        record_stage("split", start, split_seconds, pages=page_number)
+
+
+def _evict_cached_documents(max_bytes: int = INGESTION_CACHE_MAX_BYTES):
+    """
+    Remove the least recently used parsed documents until the cache fits in
+    max_bytes
+    """
+    entries = []
+    for entry in os.scandir(INGESTION_CACHE_FOLDER):
+        if entry.name.endswith(".jsonl"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _iter_cached_pages(cache_filepath: str) -> Iterator[dict]:
+    # Reading a document counts as a use for the eviction of the cache
+    os.utime(cache_filepath)
+    start = time.time()
+    load_seconds = 0.0
+    try:
+        with open(cache_filepath) as f:
+            while True:
+                started = time.perf_counter()
+                line = f.readline()
+                page = json.loads(line) if line else None
+                load_seconds += time.perf_counter() - started
+                if page is None:
+                    break
+                yield page
+    finally:
+        record_stage("load", start, load_seconds, cached=True)
+
+
+def _iter_and_cache_pages(filepath: str, cache_filepath: str) -> Iterator[dict]:
+    """
+    Parse a pdf page by page, writing every page to the cache as it is yielded
+    The cache file is only kept if the whole document was parsed
+    """
+    os.makedirs(INGESTION_CACHE_FOLDER, exist_ok=True)
+    # Every reader writes its own file, so the same document can be parsed by
+    # several threads or processes at once
+    descriptor, temp_filepath = tempfile.mkstemp(
+        suffix=".tmp", dir=INGESTION_CACHE_FOLDER
+    )
+    completed = False
+    try:
+        with os.fdopen(descriptor, "w") as f:
+            for page in _iter_parsed_pages(filepath):
+                f.write(json.dumps(page) + "\n")
+                yield page
+        completed = True
+        os.replace(temp_filepath, cache_filepath)
+        _evict_cached_documents()
+    finally:
+        if not completed and os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+
+
+def iter_chunks(filepath: str = CONTENT_FILEPATH) -> Iterator[Chunk]:
+    """
+    Stream the chunks of a document as its pages are parsed
+    Only the page being split is kept in memory, and the document is parsed
+    only the first time it is seen
+    :param filepath: Path of the pdf
+    :return: Iterator of chunks in document order
+    """
+    cache_filepath = _cache_filepath(file_hash(filepath))
+    if os.path.exists(cache_filepath):
+        pages = _iter_cached_pages(cache_filepath)
+    else:
+        pages = _iter_and_cache_pages(filepath, cache_filepath)
+
+    index = 0
+    for page in pages:
+        for chunk in page["chunks"]:
+            yield Chunk(index, page["page"], chunk["text"], chunk["tokens"])
+            index += 1
+
+
+def load_chunks(filepath: str = CONTENT_FILEPATH) -> List[Chunk]:
+    """
+    Load all the chunks of a document
+    :param filepath: Path of the pdf
+    :return: List of chunks in document order
+    """
+    return list(iter_chunks(filepath))
+
+
+def load_and_split_doc(filepath: str = CONTENT_FILEPATH) -> List[str]:
+    """
+    Load a document and split it by max tokens allowed
+    :param filepath: Path of the pdf
+    :return: List of chunk texts
+    """
+    return [chunk.text for chunk in load_chunks(filepath)]
@@ -0,0 +1,123 @@
+"""
+    Offline server of the OpenAI chat completions API answering with the
+    deterministic stand-in of src.fake_llm, so the "local" provider can be used
+    without a llama.cpp server or network access
+
+    Usage: python -m src.local_llm_server --port 8080, then LLM_PROVIDER=local
+"""
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain.schema import HumanMessage
+from openai.error import RateLimitError
+
+from src.fake_llm import FakeChatModel
+
+PATHS = ("/v1/chat/completions", "/chat/completions")
+
+
+def _completion(llm: FakeChatModel, request: dict) -> dict:
+    """
+    Answer a chat completion request with the model
+    :param request: Body of the request, in the format of the OpenAI API
+    :return: Body of the response, in the format of the OpenAI API
+    """
+    messages = [
+        HumanMessage(content=message.get("content") or "")
+        for message in request.get("messages", [])
+    ]
+    kwargs = {}
+    if request.get("functions"):
+        kwargs["functions"] = request["functions"]
+    result = llm._generate(messages, **kwargs)
+    message = result.generations[0].message
+    response_message = {"role": "assistant", "content": message.content or None}
+    finish_reason = "stop"
+    if "function_call" in message.additional_kwargs:
+        response_message["function_call"] = message.additional_kwargs["function_call"]
+        finish_reason = "function_call"
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "local"),
+        "choices": [
+            {"index": 0, "message": response_message, "finish_reason": finish_reason}
+        ],
+        "usage": result.llm_output["token_usage"],
+    }
+
+
+def create_server(host: str, port: int, llm: FakeChatModel) -> ThreadingHTTPServer:
+    """
+    Create a server answering every request in its own thread
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path not in PATHS:
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                request = json.loads(self.rfile.read(length))
+            except json.JSONDecodeError as ex:
+                self._send(400, {"error": {"message": str(ex)}})
+                return
+            try:
+                self._send(200, _completion(llm, request))
+            except RateLimitError as ex:
+                # Simulated error, which the client retries
+                self._send(429, {"error": {"message": str(ex), "type": "requests"}})
+            except Exception as ex:
+                self._send(500, {"error": {"message": str(ex), "type": "server_error"}})
+
+        def _send(self, status: int, body: dict):
+            content = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds taken by each response"
+    )
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Share of requests that fail"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    llm = FakeChatModel(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    server = create_server(args.host, args.port, llm)
+    print(f"Serving on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
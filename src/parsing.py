@@ -0,0 +1,237 @@
+"""
+    Extraction of multiple choice questions from the responses of the LLM
+
+    Function call arguments are validated against the schema of
+    mc_questions_func_definition. Responses that aren't valid JSON, like the
+    ones cut by the token limit or the ones of models that answer in text, go
+    through a tolerant parser of the numbered questions and lettered choices
+"""
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+from model.question import Question, QuestionType
+from src.utils import ANSWER_LETTER, QUESTION_NUMBER
+
+# Marks of the correct choice: "Correct: text", "text (Correct)" or "[correct]"
+_CORRECT_MARK = re.compile(r"\(correct\)|\[correct\]|\bcorrect\s*:", re.IGNORECASE)
+# Answer key written after the choices, like "Correct answer: b"
+_ANSWER_KEY = re.compile(
+    r"^(?:the\s+)?(?:correct\s+)?answers?\s*(?:is)?\s*[:\-]\s*\(?([a-h])\b\)?",
+    re.IGNORECASE,
+)
+_MARKDOWN = re.compile(r"\*\*|__|`")
+_BULLET = re.compile(r"^[-*•]\s+")
+_CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+@dataclass
+class MCParseResult:
+    """
+    Class representing the questions extracted from a response
+
+    Attributes:
+    - questions: Valid questions, numbered from 0
+    - discarded: Questions found in the response that weren't valid
+    - method: function when the response was valid JSON, text otherwise
+    """
+
+    questions: List[Question] = field(default_factory=list)
+    discarded: int = 0
+    method: str = "function"
+
+
+def _clean_answer(answer: str) -> str:
+    return ANSWER_LETTER.sub("", _CORRECT_MARK.sub("", answer), count=1).strip()
+
+
+def _correct_index(value: Any, answers: List[str]) -> Optional[int]:
+    """
+    Position of a correct answer given as a position starting at 0, a letter
+    or the text of the answer
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if 0 <= value < len(answers) else None
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isdigit():
+            return _correct_index(int(value), answers)
+        letter = value.rstrip(").").lower()
+        if len(letter) == 1 and "a" <= letter < chr(ord("a") + len(answers)):
+            return ord(letter) - ord("a")
+        cleaned = _clean_answer(value).lower()
+        for index, answer in enumerate(answers):
+            if answer.lower() == cleaned:
+                return index
+    return None
+
+
+def validate_mc_question(item: Any) -> Optional[Question]:
+    """
+    Build a question from an item of the mc_questions_func_definition schema
+    Letters and numbers before the question and the choices are removed, and
+    the correct answers can be positions, letters, texts or choices marked
+    with Correct:
+    :param item: Item of the response
+    :return: The question, None if it has no text, fewer than 2 choices or no
+        valid correct answer
+    """
+    if not isinstance(item, dict):
+        return None
+    question = QUESTION_NUMBER.sub("", str(item.get("question") or ""), count=1)
+    raw_answers = [str(answer) for answer in item.get("answers") or []]
+    answers = [_clean_answer(answer) for answer in raw_answers]
+    values = item.get("correct_answers")
+    if values is None:
+        values = item.get("correct_answer")
+    if not isinstance(values, list):
+        values = [] if values is None else [values]
+    correct_answers = {_correct_index(value, answers) for value in values}
+    correct_answers |= {
+        index
+        for index, answer in enumerate(raw_answers)
+        if _CORRECT_MARK.search(answer)
+    }
+    correct_answers.discard(None)
+    if not question.strip() or len(answers) < 2 or not all(answers):
+        return None
+    if len(correct_answers) == 0:
+        return None
+    return Question(
+        0,
+        question.strip(),
+        QuestionType.MULTIPLE_CHOICE,
+        answers=answers,
+        correct_answers=sorted(correct_answers),
+    )
+
+
+def _validate_items(items: List[Any], method: str) -> MCParseResult:
+    result = MCParseResult(method=method)
+    for item in items:
+        question = validate_mc_question(item)
+        if question is None:
+            result.discarded += 1
+            continue
+        question.id = len(result.questions)
+        result.questions.append(question)
+    return result
+
+
+def _complete_items(arguments: str) -> Optional[List[Any]]:
+    """
+    Decode the complete items of the questions array of a response that isn't
+    valid JSON, usually because the completion was cut by the token limit
+    :return: Items, None if the response has no questions array
+    """
+    match = re.search(r'"questions"\s*:\s*\[', arguments)
+    if match is None:
+        return None
+    decoder = json.JSONDecoder()
+    items = []
+    position = match.end()
+    while True:
+        while position < len(arguments) and arguments[position] in " \t\r\n,":
+            position += 1
+        try:
+            item, position = decoder.raw_decode(arguments, position)
+        except json.JSONDecodeError:
+            return items
+        items.append(item)
+
+
+def parse_mc_text(text: str, number_of_answers: Optional[int] = None) -> MCParseResult:
+    """
+    Extract the questions of a response written as text, with a question on
+    a line followed by its choices
+    Questions can be numbered like "1.", "1)" or "Question 1:", choices can be
+    lettered like "a)", "A." or "(a)", and the correct choice can be marked with
+    "Correct:", "(Correct)" or an answer key line after the choices. Choices
+    without a letter are only taken for questions with no lettered choice, so
+    text after the choices, like a closing remark, isn't taken as a choice
+    :param text: Response of the LLM
+    :param number_of_answers: Number of choices asked for each question, the
+        lines after them are ignored. None for no limit
+    :return: Questions found, with the number of them that weren't valid
+    """
+    items = []
+    current = None
+    for line in text.splitlines():
+        line = _BULLET.sub("", _MARKDOWN.sub("", line).strip())
+        if not line:
+            continue
+        key = _ANSWER_KEY.match(line)
+        if key is not None and current is not None and current["answers"]:
+            current["correct_answers"].append(key.group(1).lower())
+            continue
+        # The mark is only removed from choices, questions keep their text
+        marked = _CORRECT_MARK.search(line) is not None
+        choice = _CORRECT_MARK.sub("", line).strip()
+        lettered = ANSWER_LETTER.match(choice) is not None
+        if lettered and current is not None:
+            current["lettered"] = True
+        elif (
+            current is not None
+            and not current["answers"]
+            and not current["question"].endswith("?")
+            and not QUESTION_NUMBER.match(line)
+        ):
+            # Question written over several lines, or after a "Question 1:" line
+            current["question"] = f"{current['question']} {line}"
+            continue
+        elif QUESTION_NUMBER.match(line) or line.endswith("?"):
+            current = {
+                "question": line,
+                "answers": [],
+                "correct_answers": [],
+                "lettered": False,
+            }
+            items.append(current)
+            continue
+        elif current is None or current["lettered"]:
+            continue
+        full = (
+            number_of_answers is not None
+            and len(current["answers"]) >= number_of_answers
+        )
+        if not full:
+            if marked:
+                current["correct_answers"].append(len(current["answers"]))
+            current["answers"].append(choice)
+    return _validate_items(items, "text")
+
+
+def parse_mc_response(
+    arguments: str, number_of_answers: Optional[int] = None
+) -> MCParseResult:
+    """
+    Extract the questions of a response to mc_questions_func_definition
+    The arguments are validated against the schema, and parsed as text when
+    they aren't JSON
+    :param arguments: Arguments of the function call, or the content of the
+        response if the model didn't call the function
+    :param number_of_answers: Number of choices asked for each question, see
+        parse_mc_text
+    :return: Questions found, with the number of them that weren't valid
+    """
+    arguments = _CODE_FENCE.sub("", arguments or "")
+    try:
+        data = json.loads(arguments)
+    except json.JSONDecodeError:
+        items = _complete_items(arguments)
+        if items is None:
+            return parse_mc_text(arguments, number_of_answers)
+        result = _validate_items(items, "function")
+        # The item cut by the token limit is lost
+        result.discarded += 1
+        return result
+    if isinstance(data, dict):
+        items = data.get("questions")
+    else:
+        items = data
+    if not isinstance(items, list):
+        return MCParseResult(discarded=1)
+    return _validate_items(items, "function")
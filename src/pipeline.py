@@ -0,0 +1,120 @@
+import os
+from typing import Callable, Iterable, List
+
+from config.cfg import COMBINED_GENERATION
+from model.question import Question
+
+PDF_FILENAME = "exams.pdf"
+JSON_FILENAME = "exams.json"
+TRACE_FILENAME = "trace.json"
+EXPORT_FILENAMES = {
+    "json": JSON_FILENAME,
+    "jsonl": "exams.jsonl",
+    "csv": "exams.csv",
+    "answer_key": "answer_key.csv",
+}
+
+
+def generate_exam_files(
+    filepath: str,
+    output_folder: str,
+    question_args: dict,
+    progress_callback: Callable[[int, int], None] = None,
+    export_formats: Iterable[str] = ("json",),
+    questions_callback: Callable[[List[Question]], None] = None,
+) -> dict:
+    """
+    Generate the questions of a document, build the exams and write the output files
+    :param filepath: Path of the pdf
+    :param output_folder: Folder where the output files are written
+    :param question_args: Number of questions and exams, as in App.question_args
+    :param progress_callback: Called with the number of chunks done and the
+        total, adding up the open and multiple choice questions
+    :param export_formats: Formats of EXPORT_FILENAMES written besides the PDF
+    :param questions_callback: Called with the questions of each chunk as soon
+        as they are ready, before the exams are built
+    :return: Paths of the generated files and number of questions generated
+    """
+    # Imported here so the pages and jobs that only need the file names of
+    # this module don't load the generation libraries
+    from src.exams_api import (generate_exams, iter_mc_questions,
+                               iter_open_questions, iter_questions)
+    from src.generate_document import exams2pdf, export_exams
+
+    progress = {}
+
+    def stage_progress(stage):
+        def callback(done, total):
+            progress[stage] = (done, total)
+            if progress_callback is not None:
+                progress_callback(
+                    sum(done for done, _ in progress.values()),
+                    sum(total for _, total in progress.values()),
+                )
+
+        return callback
+
+    def collect(questions, partial_questions):
+        questions += partial_questions
+        if questions_callback is not None:
+            questions_callback(partial_questions)
+
+    open_questions = []
+    mc_questions = []
+    number_of_open = question_args["number_of_open_questions"]
+    number_of_mc = question_args.get("number_of_mc_questions", 0)
+    if COMBINED_GENERATION and number_of_open > 0 and number_of_mc > 0:
+        # Both types of questions are asked for at once, sending every chunk once
+        for open_partial, mc_partial in iter_questions(
+            number_of_open,
+            number_of_mc,
+            question_args.get("number_of_answers", 0),
+            question_args.get("number_of_variations", 0),
+            filepath=filepath,
+            progress_callback=stage_progress("mixed"),
+        ):
+            collect(open_questions, open_partial)
+            collect(mc_questions, mc_partial)
+    else:
+        for partial in iter_open_questions(
+            number_of_open,
+            question_args.get("number_of_variations", 0),
+            filepath=filepath,
+            progress_callback=stage_progress("open"),
+        ):
+            collect(open_questions, partial)
+        for partial in iter_mc_questions(
+            number_of_mc,
+            question_args.get("number_of_answers", 0),
+            filepath=filepath,
+            progress_callback=stage_progress("mc"),
+        ):
+            collect(mc_questions, partial)
+    if len(open_questions) == 0 and len(mc_questions) == 0:
+        raise RuntimeError("No questions could be generated from the document")
+
+    # Build exams
+    exams = generate_exams(
+        open_questions=open_questions,
+        number_of_open=question_args["number_of_open_questions_exam"],
+        number_of_exams=question_args["number_of_exams"],
+        mc_questions=mc_questions,
+        number_of_mc=question_args.get("number_of_mc_questions_exam", 0),
+        max_overlap=question_args.get("max_overlap"),
+        seed=question_args.get("seed"),
+    )
+
+    # Generate output files
+    os.makedirs(output_folder, exist_ok=True)
+    exams2pdf(exams, PDF_FILENAME, output_folder)
+    outputs = {
+        export_format: os.path.join(output_folder, EXPORT_FILENAMES[export_format])
+        for export_format in export_formats
+    }
+    export_exams(exams, outputs)
+    return {
+        "pdf": os.path.join(output_folder, PDF_FILENAME),
+        **outputs,
+        "number_of_open_questions": len(open_questions),
+        "number_of_mc_questions": len(mc_questions),
+    }
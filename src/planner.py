@@ -0,0 +1,111 @@
+"""
+    Planning of how many questions are generated from each chunk of a document
+"""
+import heapq
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, List
+
+from config.cfg import MAX_QUESTIONS_PER_CALL, MIN_CHUNK_TOKENS
+
+# Rough size of the instructions added to every prompt and of a generated question
+PROMPT_OVERHEAD_TOKENS = 100
+TOKENS_PER_QUESTION = 30
+
+
+@dataclass
+class QuestionPlan:
+    """
+    Class representing the questions to generate from a document
+
+    Attributes:
+    - allocations: Number of questions to ask for, by chunk index
+    - estimated_calls: Number of LLM calls the plan needs
+    - estimated_prompt_tokens: Estimated tokens sent to the LLM
+    - estimated_completion_tokens: Estimated tokens generated by the LLM
+    """
+
+    allocations: Dict[int, int]
+    estimated_calls: int
+    estimated_prompt_tokens: int
+    estimated_completion_tokens: int
+
+    @property
+    def number_of_questions(self) -> int:
+        return sum(self.allocations.values())
+
+    def __str__(self):
+        return (
+            f"{self.number_of_questions} questions from {len(self.allocations)} chunks: "
+            f"{self.estimated_calls} calls, ~{self.estimated_prompt_tokens} prompt tokens "
+            f"and ~{self.estimated_completion_tokens} completion tokens"
+        )
+
+
+def _spread(candidates: List[int], count: int) -> List[int]:
+    """
+    Pick count elements evenly spread over the candidates, so that the
+    questions cover the whole document
+    """
+    return [
+        candidates[(2 * i + 1) * len(candidates) // (2 * count)] for i in range(count)
+    ]
+
+
+def _allocate(weights: List[int], total: int, cap: int) -> List[int]:
+    """
+    Split total proportionally to the weights, at least 1 and at most cap each
+    Uses the highest averages method, so the result adds up exactly to total
+    """
+    allocations = [1] * len(weights)
+    heap = [(-weight / 2, i) for i, weight in enumerate(weights)]
+    heapq.heapify(heap)
+    for _ in range(total - len(weights)):
+        while True:
+            _, i = heapq.heappop(heap)
+            if allocations[i] < cap:
+                break
+        allocations[i] += 1
+        heapq.heappush(heap, (-weights[i] / (allocations[i] + 1), i))
+    return allocations
+
+
+def plan_questions(
+    chunk_tokens: List[int],
+    number_of_questions: int,
+    max_questions_per_call: int = MAX_QUESTIONS_PER_CALL,
+    exclude: Iterable[int] = (),
+) -> QuestionPlan:
+    """
+    Decide which chunks to ask questions about and how many questions each
+    The minimum number of chunks is used, spread over the document, and every
+    chunk gets a number of questions proportional to its size
+    :param chunk_tokens: Number of tokens of each chunk of the document
+    :param number_of_questions: Total number of questions to generate
+    :param max_questions_per_call: Maximum number of questions asked in a single call
+    :param exclude: Indexes of chunks that shouldn't be used
+    :return: Plan with the allocations and its estimated cost
+    """
+    exclude = set(exclude)
+    available = [i for i in range(len(chunk_tokens)) if i not in exclude]
+    candidates = [i for i in available if chunk_tokens[i] >= MIN_CHUNK_TOKENS]
+    candidates = candidates or available
+    if number_of_questions <= 0 or len(candidates) == 0:
+        return QuestionPlan({}, 0, 0, 0)
+
+    calls = min(
+        len(candidates), math.ceil(number_of_questions / max_questions_per_call)
+    )
+    selected = _spread(candidates, calls)
+    cap = max(max_questions_per_call, math.ceil(number_of_questions / calls))
+    allocations = _allocate(
+        [chunk_tokens[i] for i in selected], number_of_questions, cap
+    )
+
+    return QuestionPlan(
+        allocations=dict(zip(selected, allocations)),
+        estimated_calls=calls,
+        estimated_prompt_tokens=sum(chunk_tokens[i] for i in selected)
+        + calls * PROMPT_OVERHEAD_TOKENS,
+        estimated_completion_tokens=number_of_questions * TOKENS_PER_QUESTION,
+    )
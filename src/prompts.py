@@ -5,14 +5,20 @@
 prompt_multiple_choice = (
     "Create an exam of multiple choice questions with {number_of_questions} "
     "questions and {number_of_answers} different choices for each question. "
-    "DO NOT duplicate choices within a questions."
-    "Insert the word 'Correct:' before the correct answer in its original spot. "
-    "ONLY generate the questions and choices, not the exam itself."
-    "DO NOT use all capital letters unless unless it's an acronym."
-    "{not_repeated_questions_prompt}"
+    "DO NOT duplicate choices within a question. "
+    "Give the positions of the correct choices, starting at 0, instead of "
+    "marking them in the text of the choices. "
+    "ONLY generate the questions and choices, not the exam itself. "
+    "DO NOT use all capital letters unless it's an acronym. "
     "The exam should be about the following text {text}."
 )
 
+prompt_extract_multiple_choice = (
+    "Extract the multiple choice questions of the following text, with their "
+    "choices and the correct choices. DO NOT create new questions or choices. "
+    "The text is:\n{text}"
+)
+
 prompt_open_question = (
     "Create {number_of_questions} different questions for an exam."
     "Only generate the list of questions, not the exam itself."
@@ -22,9 +28,22 @@ prompt_open_question = (
     "Remember to separate de questions with this character: #"
 )
 
-prompt_variation_question = (
-    "Create {number_of_variations} variations for the following question,"
-    "keeping the same meaning in the question, only rephrase it: {question}."
+prompt_mixed_questions = (
+    "Create an exam with {number_of_open_questions} different open questions and "
+    "{number_of_mc_questions} different multiple choice questions with "
+    "{number_of_answers} different choices for each question. "
+    "DO NOT duplicate choices within a question, and DO NOT ask the same thing "
+    "in an open and a multiple choice question. "
+    "ONLY generate the questions and choices, not the exam itself. "
+    "DO NOT use all capital letters unless it's an acronym. "
+    "The exam should be about the following text: {text}."
+)
+
+prompt_batch_variation_question = (
+    "Create {number_of_variations} variations for each of the following questions,"
+    "keeping the same meaning in each question, only rephrase it."
+    "Identify the variations of each question with its number."
+    "The questions are:\n{questions}"
 )
 
 
@@ -45,29 +64,152 @@ def open_questions_func_definition() -> str:
     }
 
 
+def _mc_question_schema() -> dict:
+    return {
+        "type": "object",
+        "properties": {
+            "question": {
+                "type": "string",
+                "description": "Question, WITHOUT the question number",
+            },
+            "answers": {
+                "type": "array",
+                "description": "Choices, WITHOUT the letter or number of the choice",
+                "items": {"type": "string"},
+            },
+            "correct_answers": {
+                "type": "array",
+                "description": "Positions of the correct choices in answers, starting at 0",
+                "items": {"type": "integer"},
+            },
+        },
+        "required": ["question", "answers", "correct_answers"],
+    }
+
+
+def mc_questions_func_definition() -> dict:
+    return {
+        "name": "process_mc_questions",
+        "description": "Get the multiple choice questions of an exam with their choices and correct choices. And then process them.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "questions": {
+                    "type": "array",
+                    "description": "Multiple choice questions",
+                    "items": _mc_question_schema(),
+                }
+            },
+            "required": ["questions"],
+        },
+    }
+
+
+def mixed_questions_func_definition() -> dict:
+    return {
+        "name": "process_exam",
+        "description": "Get the open and multiple choice questions of an exam. And then process them.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "open_questions": {
+                    "type": "array",
+                    "description": "Open questions, WITHOUT the question number",
+                    "items": {"type": "string"},
+                },
+                "mc_questions": {
+                    "type": "array",
+                    "description": "Multiple choice questions",
+                    "items": _mc_question_schema(),
+                },
+            },
+            "required": ["open_questions", "mc_questions"],
+        },
+    }
+
+
+def variations_func_definition() -> dict:
+    return {
+        "name": "process_variations",
+        "description": "Get the variations generated for each numbered question. And then process them.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "variations": {
+                    "type": "array",
+                    "description": "One element for each of the numbered questions",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "question_number": {
+                                "type": "integer",
+                                "description": "Number of the question that was rephrased",
+                            },
+                            "variations": {
+                                "type": "array",
+                                "description": "Rephrased versions of the question, WITHOUT the question number",
+                                "items": {"type": "string"},
+                            },
+                        },
+                        "required": ["question_number", "variations"],
+                    },
+                }
+            },
+            "required": ["variations"],
+        },
+    }
+
+
 def prepare_prompt_multiple_choice(
-    text: str, current_questions: list, number_of_questions: int, number_of_answers: int
+    text: str, number_of_questions: int, number_of_answers: int
 ) -> str:
     """
     Prepare multiple_choice question generation prompt
     :param text: context from which we want to generate questions
-    :param current_questions: questions already generated to not generate repetitions
     :param number_of_questions: number of open questions we want
     :param number_of_answers: number of answer options that the questions should have
     :return: Prompt
     """
-    if len(current_questions) > 0:
-        not_repeated_questions_prompt = (
-            f"The questions should NOT BE in {current_questions}"
-        )
-    else:
-        not_repeated_questions_prompt = ""
-
     return prompt_multiple_choice.format(
-        number_of_questions, number_of_answers, not_repeated_questions_prompt, text
+        number_of_questions=number_of_questions,
+        number_of_answers=number_of_answers,
+        text=text,
+    )
+
+
+def prepare_prompt_mixed_questions(
+    text: str,
+    number_of_open_questions: int,
+    number_of_mc_questions: int,
+    number_of_answers: int,
+) -> str:
+    """
+    Prepare the prompt generating open and multiple choice questions at once
+    :param text: context from which we want to generate questions
+    :param number_of_open_questions: number of open questions we want
+    :param number_of_mc_questions: number of multiple choice questions we want
+    :param number_of_answers: number of answer options that the multiple choice
+        questions should have
+    :return: Prompt
+    """
+    return prompt_mixed_questions.format(
+        number_of_open_questions=number_of_open_questions,
+        number_of_mc_questions=number_of_mc_questions,
+        number_of_answers=number_of_answers,
+        text=text,
     )
 
 
+def prepare_prompt_extract_multiple_choice(text: str) -> str:
+    """
+    Prepare the prompt extracting multiple choice questions from a response
+    that couldn't be parsed
+    :param text: response with the questions
+    :return: Prompt
+    """
+    return prompt_extract_multiple_choice.format(text=text)
+
+
 def prepare_prompt_open_question(text: str, number_of_questions: int) -> str:
     """
     Prepare open question generation prompt
@@ -80,11 +222,18 @@ def prepare_prompt_open_question(text: str, number_of_questions: int) -> str:
     )
 
 
-def prepare_prompt_variation_question(question: str, number_of_variations: int):
+def prepare_prompt_batch_variation_question(
+    questions: list, number_of_variations: int
+) -> str:
     """
-    Prepare question variants generation prompt
-    :param question: Question that we want to create variations for
-    :param number_of_variations: Number of variations for the question
+    Prepare question variants generation prompt for several questions at once
+    :param questions: Questions that we want to create variations for
+    :param number_of_variations: Number of variations for each question
     :return: Prompt
     """
-    return prompt_variation_question.format(number_of_variations, question)
+    numbered_questions = "\n".join(
+        f"{i + 1}. {question}" for i, question in enumerate(questions)
+    )
+    return prompt_batch_variation_question.format(
+        number_of_variations=number_of_variations, questions=numbered_questions
+    )
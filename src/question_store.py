@@ -0,0 +1,181 @@
+"""
+    Questions generated for every document, kept across sessions so a document
+    uploaded again doesn't need all its questions generated again
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from config.cfg import QUESTION_STORE_ENABLED, QUESTION_STORE_FILEPATH
+from model.question import Question, QuestionType
+from src.utils import question_hash
+
+
+class QuestionStore:
+    """
+    Questions stored in SQLite by document, chunk and type
+
+    Documents are identified by the hash of their content, so the same file
+    uploaded by different users shares its questions. A question is stored
+    once per document and type.
+    """
+
+    def __init__(
+        self,
+        filepath: str = QUESTION_STORE_FILEPATH,
+        enabled: bool = QUESTION_STORE_ENABLED,
+    ):
+        self.filepath = filepath
+        self.enabled = enabled
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(self.filepath, check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, document TEXT NOT NULL, "
+                "chunk INTEGER, question_type TEXT NOT NULL, hash TEXT NOT NULL, "
+                "question TEXT NOT NULL, variations TEXT NOT NULL, "
+                "answers TEXT NOT NULL, correct_answers TEXT NOT NULL, "
+                "number_of_variations INTEGER NOT NULL, "
+                "number_of_answers INTEGER NOT NULL, created REAL NOT NULL, "
+                "UNIQUE (document, question_type, hash))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS questions_document "
+                "ON questions (document, question_type, chunk)"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def add(self, document: str, questions: List[Question]):
+        """
+        Store questions of a document, skipping the ones already stored
+        :param document: Hash of the document
+        :param questions: Questions to store
+        """
+        if not self.enabled or len(questions) == 0:
+            return
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR IGNORE INTO questions (document, chunk, question_type, "
+                "hash, question, variations, answers, correct_answers, "
+                "number_of_variations, number_of_answers, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        document,
+                        question.chunk,
+                        question.question_type.value,
+                        question_hash(question.question),
+                        question.question,
+                        json.dumps(question.variations),
+                        json.dumps(question.answers),
+                        json.dumps(question.correct_answers),
+                        len(question.variations),
+                        len(question.answers),
+                        now,
+                    )
+                    for question in questions
+                ],
+            )
+            connection.commit()
+
+    def get(
+        self,
+        document: str,
+        question_type: QuestionType,
+        limit: int,
+        number_of_variations: int = 0,
+        number_of_answers: Optional[int] = None,
+    ) -> List[Question]:
+        """
+        Get stored questions of a document, taking them from as many chunks as
+        possible when there are more than needed
+        :param document: Hash of the document
+        :param question_type: Type of the questions
+        :param limit: Maximum number of questions
+        :param number_of_variations: Only questions with at least this number of
+            variations are returned, with only that number of them
+        :param number_of_answers: Only questions with this number of answers
+            are returned, any number if None
+        :return: Questions in document order, with IDs from 0
+        """
+        if not self.enabled or limit <= 0:
+            return []
+        conditions = "document = ? AND question_type = ? AND number_of_variations >= ?"
+        params = [document, question_type.value, number_of_variations]
+        if number_of_answers is not None:
+            conditions += " AND number_of_answers = ?"
+            params.append(number_of_answers)
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    "SELECT * FROM (SELECT *, ROW_NUMBER() OVER "
+                    "(PARTITION BY chunk ORDER BY id) AS chunk_rank "
+                    f"FROM questions WHERE {conditions}) "
+                    "ORDER BY chunk_rank, chunk, id LIMIT ?",
+                    (*params, limit),
+                )
+                .fetchall()
+            )
+        rows = sorted(
+            rows, key=lambda row: (row["chunk"] is None, row["chunk"] or 0, row["id"])
+        )
+        return [
+            Question(
+                i,
+                row["question"],
+                question_type,
+                variations=json.loads(row["variations"])[:number_of_variations],
+                answers=json.loads(row["answers"]),
+                correct_answers=json.loads(row["correct_answers"]),
+                chunk=row["chunk"],
+            )
+            for i, row in enumerate(rows)
+        ]
+
+    def count(self, document: str, question_type: QuestionType) -> int:
+        """
+        Count the stored questions of a document
+        """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            (count,) = (
+                self._connect()
+                .execute(
+                    "SELECT COUNT(*) FROM questions "
+                    "WHERE document = ? AND question_type = ?",
+                    (document, question_type.value),
+                )
+                .fetchone()
+            )
+        return count
+
+    def clear(self, document: Optional[str] = None):
+        """
+        Remove the questions of a document, or every question if None
+        """
+        with self._lock:
+            connection = self._connect()
+            if document is None:
+                connection.execute("DELETE FROM questions")
+            else:
+                connection.execute(
+                    "DELETE FROM questions WHERE document = ?", (document,)
+                )
+            connection.commit()
+
+
+question_store = QuestionStore()
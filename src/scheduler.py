@@ -0,0 +1,196 @@
+"""
+    Scheduling of the LLM requests within the rate limits of the API
+"""
+import random
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, Tuple
+
+from config.cfg import (LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY,
+                        LLM_RETRY_MAX_DELAY, REQUESTS_PER_MINUTE,
+                        TOKENS_PER_MINUTE)
+from src.telemetry import record_event
+
+
+@lru_cache(maxsize=None)
+def retryable_errors() -> Tuple[type, ...]:
+    """
+    Errors that may not happen again if the request is repeated later
+    openai is imported here, so it is only loaded once a request is sent
+    """
+    from openai.error import (APIConnectionError, APIError, RateLimitError,
+                              ServiceUnavailableError, Timeout)
+
+    return (
+        APIConnectionError,
+        APIError,
+        RateLimitError,
+        ServiceUnavailableError,
+        Timeout,
+    )
+
+
+class TokenBucket:
+    """
+    Allow rate_per_minute units per minute, in bursts of up to capacity units
+    Units are reserved in arrival order, so callers wait their turn
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(
+            self.capacity, self._level + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take units from the bucket, going into debt if there aren't enough
+        :param amount: Number of units
+        :return: Seconds to wait until the units are actually available
+        """
+        with self._lock:
+            self._refill()
+            self._level -= min(amount, self.capacity)
+            return max(0.0, -self._level / self.rate)
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        Wait until amount units are available and take them
+        :param amount: Number of units
+        :return: Seconds waited
+        """
+        delay = self.reserve(amount)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def adjust(self, amount: float):
+        """
+        Take or give back units without waiting, when the real amount of a
+        reservation is known
+        :param amount: Units to take, negative to give them back
+        """
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level - amount)
+
+
+@dataclass
+class ScheduledCall:
+    value: Any
+    # Number of times the request was repeated after an error
+    retries: int = 0
+    # Seconds spent waiting for the rate limits or between retries
+    waited: float = 0.0
+    # Whether the value comes from an identical request of another caller
+    shared: bool = False
+
+
+class LLMScheduler:
+    """
+    Send requests within the requests and tokens per minute of the API,
+    retrying the ones that fail with exponential backoff and sending a single
+    request for identical prompts in flight at the same time
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = TOKENS_PER_MINUTE,
+        max_retries: int = LLM_MAX_RETRIES,
+        base_delay: float = LLM_RETRY_BASE_DELAY,
+        max_delay: float = LLM_RETRY_MAX_DELAY,
+    ):
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _backoff(self, retries: int, error: Exception) -> float:
+        """
+        Seconds to wait before a retry, random up to an exponential limit so
+        the callers that failed together don't retry together
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**retries))
+        retry_after = (getattr(error, "headers", None) or {}).get("retry-after")
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+    def _call(self, func: Callable[[], Any], estimated_tokens: int) -> ScheduledCall:
+        retries = 0
+        waited = 0.0
+        while True:
+            if self.requests is not None:
+                waited += self.requests.acquire(1)
+            if self.tokens is not None:
+                waited += self.tokens.acquire(estimated_tokens)
+            try:
+                return ScheduledCall(func(), retries, waited)
+            except retryable_errors() as ex:
+                # The failed attempt didn't use its tokens, give them back so
+                # the retry doesn't count them twice
+                if self.tokens is not None:
+                    self.tokens.adjust(-estimated_tokens)
+                if retries >= self.max_retries:
+                    raise
+                delay = self._backoff(retries, ex)
+                record_event("retry", delay=round(delay, 3), error=str(ex))
+                time.sleep(delay)
+                waited += delay
+                retries += 1
+
+    def run(
+        self, key: str, func: Callable[[], Any], estimated_tokens: int = 0
+    ) -> ScheduledCall:
+        """
+        Send a request, or wait for the identical one already in flight
+        :param key: Identifier of the request, the same for identical prompts
+        :param func: Function sending the request
+        :param estimated_tokens: Tokens the request is expected to use
+        :return: Value returned by func and how it was scheduled
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            call = future.result()
+            return ScheduledCall(call.value, shared=True)
+
+        try:
+            call = self._call(func, estimated_tokens)
+            future.set_result(call)
+            return call
+        except BaseException as ex:
+            future.set_exception(ex)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def record_tokens(self, estimated_tokens: int, used_tokens: int):
+        """
+        Correct the tokens taken for a request once its usage is known
+        """
+        if self.tokens is not None:
+            self.tokens.adjust(used_tokens - estimated_tokens)
@@ -0,0 +1,417 @@
+"""
+    Metrics of the LLM requests and the generation stages, exported in the
+    Prometheus text format, and traces of single jobs
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+
+from config.cfg import (COMPLETION_TOKEN_PRICE, METRICS_FILEPATH, MODEL_PRICES,
+                        PROMPT_TOKEN_PRICE, TELEMETRY_ENABLED)
+
+# Upper bounds in seconds of the latency histograms
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_DESCRIPTIONS = {
+    "quiz_llm_request_seconds": ("histogram", "Latency of the LLM requests"),
+    "quiz_llm_requests_total": ("counter", "LLM requests sent"),
+    "quiz_llm_cache_hits_total": ("counter", "LLM responses reused from the cache"),
+    "quiz_llm_deduplicated_total": (
+        "counter",
+        "LLM requests answered by an identical request in flight",
+    ),
+    "quiz_llm_retries_total": ("counter", "LLM requests retried after an error"),
+    "quiz_llm_tokens_total": ("counter", "Tokens sent to and generated by the LLM"),
+    "quiz_llm_cost_dollars_total": ("counter", "Estimated cost of the LLM requests"),
+    "quiz_stage_seconds": ("histogram", "Duration of the generation stages"),
+    "quiz_questions_reused_total": (
+        "counter",
+        "Questions taken from the question store instead of generated",
+    ),
+    "quiz_mc_responses_total": (
+        "counter",
+        "Multiple choice responses parsed, by method and outcome",
+    ),
+    "quiz_mc_questions_parsed_total": (
+        "counter",
+        "Valid multiple choice questions extracted from the responses",
+    ),
+    "quiz_mc_questions_discarded_total": (
+        "counter",
+        "Multiple choice questions of the responses that weren't valid",
+    ),
+}
+
+
+def estimate_cost(
+    prompt_tokens: int, completion_tokens: int, model: Optional[str] = None
+) -> float:
+    """
+    Estimate the cost of a request in dollars from the prices of the model
+    :param model: Model that answered the request, priced with MODEL_PRICES or
+        the default prices when it isn't there
+    """
+    prompt_price, completion_price = MODEL_PRICES.get(
+        model, (PROMPT_TOKEN_PRICE, COMPLETION_TOKEN_PRICE)
+    )
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+def _format_value(value: float) -> str:
+    # Counts are written as they are, :g would round them to 6 digits
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # The last count is for the values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], **extra) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Metrics:
+    """
+    Counters and histograms kept in memory, identified by name and labels
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._histograms: Dict[Tuple[str, tuple], _Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_prometheus(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            series = sorted(
+                [
+                    (name, labels, value)
+                    for (name, labels), value in self._counters.items()
+                ]
+                + [
+                    (name, labels, histogram)
+                    for (name, labels), histogram in self._histograms.items()
+                ],
+                key=lambda item: (item[0], item[1]),
+            )
+            described = set()
+            for name, labels, value in series:
+                if name not in described:
+                    described.add(name)
+                    metric_type, description = _DESCRIPTIONS.get(name, ("untyped", ""))
+                    lines.append(f"# HELP {name} {description}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                if not isinstance(value, _Histogram):
+                    lines.append(
+                        f"{name}{_format_labels(labels)} {_format_value(value)}"
+                    )
+                    continue
+                cumulative = 0
+                for bound, count in zip((*value.buckets, "+Inf"), value.counts):
+                    cumulative += count
+                    lines.append(
+                        f"{name}_bucket{_format_labels(labels, le=bound)} {cumulative}"
+                    )
+                lines.append(
+                    f"{name}_sum{_format_labels(labels)} {_format_value(value.sum)}"
+                )
+                lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, filepath: str = METRICS_FILEPATH):
+        """
+        Write the metrics to a file, for example for the textfile collector of
+        the Prometheus node exporter
+        """
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        temp_filepath = f"{filepath}.{os.getpid()}.tmp"
+        with open(temp_filepath, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_filepath, filepath)
+
+
+# Metrics of this process
+metrics = Metrics()
+
+
+class Trace:
+    """
+    Timeline of the stages and LLM requests of a single job
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.time()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, name: str, start: float, seconds: float, **attributes):
+        """
+        Record an event
+        :param kind: stage, llm or event
+        :param name: Name of the stage or function of the request
+        :param start: Epoch time when the event started
+        :param seconds: Duration of the event
+        """
+        event = {
+            "kind": kind,
+            "name": name,
+            "start": round(start - self.start, 4),
+            "seconds": round(seconds, 4),
+            "thread": threading.current_thread().name,
+            **attributes,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def to_dict(self) -> dict:
+        """
+        Events of the trace and their totals by stage and for the LLM requests
+        """
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event["start"])
+        stages = {}
+        llm = {
+            "requests": 0,
+            "cache_hits": 0,
+            "deduplicated": 0,
+            "errors": 0,
+            "retries": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cost": 0.0,
+        }
+        for event in events:
+            if event["kind"] == "stage":
+                totals = stages.setdefault(event["name"], {"count": 0, "seconds": 0.0})
+                totals["count"] += 1
+                totals["seconds"] = round(totals["seconds"] + event["seconds"], 4)
+            elif event["kind"] == "event":
+                continue
+            elif event.get("cached"):
+                llm["cache_hits"] += 1
+            elif event.get("deduplicated"):
+                llm["deduplicated"] += 1
+            else:
+                llm["requests"] += 1
+                llm["errors"] += "error" in event
+                for name in ("retries", "prompt_tokens", "completion_tokens", "cost"):
+                    llm[name] += event.get(name, 0)
+        llm["cost"] = round(llm["cost"], 6)
+        return {
+            "name": self.name,
+            "start": self.start,
+            "seconds": round(time.time() - self.start, 4),
+            "stages": stages,
+            "llm": llm,
+            "events": events,
+        }
+
+    def save(self, filepath: str):
+        with open(filepath, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+@contextmanager
+def trace(name: str) -> Iterator[Optional[Trace]]:
+    """
+    Record the stages and LLM requests of the block in a new trace, including
+    the ones from worker threads that run in a copy of its context
+    :param name: Name of the trace, like the ID of the job
+    :return: Trace, None if telemetry is disabled
+    """
+    if not TELEMETRY_ENABLED:
+        yield None
+        return
+    current = Trace(name)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+def record_stage(name: str, start: float, seconds: float, **attributes):
+    """
+    Record the duration of a stage measured by the caller
+    :param name: load, split, generate, variations, assemble or render
+    :param start: Epoch time when the stage started
+    :param seconds: Duration of the stage
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    metrics.observe("quiz_stage_seconds", seconds, stage=name)
+    current = _current_trace.get()
+    if current is not None:
+        current.add("stage", name, start, seconds, **attributes)
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """
+    Measure the block as a stage, see record_stage
+    """
+    if not TELEMETRY_ENABLED:
+        yield
+        return
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, start, time.perf_counter() - started, **attributes)
+
+
+def record_event(name: str, **attributes):
+    """
+    Record something the generation decided, like a plan, in the trace
+    :param name: Name of the event
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    current = _current_trace.get()
+    if current is not None:
+        current.add("event", name, time.time(), 0.0, **attributes)
+
+
+def record_llm_request(
+    function: str,
+    start: float,
+    seconds: float,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    retries: int = 0,
+    error: Exception = None,
+    model: Optional[str] = None,
+):
+    """
+    Record an LLM request
+    :param function: Name of the function called, text for plain completions
+    :param start: Epoch time when the request was sent
+    :param seconds: Duration of the request, including its retries
+    :param error: Error that made the request fail
+    :param model: Model of the task that sent the request, to estimate its cost
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    cost = estimate_cost(prompt_tokens, completion_tokens, model)
+    outcome = "error" if error is not None else "ok"
+    metrics.observe("quiz_llm_request_seconds", seconds, function=function)
+    metrics.inc("quiz_llm_requests_total", function=function, outcome=outcome)
+    if retries:
+        metrics.inc("quiz_llm_retries_total", retries, function=function)
+    metrics.inc("quiz_llm_tokens_total", prompt_tokens, kind="prompt")
+    metrics.inc("quiz_llm_tokens_total", completion_tokens, kind="completion")
+    metrics.inc("quiz_llm_cost_dollars_total", cost)
+    current = _current_trace.get()
+    if current is not None:
+        attributes = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": cost,
+            "retries": retries,
+        }
+        if error is not None:
+            attributes["error"] = str(error)
+        current.add("llm", function, start, seconds, **attributes)
+
+
+def record_cache_hit(function: str):
+    """
+    Record an LLM response reused from the cache
+    :param function: Name of the function called, text for plain completions
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    metrics.inc("quiz_llm_cache_hits_total", function=function)
+    current = _current_trace.get()
+    if current is not None:
+        current.add("llm", function, time.time(), 0.0, cached=True)
+
+
+def record_deduplicated_request(function: str):
+    """
+    Record an LLM request answered by an identical one sent by another caller
+    :param function: Name of the function called, text for plain completions
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    metrics.inc("quiz_llm_deduplicated_total", function=function)
+    current = _current_trace.get()
+    if current is not None:
+        current.add("llm", function, time.time(), 0.0, deduplicated=True)
+
+
+def record_reused_questions(question_type: str, count: int):
+    """
+    Record questions taken from the question store
+    :param question_type: open or mc
+    :param count: Number of questions
+    """
+    if not TELEMETRY_ENABLED or count == 0:
+        return
+    metrics.inc("quiz_questions_reused_total", count, question_type=question_type)
+
+
+def record_mc_parse(method: str, parsed: int, discarded: int):
+    """
+    Record the parsing of a multiple choice response
+    :param method: function, text or repair
+    :param parsed: Number of valid questions
+    :param discarded: Number of questions that weren't valid
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    if parsed == 0:
+        outcome = "failed"
+    elif discarded > 0:
+        outcome = "partial"
+    else:
+        outcome = "ok"
+    metrics.inc("quiz_mc_responses_total", method=method, outcome=outcome)
+    metrics.inc("quiz_mc_questions_parsed_total", parsed, method=method)
+    metrics.inc("quiz_mc_questions_discarded_total", discarded, method=method)
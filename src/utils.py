@@ -1,17 +1,40 @@
+import hashlib
 import re
 from typing import List
 
+# Number before a question, like "1.", "1)" or "Question 1:"
+QUESTION_NUMBER = re.compile(r"^\s*(?:question\s*)?[0-9]+\s*[.):]\s*", re.IGNORECASE)
+# Letter before a choice, like "a)", "A." or "(a)", followed by a space
+ANSWER_LETTER = re.compile(r"^\s*\(?[a-hA-H][).:](?:\s+|$)")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
 
 def sanitize_line(line: str, is_question: bool) -> str:
     """
     Sanitize a line from the response
     :param line: Line to sanitize
     :param is_question: Whether the line is a question or an answer
-    :return: Sanitized line
+    :return: Sanitized line, without the number of the question or the letter
+        of the answer
     """
     if is_question:
-        new_line = re.sub(r"[0-9]+.", " ", line, count=1)
-    else:
-        new_line = re.sub(r"[a-eA-E][).]", " ", line, count=1)
+        return QUESTION_NUMBER.sub("", line, count=1)
+    return ANSWER_LETTER.sub("", line, count=1)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercase a text and remove its punctuation and repeated spaces
+    :param text: Text to normalize
+    :return: Normalized text
+    """
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
 
-    return new_line
+def question_hash(question: str) -> str:
+    """
+    Hash a question ignoring case, punctuation and spacing
+    :param question: Question text
+    :return: Hex digest of the normalized question
+    """
+    return hashlib.sha1(normalize_text(question).encode("utf-8")).hexdigest()
@@ -0,0 +1,99 @@
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Optional
+
+from config.cfg import CONTENT_FILENAME, WORKSPACE_TTL, WORKSPACES_FOLDER
+
+
+class Workspace:
+    """
+    Folder holding the uploaded document and the generated files of a session,
+    so that concurrent users never share files
+
+    Attributes:
+    - id: Workspace ID
+    - folder: Root folder of the workspace
+    """
+
+    def __init__(self, id: str = None, root_folder: str = WORKSPACES_FOLDER):
+        self.id = id or uuid.uuid4().hex
+        self.folder = os.path.join(root_folder, self.id)
+        os.makedirs(self.output_folder, exist_ok=True)
+
+    @classmethod
+    def load(
+        cls, id: str, root_folder: str = WORKSPACES_FOLDER
+    ) -> Optional["Workspace"]:
+        """
+        Get an existing workspace
+        :param id: Workspace ID
+        :param root_folder: Folder containing the workspaces
+        :return: The workspace, None if it doesn't exist
+        """
+        if not re.fullmatch(r"[0-9a-f]{32}", id):
+            return None
+        if not os.path.isdir(os.path.join(root_folder, id)):
+            return None
+        return cls(id, root_folder)
+
+    @property
+    def content_filepath(self) -> str:
+        return os.path.join(self.folder, CONTENT_FILENAME)
+
+    @property
+    def output_folder(self) -> str:
+        return os.path.join(self.folder, "output")
+
+    def output_filepath(self, filename: str) -> str:
+        return os.path.join(self.output_folder, filename)
+
+    def save_content(self, content: bytes):
+        """
+        Save the uploaded document
+        :param content: Bytes of the document
+        """
+        with open(self.content_filepath, "wb") as f:
+            f.write(content)
+
+    def touch(self):
+        """
+        Mark the workspace as in use so it isn't cleaned up
+        """
+        os.makedirs(self.output_folder, exist_ok=True)
+        os.utime(self.folder)
+
+    def clear_outputs(self):
+        """
+        Remove the generated files
+        """
+        shutil.rmtree(self.output_folder, ignore_errors=True)
+        os.makedirs(self.output_folder, exist_ok=True)
+
+    def cleanup(self):
+        """
+        Remove the workspace and everything in it
+        """
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def cleanup_workspaces(
+    max_age: int = WORKSPACE_TTL, root_folder: str = WORKSPACES_FOLDER
+):
+    """
+    Remove the workspaces that weren't used in the last max_age seconds
+    :param max_age: Seconds since the last use of a workspace to remove it
+    :param root_folder: Folder containing the workspaces
+    """
+    if not os.path.isdir(root_folder):
+        return
+    now = time.time()
+    for name in os.listdir(root_folder):
+        folder = os.path.join(root_folder, name)
+        try:
+            if now - os.path.getmtime(folder) > max_age:
+                shutil.rmtree(folder, ignore_errors=True)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from src.assembly import _overlapping_exams, assemble_exams
+
+
+def _chunks(size: int, number_of_chunks: int, seed: int = 1) -> list:
+    return np.random.default_rng(seed).integers(0, number_of_chunks, size).tolist()
+
+
+def _max_shared(exams: np.ndarray) -> int:
+    incidence = np.zeros((len(exams), exams.max() + 1), dtype=np.int64)
+    incidence[np.arange(len(exams))[:, None], exams] = 1
+    shared = incidence @ incidence.T
+    np.fill_diagonal(shared, 0)
+    return int(shared.max())
+
+
+def test_assemble_exams_uses_questions_evenly():
+    open_chunks, mc_chunks = _chunks(60, 6), _chunks(40, 4)
+
+    open_questions, mc_questions = assemble_exams(
+        [open_chunks, mc_chunks], [6, 4], 100, seed=1
+    )
+
+    assert open_questions.shape == (100, 6)
+    assert mc_questions.shape == (100, 4)
+    for questions, size in ((open_questions, 60), (mc_questions, 40)):
+        assert all(len(set(row)) == len(row) for row in questions.tolist())
+        usage = np.bincount(questions.ravel(), minlength=size)
+        assert usage.max() - usage.min() <= 1
+
+
+def test_assemble_exams_spreads_chunks():
+    chunks = [index // 5 for index in range(50)]
+
+    (questions,) = assemble_exams([chunks], [5], 10, seed=3)
+
+    chunk_ids = np.array(chunks)[questions]
+    assert all(len(set(row)) == 5 for row in chunk_ids.tolist())
+
+
+def test_assemble_exams_is_deterministic_with_a_seed():
+    pools = [_chunks(30, 5), _chunks(20, 4)]
+
+    first = assemble_exams(pools, [3, 2], 40, max_overlap=1, seed=7)
+    second = assemble_exams(pools, [3, 2], 40, max_overlap=1, seed=7)
+
+    for a, b in zip(first, second):
+        assert (a == b).all()
+
+
+@pytest.mark.parametrize("max_overlap", [3, 4])
+def test_assemble_exams_limits_shared_questions(max_overlap):
+    open_chunks, mc_chunks = _chunks(100, 10), _chunks(50, 5, seed=2)
+
+    open_questions, mc_questions = assemble_exams(
+        [open_chunks, mc_chunks], [6, 4], 500, max_overlap=max_overlap, seed=1
+    )
+
+    exams = np.hstack([open_questions, mc_questions + 100])
+    assert all(len(set(row)) == 10 for row in exams.tolist())
+    assert _max_shared(exams) <= max_overlap
+
+
+def test_assemble_exams_fails_when_the_limit_cant_be_met():
+    with pytest.raises(ValueError):
+        assemble_exams([_chunks(12, 3)], [6], 50, max_overlap=0, seed=1)
+    with pytest.raises(ValueError):
+        assemble_exams([_chunks(5, 2)], [6], 2)
+
+
+def test_overlapping_exams_counts_previous_exams():
+    exams = np.array([[0, 1, 2], [0, 1, 3], [4, 5, 6], [0, 2, 6], [1, 2, 3]])
+
+    assert _overlapping_exams(exams, 7, 1).tolist() == [1, 3, 4]
+    assert _overlapping_exams(exams, 7, 2).tolist() == []
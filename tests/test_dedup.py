@@ -0,0 +1,47 @@
+from src.dedup import DuplicateIndex, cluster_duplicates
+
+QUESTIONS = [
+    "What is the main function of chlorophyll in plants?",
+    "What is the main function of the chlorophyll in plants?",
+    "Which organelle contains the genetic material of the cell?",
+    "What is the main function of chlorophyll in the plants?",
+    "How many chromosomes does a human body cell have?",
+]
+
+
+def test_cluster_duplicates_labels_rewordings_with_the_first_one():
+    labels = cluster_duplicates(QUESTIONS)
+
+    assert labels.tolist() == [0, 0, 2, 0, 4]
+    assert cluster_duplicates([]).tolist() == []
+
+
+def test_duplicate_index_keeps_one_question_of_each_cluster():
+    index = DuplicateIndex()
+
+    assert index.add(QUESTIONS) == [0, 2, 4]
+    assert index.texts == [QUESTIONS[0], QUESTIONS[2], QUESTIONS[4]]
+
+
+def test_duplicate_index_compares_with_the_questions_kept_before():
+    index = DuplicateIndex()
+    index.add(QUESTIONS[:3])
+
+    kept = index.add(
+        [
+            "How many chromosomes does a human body cell have?",
+            "What is the main function of chlorophyll in the plants?",
+            "What gas do animals need for respiration?",
+        ]
+    )
+
+    assert kept == [0, 2]
+    assert len(index) == 4
+
+
+def test_duplicate_index_stops_at_the_limit():
+    index = DuplicateIndex()
+
+    assert index.add(QUESTIONS, limit=2) == [0, 2]
+    assert len(index) == 2
+    assert index.add(QUESTIONS[4:], limit=0) == []
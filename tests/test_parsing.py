@@ -0,0 +1,135 @@
+import json
+
+from src.parsing import (_complete_items, parse_mc_response,
+                         validate_mc_question)
+
+QUESTIONS = [
+    {
+        "question": "What do plants release as a product of photosynthesis?",
+        "answers": ["Carbon dioxide", "Nitrogen", "Oxygen", "Methane"],
+        "correct_answers": [2],
+    },
+    {
+        "question": "Which molecule carries energy within the cell?",
+        "answers": ["DNA", "Glucose", "ATP", "Water"],
+        "correct_answers": [2],
+    },
+]
+
+
+def _parsed(result) -> list:
+    return [
+        {
+            "question": question.question,
+            "answers": question.answers,
+            "correct_answers": question.correct_answers,
+        }
+        for question in result.questions
+    ]
+
+
+def test_validate_mc_question_accepts_positions():
+    question = validate_mc_question(QUESTIONS[0])
+
+    assert question.question == QUESTIONS[0]["question"]
+    assert question.answers == QUESTIONS[0]["answers"]
+    assert question.correct_answers == [2]
+
+
+def test_validate_mc_question_accepts_letters_texts_and_marks():
+    item = {
+        "question": "1. Which molecule carries energy within the cell?",
+        "answers": ["a) DNA", "b) Glucose", "c) Correct: ATP", "d) Water"],
+        "correct_answer": "Glucose",
+    }
+
+    question = validate_mc_question(item)
+
+    assert question.question == "Which molecule carries energy within the cell?"
+    assert question.answers == ["DNA", "Glucose", "ATP", "Water"]
+    assert question.correct_answers == [1, 2]
+    item = {**QUESTIONS[1], "correct_answers": ["C"]}
+    assert validate_mc_question(item).correct_answers == [2]
+
+
+def test_validate_mc_question_rejects_invalid_items():
+    assert validate_mc_question("What is ATP?") is None
+    assert validate_mc_question({**QUESTIONS[0], "question": " "}) is None
+    assert validate_mc_question({**QUESTIONS[0], "answers": ["Oxygen"]}) is None
+    assert validate_mc_question({**QUESTIONS[0], "answers": ["Oxygen", ""]}) is None
+    assert validate_mc_question({**QUESTIONS[0], "correct_answers": []}) is None
+    assert validate_mc_question({**QUESTIONS[0], "correct_answers": [7]}) is None
+
+
+def test_complete_items_keeps_the_items_before_the_cut():
+    arguments = json.dumps({"questions": QUESTIONS})
+    cut = arguments[: arguments.rfind('{"question"') + 40]
+
+    assert _complete_items(cut) == QUESTIONS[:1]
+    assert _complete_items('{"questions": [') == []
+    assert _complete_items("1. What is ATP?") is None
+
+
+def test_parse_mc_response_function_call():
+    result = parse_mc_response(json.dumps({"questions": QUESTIONS}))
+
+    assert result.method == "function"
+    assert _parsed(result) == QUESTIONS
+    assert result.discarded == 0
+
+
+def test_parse_mc_response_counts_invalid_and_cut_items():
+    arguments = json.dumps({"questions": [QUESTIONS[0], {"question": "What?"}]})
+    result = parse_mc_response(arguments)
+    assert len(result.questions) == 1
+    assert result.discarded == 1
+
+    arguments = json.dumps({"questions": QUESTIONS})
+    result = parse_mc_response(arguments[: arguments.rfind('{"question"') + 40])
+    assert _parsed(result) == QUESTIONS[:1]
+    assert result.discarded == 1
+
+    assert parse_mc_response('"questions"').discarded == 1
+
+
+def test_parse_mc_response_fenced_json():
+    arguments = "```json\n" + json.dumps({"questions": QUESTIONS}, indent=2) + "\n```"
+
+    assert _parsed(parse_mc_response(arguments)) == QUESTIONS
+
+
+def test_parse_mc_response_text():
+    text = (
+        "Here is the exam based on the text:\n\n"
+        "1. What do plants release as a product of photosynthesis?\n"
+        "a) Carbon dioxide\nb) Nitrogen\nc) Correct: Oxygen\nd) Methane\n\n"
+        "Question 2: Which molecule carries energy within the cell?\n"
+        "A. DNA\nB. Glucose\nC. ATP\nD. Water\nCorrect answer: C"
+    )
+
+    result = parse_mc_response(text, 4)
+
+    assert result.method == "text"
+    assert _parsed(result) == QUESTIONS
+
+
+def test_parse_mc_response_text_ignores_closing_remarks():
+    text = (
+        "1. What do plants release as a product of photosynthesis?\n"
+        "a) Carbon dioxide\nb) Nitrogen\nc) Oxygen (Correct)\nd) Methane\n\n"
+        "I hope these questions help your students!"
+    )
+
+    assert _parsed(parse_mc_response(text, 4)) == QUESTIONS[:1]
+
+
+def test_parse_mc_response_text_limits_unlettered_choices():
+    text = (
+        "How many sides does a triangle have?\n3 (Correct)\n4\n5\n"
+        "Let me know if you need more questions."
+    )
+
+    result = parse_mc_response(text, 3)
+
+    assert result.questions[0].answers == ["3", "4", "5"]
+    assert result.questions[0].correct_answers == [0]
@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+from langchain.schema import HumanMessage
+from openai.error import RateLimitError
+
+from src.fake_llm import FakeChatModel
+from src.scheduler import LLMScheduler, TokenBucket
+
+
+def _send(model: FakeChatModel, prompt: str = "Create 2 different questions"):
+    return lambda: model.generate([[HumanMessage(content=prompt)]])
+
+
+def test_token_bucket_allows_bursts_up_to_its_capacity():
+    bucket = TokenBucket(60)
+
+    assert bucket.reserve(60) == 0
+    # One unit per second once the burst is used
+    assert bucket.reserve(2) == pytest.approx(2, abs=0.1)
+
+
+def test_token_bucket_takes_back_the_units_given_back():
+    bucket = TokenBucket(60)
+    bucket.reserve(60)
+
+    bucket.adjust(-30)
+
+    assert bucket.reserve(30) == 0
+
+
+def test_backoff_grows_exponentially_up_to_the_maximum_delay():
+    scheduler = LLMScheduler(0, 0, base_delay=1, max_delay=5)
+    error = RateLimitError("Rate limit")
+
+    for retries, limit in ((0, 1), (1, 2), (2, 4), (3, 5), (10, 5)):
+        delays = [scheduler._backoff(retries, error) for _ in range(50)]
+        assert all(0 <= delay <= limit for delay in delays)
+
+
+def test_backoff_waits_at_least_what_the_api_asks_for():
+    scheduler = LLMScheduler(0, 0, base_delay=1, max_delay=5)
+    error = RateLimitError("Rate limit", headers={"retry-after": "20"})
+
+    assert scheduler._backoff(0, error) >= 20
+
+
+def test_failed_requests_are_retried_and_their_tokens_given_back():
+    scheduler = LLMScheduler(0, 600, base_delay=0)
+    model = FakeChatModel()
+    send = _send(model)
+    attempts = []
+
+    def fail_once():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RateLimitError("Rate limit")
+        return send()
+
+    call = scheduler.run("key", fail_once, estimated_tokens=100)
+
+    assert call.retries == 1
+    assert call.value.generations[0][0].message.content
+    # Only the attempt that succeeded holds its tokens
+    assert scheduler.tokens.reserve(500) == 0
+
+
+def test_requests_that_keep_failing_raise_after_the_last_retry():
+    scheduler = LLMScheduler(0, 600, max_retries=2, base_delay=0)
+    model = FakeChatModel(error_rate=1.0)
+
+    with pytest.raises(RateLimitError):
+        scheduler.run("key", _send(model), estimated_tokens=100)
+
+    assert sum(model._calls.values()) == 3
+    assert scheduler.tokens.reserve(600) == 0
+
+
+def test_identical_requests_in_flight_are_sent_once():
+    scheduler = LLMScheduler(0, 0)
+    model = FakeChatModel(latency=0.2)
+    calls = []
+
+    def run():
+        calls.append(scheduler.run("key", _send(model)))
+
+    leader = threading.Thread(target=run)
+    leader.start()
+    while "key" not in scheduler._in_flight:
+        pass
+    follower = threading.Thread(target=run)
+    follower.start()
+    leader.join()
+    follower.join()
+
+    assert sum(model._calls.values()) == 1
+    assert sorted(call.shared for call in calls) == [False, True]
+    assert calls[0].value is calls[1].value
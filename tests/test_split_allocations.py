@@ -0,0 +1,27 @@
+from src.exams_api import _split_allocations
+
+
+def test_split_allocations_keeps_the_proportion_in_every_chunk():
+    split = _split_allocations({0: 4, 1: 4, 2: 4}, 6)
+
+    assert split == {0: (2, 2), 1: (2, 2), 2: (2, 2)}
+
+
+def test_split_allocations_only_asks_for_one_type_when_the_other_is_not_needed():
+    split = _split_allocations({0: 3, 1: 3, 2: 4}, 10, max_questions_per_type=4)
+
+    assert split == {0: (3, 0), 1: (3, 0), 2: (4, 0)}
+
+
+def test_split_allocations_gives_what_does_not_fit_to_other_chunks():
+    split = _split_allocations({0: 1, 1: 1, 2: 8}, 5, max_questions_per_type=3)
+
+    assert split == {0: (1, 2), 1: (1, 0), 2: (3, 3)}
+    assert sum(number_of_open for number_of_open, _ in split.values()) == 5
+    assert sum(number_of_mc for _, number_of_mc in split.values()) == 5
+
+
+def test_split_allocations_leaves_what_does_not_fit_in_any_chunk():
+    split = _split_allocations({0: 12}, 6, max_questions_per_type=5)
+
+    assert split == {0: (5, 5)}